@@ -3,13 +3,53 @@ import os
 import logging
 from logging.handlers import RotatingFileHandler
 
-def create_app():
+def _optional_number(value):
+    return int(value) if value else None
+
+def create_app(test_config=None):
     app = Flask(__name__)
     
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    # Per request, so it bounds a whole multi-file batch
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB default
+    # Worker processes for multi-file uploads; 0 or 1 processes batches in the request thread.
+    # Every app process has its own pool, so by default the cores are split between them: under
+    # gunicorn's default of cores + 1 workers each one processes its batches in the request thread
+    app_processes = int(os.environ.get('GUNICORN_WORKERS') or 1)
+    app.config['UPLOAD_WORKERS'] = int(os.environ.get(
+        'UPLOAD_WORKERS', max(1, min(4, (os.cpu_count() or 1) // app_processes))))
+    
+    # Opt-in profiling (see app/utils/profiling.py); off unless enabled or a signed header is sent
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+    app.config['PROFILING_SECRET'] = os.environ.get('PROFILING_SECRET')
+    app.config['PROFILE_FOLDER'] = os.environ.get('PROFILE_FOLDER', os.path.join(app.instance_path, 'profiles'))
+    # Where each worker publishes its metrics so /api/metrics reports all of them (see app/utils/metrics.py)
+    app.config['METRICS_FOLDER'] = os.environ.get('METRICS_FOLDER', os.path.join(app.instance_path, 'metrics'))
+    
+    # Retention quotas for the upload folder (see app/utils/retention.py); off and unset unless configured,
+    # so analyses are kept until someone deletes them or runs a cleanup
+    app.config['RETENTION_ENABLED'] = os.environ.get('RETENTION_ENABLED', '').lower() in ('1', 'true', 'yes')
+    app.config['RETENTION_INTERVAL'] = int(os.environ.get('RETENTION_INTERVAL', 3600))  # seconds
+    app.config['RETENTION_MAX_AGE_DAYS'] = _optional_number(os.environ.get('RETENTION_MAX_AGE_DAYS'))
+    app.config['RETENTION_MAX_ANALYSES'] = _optional_number(os.environ.get('RETENTION_MAX_ANALYSES'))
+    app.config['RETENTION_MAX_BYTES'] = _optional_number(os.environ.get('RETENTION_MAX_BYTES'))
+    
+    # Drop directory ingested in the background (see app/utils/watcher.py); empty disables it
+    app.config['WATCH_FOLDER'] = os.environ.get('WATCH_FOLDER') or None
+    app.config['WATCH_INTERVAL'] = float(os.environ.get('WATCH_INTERVAL', 1.0))  # seconds between scans
+    app.config['WATCH_SETTLE'] = float(os.environ.get('WATCH_SETTLE', 2.0))  # seconds a file must stay unchanged
+    
+    # Live updates of open analysis pages (see app/utils/live.py); each stream holds a server thread,
+    # so by default all but one of a gunicorn worker's threads may stream. Refused pages poll instead
+    threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+    app.config['LIVE_MAX_STREAMS'] = int(os.environ.get('LIVE_MAX_STREAMS', max(1, threads - 1)))  # per process
+    app.config['LIVE_STREAM_SECONDS'] = int(os.environ.get('LIVE_STREAM_SECONDS', 300))
+    
+    # Overrides for tests and benchmarks, applied before anything below reads the config
+    if test_config:
+        app.config.update(test_config)
     
     # Ensure upload folder exists
     try:
@@ -38,7 +78,7 @@ def create_app():
     # Register error handlers
     @app.errorhandler(413)
     def too_large(e):
-        return "File is too large. Maximum file size is 16MB.", 413
+        return f"Upload is too large. Maximum request size is {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)}MB.", 413
     
     @app.errorhandler(404)
     def not_found(e):
@@ -53,8 +93,57 @@ def create_app():
     from app.routes import main
     app.register_blueprint(main)
     
+    # Background retention; started per process on the first request so it survives forking
+    from app.models import AnalysisStorage
+    from app.utils.retention import RetentionPolicy, RetentionScheduler
+    app.extensions['retention'] = RetentionScheduler(
+        lambda: AnalysisStorage(app.config['UPLOAD_FOLDER']),
+        RetentionPolicy.from_config(app.config),
+        # Disabled, the thread only runs the cleanups requested from the history page
+        app.config['RETENTION_INTERVAL'] if app.config['RETENTION_ENABLED'] else None,
+        app.logger
+    )
+    
+    # Batch uploads; worker processes start on the first multi-file upload
+    from app.utils.pipeline import UploadPool
+    app.extensions['upload_pool'] = UploadPool(app.config['UPLOAD_WORKERS'])
+    
+    # Server-Sent Events streams for open analysis pages
+    from app.utils.live import StreamSlots
+    app.extensions['live_streams'] = StreamSlots(app.config['LIVE_MAX_STREAMS'])
+    
+    # Drop directory ingestion; like retention, started per process and run by one of them
+    if app.config['WATCH_FOLDER']:
+        from app.routes import ALLOWED_EXTENSIONS
+        from app.utils.watcher import DirectoryWatcher
+        os.makedirs(app.config['WATCH_FOLDER'], exist_ok=True)
+        app.extensions['watcher'] = DirectoryWatcher(
+            lambda: AnalysisStorage(app.config['UPLOAD_FOLDER']),
+            app.config['WATCH_FOLDER'],
+            ALLOWED_EXTENSIONS,
+            app.config['WATCH_INTERVAL'],
+            app.config['WATCH_SETTLE'],
+            app.logger
+        )
+    
+    # Tests keep the process-local registry
+    from app.utils.metrics import REGISTRY
+    if not app.testing:
+        REGISTRY.share(app.config['METRICS_FOLDER'])
+    
+    @app.before_request
+    def start_background_threads():
+        if not app.testing:
+            REGISTRY.ensure_flushing()
+        if app.config['RETENTION_ENABLED'] and not app.testing:
+            app.extensions['retention'].ensure_started()
+        if 'watcher' in app.extensions and not app.testing:
+            app.extensions['watcher'].ensure_started()
+    
     # Log configuration
     app.logger.info(f'Upload folder: {app.config["UPLOAD_FOLDER"]}')
     app.logger.info(f'Max file size: {app.config["MAX_CONTENT_LENGTH"]} bytes')
+    if app.config['WATCH_FOLDER']:
+        app.logger.info(f'Watch folder: {app.config["WATCH_FOLDER"]}')
     
     return app
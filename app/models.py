@@ -1,11 +1,26 @@
 import json
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+from app.utils.retention import (RetentionPolicy, analysis_artifacts, enforce_retention, is_analysis_id,
+                                 remove_files)
+from app.utils.search_index import SearchIndex
+
+class MetadataUnreadable(Exception):
+    """The metadata file exists but cannot be parsed; nothing may be rewritten or deleted from it"""
 
 class AnalysisMetadata:
     def __init__(self, analysis_id: str, original_filename: str, creation_date: str, 
-                 data_points: int, variables: int, time_period: str, status: str = "completed"):
+                 data_points: int, variables: int, time_period: str, status: str = "completed",
+                 header: Optional[Dict] = None):
         self.analysis_id = analysis_id
         self.original_filename = original_filename
         self.creation_date = creation_date
@@ -13,6 +28,7 @@ class AnalysisMetadata:
         self.variables = variables
         self.time_period = time_period
         self.status = status
+        self.header = header or {}
         self.html_filename = f"analysis_{analysis_id}.html"
     
     def to_dict(self) -> Dict:
@@ -24,7 +40,8 @@ class AnalysisMetadata:
             'variables': self.variables,
             'time_period': self.time_period,
             'status': self.status,
-            'html_filename': self.html_filename
+            'html_filename': self.html_filename,
+            'header': self.header
         }
     
     @classmethod
@@ -36,13 +53,21 @@ class AnalysisMetadata:
             data_points=data['data_points'],
             variables=data['variables'],
             time_period=data['time_period'],
-            status=data.get('status', 'completed')
+            status=data.get('status', 'completed'),
+            header=data.get('header')
         )
 
+# Analysis counts keyed by metadata file path, valid while (mtime, size) is unchanged
+_count_cache: Dict[str, tuple] = {}
+
+# Serialises metadata updates between threads; the lock file covers other processes
+_metadata_thread_lock = threading.RLock()
+
 class AnalysisStorage:
     def __init__(self, storage_path: str):
         self.storage_path = storage_path
         self.metadata_file = os.path.join(storage_path, 'analyses_metadata.json')
+        self.index = SearchIndex(storage_path)
         self._ensure_storage_exists()
     
     def _ensure_storage_exists(self):
@@ -50,33 +75,131 @@ class AnalysisStorage:
         if not os.path.exists(self.metadata_file):
             self._save_metadata([])
     
-    def _load_metadata(self) -> List[Dict]:
+    def _load_metadata(self, strict: bool = False) -> List[Dict]:
+        """The metadata list; unreadable metadata reads as empty, or raises MetadataUnreadable with strict"""
         try:
             with open(self.metadata_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+        except FileNotFoundError:
+            return []
+        except json.JSONDecodeError as e:
+            # Pages show no analyses, but writers and retention must not act on an empty list
+            if strict:
+                raise MetadataUnreadable(f'{self.metadata_file}: {str(e)}') from e
             return []
     
-    def _save_metadata(self, metadata_list: List[Dict]):
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
+    def _save_metadata(self, metadata_list: List[Dict], changed: Tuple[str, ...] = ()):
+        # Replaced in one step, so a crash mid-write never leaves a torn file behind
+        tmp_path = f"{self.metadata_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(metadata_list, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.metadata_file)
+        # Callers hold metadata_lock, so the index cannot miss a concurrent write
+        self.index.sync(metadata_list, self._metadata_stamp(), changed)
+    
+    def _metadata_stamp(self) -> str:
+        try:
+            stat = os.stat(self.metadata_file)
+        except FileNotFoundError:
+            return ''
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+    
+    @contextmanager
+    def _file_lock(self, name: str, blocking: bool = True):
+        with open(os.path.join(self.storage_path, name), 'a') as lock_file:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    @contextmanager
+    def metadata_lock(self):
+        """Hold while reading and rewriting the metadata list"""
+        with _metadata_thread_lock, self._file_lock('.metadata.lock'):
+            yield
+    
+    def retention_lock(self, blocking: bool = True):
+        """Yields False when another process is already running retention"""
+        return self._file_lock('.retention.lock', blocking)
+    
+    def append_lock(self, analysis_id: str):
+        """Hold while appending rows to one analysis"""
+        return self._file_lock(f'.append_{analysis_id}.lock')
+    
+    def watcher_lock(self, blocking: bool = True):
+        """Yields False when another process is already watching the drop directory"""
+        return self._file_lock('.watcher.lock', blocking)
     
     def save_analysis(self, metadata: AnalysisMetadata) -> bool:
         try:
-            metadata_list = self._load_metadata()
-            metadata_list.append(metadata.to_dict())
-            # Keep only last 50 analyses to prevent unlimited growth
-            metadata_list = metadata_list[-50:]
-            self._save_metadata(metadata_list)
+            # Growth is bounded by the retention scheduler (app/utils/retention.py),
+            # which deletes the data files together with the metadata entries
+            with self.metadata_lock():
+                metadata_list = self._load_metadata(strict=True)
+                metadata_list.append(metadata.to_dict())
+                self._save_metadata(metadata_list)
             return True
         except Exception as e:
             print(f"Error saving analysis metadata: {e}")
             return False
     
+    def update_analysis(self, metadata: AnalysisMetadata) -> bool:
+        """Replace the stored entry of an existing analysis; False if it no longer exists"""
+        with self.metadata_lock():
+            metadata_list = self._load_metadata(strict=True)
+            for i, data in enumerate(metadata_list):
+                if data['analysis_id'] == metadata.analysis_id:
+                    metadata_list[i] = metadata.to_dict()
+                    self._save_metadata(metadata_list, changed=(metadata.analysis_id,))
+                    return True
+        return False
+    
     def get_all_analyses(self) -> List[AnalysisMetadata]:
         metadata_list = self._load_metadata()
         return [AnalysisMetadata.from_dict(data) for data in reversed(metadata_list)]
     
+    def count_analyses(self) -> int:
+        """Number of stored analyses; re-reads the metadata only after it changes"""
+        try:
+            stat = os.stat(self.metadata_file)
+        except FileNotFoundError:
+            return 0
+        
+        cached = _count_cache.get(self.metadata_file)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        
+        count = len(self._load_metadata())
+        _count_cache[self.metadata_file] = (stat.st_mtime_ns, stat.st_size, count)
+        return count
+    
+    def search_analyses(self, text: Optional[str] = None, filters: Optional[Dict] = None, year: Optional[int] = None,
+                        start: Optional[str] = None, end: Optional[str] = None,
+                        limit: int = 100, offset: int = 0) -> Tuple[List[AnalysisMetadata], int]:
+        """Analyses matching header text, attribute filters and period, newest first, plus the match count"""
+        self._refresh_index()
+        entries, total = self.index.search(text, filters, year, start, end, limit, offset)
+        return [AnalysisMetadata.from_dict(data) for data in entries], total
+    
+    def header_facets(self, field: str) -> List[Tuple[str, int]]:
+        self._refresh_index()
+        return self.index.facets(field)
+    
+    def _refresh_index(self):
+        """Re-sync the index if the metadata changed behind its back (older releases, manual edits)"""
+        if self.index.stamp() == self._metadata_stamp():
+            return
+        with self.metadata_lock():
+            self.index.sync(self._load_metadata(), self._metadata_stamp())
+    
     def get_analysis(self, analysis_id: str) -> Optional[AnalysisMetadata]:
         metadata_list = self._load_metadata()
         for data in metadata_list:
@@ -85,16 +208,19 @@ class AnalysisStorage:
         return None
     
     def delete_analysis(self, analysis_id: str) -> bool:
+        """Remove a stored analysis and its files; False for an id that is malformed or not stored"""
+        if not is_analysis_id(analysis_id):
+            return False
         try:
-            metadata_list = self._load_metadata()
-            metadata_list = [data for data in metadata_list if data['analysis_id'] != analysis_id]
-            self._save_metadata(metadata_list)
+            with self.metadata_lock():
+                metadata_list = self._load_metadata(strict=True)
+                remaining = [data for data in metadata_list if data['analysis_id'] != analysis_id]
+                if len(remaining) == len(metadata_list):
+                    return False
+                self._save_metadata(remaining)
             
-            # Delete HTML file
-            html_filename = f"analysis_{analysis_id}.html"
-            html_path = os.path.join(self.storage_path, html_filename)
-            if os.path.exists(html_path):
-                os.remove(html_path)
+            # Delete every artifact (data JSON, HTML, leftover upload)
+            remove_files(analysis_artifacts(self.storage_path, analysis_id))
             
             return True
         except Exception as e:
@@ -102,26 +228,10 @@ class AnalysisStorage:
             return False
     
     def cleanup_old_analyses(self, days: int = 7):
-        """Remove analyses older than specified days"""
+        """Remove analyses older than specified days, including all their files"""
         try:
-            from datetime import datetime, timedelta
-            cutoff_date = datetime.now() - timedelta(days=days)
-            
-            metadata_list = self._load_metadata()
-            new_metadata_list = []
-            
-            for data in metadata_list:
-                creation_date = datetime.fromisoformat(data['creation_date'])
-                if creation_date > cutoff_date:
-                    new_metadata_list.append(data)
-                else:
-                    # Delete old HTML file
-                    html_path = os.path.join(self.storage_path, data['html_filename'])
-                    if os.path.exists(html_path):
-                        os.remove(html_path)
-            
-            self._save_metadata(new_metadata_list)
-            return len(metadata_list) - len(new_metadata_list)
+            report = enforce_retention(self, RetentionPolicy(max_age_days=days))
+            return report['removed_analyses']
         except Exception as e:
             print(f"Error during cleanup: {e}")
             return 0
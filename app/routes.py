@@ -1,18 +1,18 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file, current_app, Response, g, abort, send_from_directory
 import os
-import pandas as pd
 from werkzeug.utils import secure_filename
-from app.utils.ebas_parser import parse_ebas_file, create_time_labels
-from app.utils.chart_generator import generate_charts_data
 from app.utils.config import CHART_CONFIG
 from app.models import AnalysisMetadata, AnalysisStorage
-from datetime import datetime
+from app.utils.metrics import REGISTRY, observe_record, timed_stage, timing_record
+from app.utils.pipeline import process_upload, store_analysis
+from app.utils.profiling import profiled, signed_request, list_profiles, PROFILE_SUFFIXES
+from app.utils.retention import RetentionPolicy, is_analysis_id, read_status
 import uuid
-import json
 
 main = Blueprint('main', __name__)
 
 ALLOWED_EXTENSIONS = {'nas', 'txt', 'csv'}
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600  # seconds
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -20,147 +20,200 @@ def allowed_file(filename):
 def get_analysis_storage():
     return AnalysisStorage(current_app.config['UPLOAD_FOLDER'])
 
-def determine_time_period(df):
-    """Determine the time period covered by the data"""
-    try:
-        if 'datetime' in df.columns and not df['datetime'].isna().all():
-            start_time = df['datetime'].min()
-            end_time = df['datetime'].max()
-            if pd.notna(start_time) and pd.notna(end_time):
-                return f"{start_time.strftime('%Y-%m-%d %H:%M')} to {end_time.strftime('%Y-%m-%d %H:%M')}"
-        
-        # Fallback to row count
-        return f"{len(df)} time points"
-    except Exception:
-        return f"{len(df)} data points"
-
 @main.route('/')
 def index():
     return render_template('index.html')
 
+def search_arguments(args):
+    """Search keyword arguments from query parameters; raises ValueError on malformed values"""
+    from app.utils.search_index import ATTRIBUTE_FIELDS
+    
+    year = args.get('year', '').strip()
+    return {
+        'text': args.get('q', '').strip() or None,
+        'filters': {field: args.get(field, '').strip() for field in ATTRIBUTE_FIELDS if args.get(field, '').strip()},
+        'year': int(year) if year else None,
+        'start': args.get('start', '').strip() or None,
+        'end': args.get('end', '').strip() or None,
+    }
+
 @main.route('/history')
 def analysis_history():
+    search = {'q': request.args.get('q', ''), 'station_code': request.args.get('station_code', ''),
+              'instrument_type': request.args.get('instrument_type', ''), 'year': request.args.get('year', '')}
+    facets = {}
     try:
         storage = get_analysis_storage()
-        analyses = storage.get_all_analyses()
-        return render_template('history.html', analyses=analyses)
+        facets = {field: storage.header_facets(field) for field in ('station_code', 'instrument_type')}
+        if any(value.strip() for value in search.values()):
+            analyses, total = storage.search_analyses(limit=500, **search_arguments(request.args))
+        else:
+            analyses = storage.get_all_analyses()
+            total = len(analyses)
+        thumbnails = history_thumbnails(analyses)
+        return render_template('history.html', analyses=analyses, total=total, search=search, facets=facets,
+                               thumbnails=thumbnails, chart_config=CHART_CONFIG)
     except Exception as e:
         flash(f'Error loading analysis history: {str(e)}')
         current_app.logger.error(f'History loading error: {str(e)}')
-        return render_template('history.html', analyses=[])
+        return render_template('history.html', analyses=[], total=0, search=search, facets=facets,
+                               thumbnails={}, chart_config=CHART_CONFIG)
+
+def history_thumbnails(analyses):
+    """Analysis id -> (heatmap chart id or None, line chart id or None) of the previews to show"""
+    from app.utils.thumbnails import THUMBNAIL_CHARTS, available_thumbnails
+    
+    thumbnails = {}
+    for analysis in analyses:
+        # Analyses stored before previews existed get theirs drawn on first request
+        available = available_thumbnails(current_app.config['UPLOAD_FOLDER'], analysis.analysis_id) or THUMBNAIL_CHARTS[:1]
+        heatmap = next((chart_id for chart_id in available if CHART_CONFIG[chart_id]['type'] == 'heatmap'), None)
+        line = next((chart_id for chart_id in available if CHART_CONFIG[chart_id]['type'] == 'line'), None)
+        thumbnails[analysis.analysis_id] = (heatmap, line)
+    return thumbnails
+
+@main.route('/thumbnail/<analysis_id>/<chart_id>.png')
+def analysis_thumbnail(analysis_id, chart_id):
+    """Preview PNG; the URL carries the row count, so a cached copy never needs revalidating"""
+    from app.utils.thumbnails import THUMBNAIL_CHARTS, render_thumbnails, thumbnail_path
+    
+    if chart_id not in THUMBNAIL_CHARTS or get_analysis_storage().get_analysis(analysis_id) is None:
+        abort(404)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    path = thumbnail_path(upload_folder, analysis_id, chart_id)
+    if not os.path.exists(path):
+        try:
+            render_thumbnails(upload_folder, analysis_id)
+        except Exception as e:
+            current_app.logger.error(f'Thumbnail error: {str(e)}')
+        if not os.path.exists(path):
+            abort(404)
+    
+    response = send_file(path, mimetype='image/png', max_age=THUMBNAIL_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={THUMBNAIL_MAX_AGE}, immutable'
+    return response
 
 @main.route('/upload', methods=['POST'])
+@profiled
 def upload_file():
-    if 'file' not in request.files:
+    files = [file for file in request.files.getlist('file') if file.filename]
+    if not files:
         flash('No file selected')
-        return redirect(request.url)
+        return redirect(url_for('main.index'))
     
-    file = request.files['file']
-    if file.filename == '':
-        flash('No file selected')
-        return redirect(request.url)
+    accepted = [file for file in files if allowed_file(file.filename)]
+    skipped = [secure_filename(file.filename) or file.filename for file in files if not allowed_file(file.filename)]
+    if not accepted:
+        flash('Invalid file type. Please upload .nas, .txt, or .csv files')
+        return redirect(url_for('main.index'))
     
-    if file and allowed_file(file.filename):
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    jobs = []
+    for file in accepted:
+        # Generate unique filename
+        unique_id = str(uuid.uuid4())
+        filename = secure_filename(file.filename)
+        file_path = os.path.join(upload_folder, f"{unique_id}_{filename}")
         try:
-            # Generate unique filename
-            unique_id = str(uuid.uuid4())
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{unique_id}_{filename}")
-            file.save(file_path)
-            
-            # Process the file
-            df = parse_ebas_file(file_path)
-            
-            if df is None or df.empty:
-                flash('Error: Could not parse the file or file is empty')
-                return redirect(url_for('main.index'))
-            
-            # Generate charts data
-            time_labels = create_time_labels(df)
-            charts_data = generate_charts_data(df, unique_id)
+            with timed_stage('upload_save') as stage:
+                file.save(file_path)
+                stage['bytes'] = os.path.getsize(file_path)
+        except OSError as e:
+            for saved_path, _, _, _ in jobs:
+                os.remove(saved_path)
+            flash(f'Error saving uploaded file: {str(e)}')
+            current_app.logger.error(f'Upload save error: {str(e)}')
+            return redirect(url_for('main.index'))
+        jobs.append((file_path, unique_id, filename, upload_folder))
+    
+    if len(jobs) == 1 and not skipped:
+        return upload_single(jobs[0])
+    
+    # Files are independent, so a batch runs on the worker pool; one bad file only fails itself
+    pool = current_app.extensions['upload_pool']
+    if pool.workers > 1:
+        results = pool.map(jobs)
+        for result in results:
+            if result['timing']:
+                observe_record(result['timing'], current_app.logger)
+    else:
+        results = [process_upload(*job, log=current_app.logger) for job in jobs]
+    
+    for result in results:
+        if result['outcome'] != 'completed':
+            current_app.logger.error(f"File processing error ({result['filename']}): {result['error']}")
+    
+    analyses = [AnalysisMetadata.from_dict(result['metadata']) for result in results if result['metadata']]
+    failures = [result for result in results if not result['metadata']]
+    failures.extend({'filename': filename, 'error': 'Invalid file type', 'outcome': 'rejected'} for filename in skipped)
+    return render_template('batch_results.html', analyses=analyses, failures=failures)
+
+def upload_single(job):
+    """One file keeps the original flow: processed in the request, summary page on success"""
+    file_path, unique_id, filename, _ = job
+    g.analysis_id = unique_id
+    result = process_upload(*job, log=current_app.logger)
+    
+    if result['outcome'] == 'rejected':
+        flash(f"Error: {result['error']}")
+        return redirect(url_for('main.index'))
+    if result['outcome'] != 'completed':
+        flash(f"Error processing file: {result['error']}")
+        current_app.logger.error(f"File processing error: {result['error']}")
+        return redirect(url_for('main.index'))
+    
+    metadata = result['metadata']
+    return render_template('results.html', 
+                         unique_id=unique_id,
+                         rows=metadata['data_points'],
+                         columns=metadata['variables'],
+                         time_period=metadata['time_period'],
+                         original_filename=filename)
+
+@main.route('/analysis/<analysis_id>')
+@profiled
+def view_analysis(analysis_id):
+    with timing_record('view', log=current_app.logger, analysis_id=analysis_id) as record:
+        try:
+            storage = get_analysis_storage()
+            metadata = storage.get_analysis(analysis_id)
             
-            # Save processed data as JSON for the analysis view
-            analysis_data = {
-                'df_data': df.to_json(orient='records'),
-                'time_labels': time_labels,
-                'charts_data': charts_data,
-                'metadata': {
-                    'rows': len(df),
-                    'columns': len(df.columns),
-                    'time_period': determine_time_period(df),
-                    'original_filename': filename
-                }
-            }
+            if not metadata:
+                record['outcome'] = 'not_found'
+                flash('Analysis not found')
+                return redirect(url_for('main.analysis_history'))
             
-            data_filename = f"data_{unique_id}.json"
+            # Load analysis data
+            data_filename = f"data_{analysis_id}.json"
             data_path = os.path.join(current_app.config['UPLOAD_FOLDER'], data_filename)
             
-            with open(data_path, 'w', encoding='utf-8') as f:
-                json.dump(analysis_data, f, ensure_ascii=False, indent=2)
+            if not os.path.exists(data_path):
+                record['outcome'] = 'not_found'
+                flash('Analysis data not found')
+                return redirect(url_for('main.analysis_history'))
             
-            # Save analysis metadata
-            time_period = determine_time_period(df)
-            metadata = AnalysisMetadata(
-                analysis_id=unique_id,
-                original_filename=filename,
-                creation_date=datetime.now().isoformat(),
-                data_points=len(df),
-                variables=len(df.columns),
-                time_period=time_period,
-                status="completed"
-            )
+            from app.utils.append import load_analysis_data
+            with timed_stage('storage_read') as stage:
+                # Joined with the rows appended since the file was first uploaded
+                analysis_data = load_analysis_data(current_app.config['UPLOAD_FOLDER'], analysis_id)
+                stage['bytes'] = os.path.getsize(data_path)
+                stage['rows'] = analysis_data.get('metadata', {}).get('rows')
             
-            storage = get_analysis_storage()
-            storage.save_analysis(metadata)
-            
-            # Clean up uploaded file
-            os.remove(file_path)
-            
-            return render_template('results.html', 
-                                 unique_id=unique_id,
-                                 rows=len(df),
-                                 columns=len(df.columns),
-                                 time_period=time_period,
-                                 original_filename=filename)
+            from app.utils.append import stored_rows
+            with timed_stage('render') as stage:
+                html = render_template('analysis.html',
+                                     analysis_id=analysis_id,
+                                     metadata=metadata,
+                                     analysis_data=analysis_data,
+                                     live_updates=stored_rows(current_app.config['UPLOAD_FOLDER'], analysis_id) is not None)
+                stage['bytes'] = len(html)
+            return html
             
         except Exception as e:
-            flash(f'Error processing file: {str(e)}')
-            current_app.logger.error(f'File processing error: {str(e)}')
-            return redirect(url_for('main.index'))
-    
-    flash('Invalid file type. Please upload .nas, .txt, or .csv files')
-    return redirect(url_for('main.index'))
-
-@main.route('/analysis/<analysis_id>')
-def view_analysis(analysis_id):
-    try:
-        storage = get_analysis_storage()
-        metadata = storage.get_analysis(analysis_id)
-        
-        if not metadata:
-            flash('Analysis not found')
+            record['outcome'] = 'failed'
+            flash(f'Error viewing analysis: {str(e)}')
+            current_app.logger.error(f'View analysis error: {str(e)}')
             return redirect(url_for('main.analysis_history'))
-        
-        # Load analysis data
-        data_filename = f"data_{analysis_id}.json"
-        data_path = os.path.join(current_app.config['UPLOAD_FOLDER'], data_filename)
-        
-        if not os.path.exists(data_path):
-            flash('Analysis data not found')
-            return redirect(url_for('main.analysis_history'))
-        
-        with open(data_path, 'r', encoding='utf-8') as f:
-            analysis_data = json.load(f)
-        
-        return render_template('analysis.html',
-                             analysis_id=analysis_id,
-                             metadata=metadata,
-                             analysis_data=analysis_data)
-        
-    except Exception as e:
-        flash(f'Error viewing analysis: {str(e)}')
-        current_app.logger.error(f'View analysis error: {str(e)}')
-        return redirect(url_for('main.analysis_history'))
 
 @main.route('/download/<analysis_id>')
 def download_analysis(analysis_id):
@@ -173,11 +226,8 @@ def download_analysis(analysis_id):
             return redirect(url_for('main.analysis_history'))
         
         # Generate standalone HTML file for download
-        data_filename = f"data_{analysis_id}.json"
-        data_path = os.path.join(current_app.config['UPLOAD_FOLDER'], data_filename)
-        
-        with open(data_path, 'r', encoding='utf-8') as f:
-            analysis_data = json.load(f)
+        from app.utils.append import load_analysis_data
+        analysis_data = load_analysis_data(current_app.config['UPLOAD_FOLDER'], analysis_id)
         
         # Render the analysis template for download
         html_content = render_template('analysis_standalone.html',
@@ -200,18 +250,98 @@ def download_analysis(analysis_id):
         current_app.logger.error(f'Download error: {str(e)}')
         return redirect(url_for('main.analysis_history'))
 
+@main.route('/merge', methods=['POST'])
+@profiled
+def merge_analyses():
+    analysis_ids = list(dict.fromkeys(request.form.getlist('analysis_ids')))
+    overlap = request.form.get('overlap', 'last')
+    if len(analysis_ids) < 2:
+        flash('Select at least two analyses to merge')
+        return redirect(url_for('main.analysis_history'))
+    
+    from app.utils.column_store import DATETIME_COLUMN, load_columns
+    from app.utils.merge import incomparable_sources, merge_tables, time_anchor
+    import pandas as pd
+    
+    unique_id = str(uuid.uuid4())
+    g.analysis_id = unique_id
+    with timing_record('merge', log=current_app.logger, analysis_id=unique_id, sources=analysis_ids) as record:
+        try:
+            storage = get_analysis_storage()
+            sources = [storage.get_analysis(analysis_id) for analysis_id in analysis_ids]
+            if any(source is None for source in sources):
+                record['outcome'] = 'not_found'
+                flash('One or more selected analyses no longer exist')
+                return redirect(url_for('main.analysis_history'))
+            
+            reason = incomparable_sources(sources)
+            if reason:
+                record['outcome'] = 'rejected'
+                flash(reason)
+                return redirect(url_for('main.analysis_history'))
+            
+            # Priority follows upload time, not selection order, so the result is reproducible
+            sources.sort(key=lambda source: (source.creation_date, source.analysis_id))
+            tables = []
+            try:
+                with timed_stage('merge_read') as stage:
+                    for source in sources:
+                        tables.append(load_columns(current_app.config['UPLOAD_FOLDER'], source.analysis_id))
+                    stage['rows'] = sum(len(table) for table in tables)
+                with timed_stage('merge') as stage:
+                    columns, source_rows = merge_tables(tables, overlap)
+                    stage['rows'] = len(columns[DATETIME_COLUMN])
+            finally:
+                for table in tables:
+                    table.close()
+            
+            if not len(columns[DATETIME_COLUMN]):
+                record['outcome'] = 'rejected'
+                flash('The selected analyses have no timestamped rows to merge')
+                return redirect(url_for('main.analysis_history'))
+            
+            # Same column layout as parse_ebas_file: values first, datetime last
+            times = columns.pop(DATETIME_COLUMN)
+            df = pd.DataFrame(columns)
+            df[DATETIME_COLUMN] = pd.to_datetime(times, unit='ns')
+            # Header fields all sources agree on still describe the merged data
+            shared = {key: value for key, value in sources[0].header.items()
+                      if key not in ('period_start', 'period_end', 'reference_date', 'startdate')
+                      and all(source.header.get(key) == value for source in sources[1:])}
+            shared['time_anchor'] = time_anchor(sources[0].header)
+            starts = [source.header['period_start'] for source in sources if source.header.get('period_start')]
+            ends = [source.header['period_end'] for source in sources if source.header.get('period_end')]
+            if starts and ends:
+                shared['period_start'], shared['period_end'] = min(starts), max(ends)
+            df.attrs['header'] = shared
+            
+            filename = 'Merged: ' + ' + '.join(source.original_filename for source in sources)
+            merge_info = {
+                'overlap': overlap,
+                'sources': [dict(rows, analysis_id=source.analysis_id, original_filename=source.original_filename)
+                            for source, rows in zip(sources, source_rows)]
+            }
+            store_analysis(df, unique_id, filename, current_app.config['UPLOAD_FOLDER'],
+                           status="merged", extra_metadata={'merge': merge_info})
+            
+            return redirect(url_for('main.view_analysis', analysis_id=unique_id))
+            
+        except Exception as e:
+            record['outcome'] = 'failed'
+            flash(f'Error merging analyses: {str(e)}')
+            current_app.logger.error(f'Merge error: {str(e)}')
+            return redirect(url_for('main.analysis_history'))
+
 @main.route('/delete/<analysis_id>', methods=['POST'])
 def delete_analysis(analysis_id):
     try:
         storage = get_analysis_storage()
+        # Only a stored analysis' exact id selects files to delete
+        if not is_analysis_id(analysis_id) or storage.get_analysis(analysis_id) is None:
+            flash('Analysis not found', 'error')
+            return redirect(url_for('main.analysis_history'))
         success = storage.delete_analysis(analysis_id)
         
-        # Also delete data file
-        data_filename = f"data_{analysis_id}.json"
-        data_path = os.path.join(current_app.config['UPLOAD_FOLDER'], data_filename)
-        if os.path.exists(data_path):
-            os.remove(data_path)
-        
         if success:
             flash('Analysis deleted successfully', 'success')
         else:
@@ -227,10 +357,10 @@ def delete_analysis(analysis_id):
 def cleanup_old_analyses():
     try:
         days = int(request.form.get('days', 7))
-        storage = get_analysis_storage()
-        deleted_count = storage.cleanup_old_analyses(days)
+        # Runs on the retention thread; results show up in /api/status
+        current_app.extensions['retention'].trigger(RetentionPolicy(max_age_days=days))
         
-        flash(f'Cleaned up {deleted_count} old analyses', 'success')
+        flash(f'Cleanup of analyses older than {days} days started', 'success')
     except Exception as e:
         flash(f'Error during cleanup: {str(e)}', 'error')
         current_app.logger.error(f'Cleanup error: {str(e)}')
@@ -241,16 +371,287 @@ def cleanup_old_analyses():
 def api_status():
     try:
         storage = get_analysis_storage()
-        analyses = storage.get_all_analyses()
         return jsonify({
             'status': 'healthy',
             'charts_available': len(CHART_CONFIG),
             'supported_formats': list(ALLOWED_EXTENSIONS),
             'upload_folder': current_app.config['UPLOAD_FOLDER'],
-            'total_analyses': len(analyses)
+            'total_analyses': storage.count_analyses(),
+            'retention': read_status(current_app.config['UPLOAD_FOLDER'])
         })
     except Exception as e:
         return jsonify({
             'status': 'error',
             'error': str(e)
         }), 500
+
+@main.route('/api/analyses/search')
+def search_analyses():
+    try:
+        arguments = search_arguments(request.args)
+        limit = int(request.args.get('limit', 100))
+        offset = int(request.args.get('offset', 0))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid search parameter: {str(e)}'}), 400
+    
+    try:
+        storage = get_analysis_storage()
+        analyses, total = storage.search_analyses(limit=limit, offset=offset, **arguments)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Search error: {str(e)}')
+        return jsonify({'error': 'Search failed'}), 500
+    
+    return jsonify({
+        'total': total,
+        'offset': offset,
+        'results': [analysis.to_dict() for analysis in analyses]
+    })
+
+@main.route('/api/analysis/<analysis_id>/append', methods=['POST'])
+def append_analysis(analysis_id):
+    from app.utils.append import append_file
+    
+    file = request.files.get('file')
+    if file is None or not file.filename:
+        return jsonify({'error': 'No file selected'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type. Please upload .nas, .txt, or .csv files'}), 400
+    
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    if get_analysis_storage().get_analysis(analysis_id) is None:
+        return jsonify({'error': 'Analysis not found'}), 404
+    
+    # Named after the analysis, so retention reclaims it with the analysis if the request dies
+    file_path = os.path.join(upload_folder, f"{analysis_id}_{uuid.uuid4().hex}_{secure_filename(file.filename)}")
+    try:
+        with timed_stage('upload_save') as stage:
+            file.save(file_path)
+            stage['bytes'] = os.path.getsize(file_path)
+        result = append_file(file_path, analysis_id, upload_folder, log=current_app.logger)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    
+    if result['outcome'] == 'failed':
+        current_app.logger.error(f"Append error: {result['error']}")
+    status = {'not_found': 404, 'conflict': 409, 'failed': 500}.get(result['outcome'], 200)
+    return jsonify({key: result[key] for key in
+                    ('analysis_id', 'outcome', 'appended_rows', 'rows', 'compacted', 'error')}), status
+
+@main.route('/api/analysis/<analysis_id>/events')
+def analysis_events(analysis_id):
+    """Server-Sent Events announcing rows appended to an analysis, for its open page"""
+    from app.utils.append import stored_rows
+    from app.utils.live import event_stream
+    
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    if get_analysis_storage().get_analysis(analysis_id) is None:
+        return jsonify({'error': 'Analysis not found'}), 404
+    if stored_rows(upload_folder, analysis_id) is None:
+        # Not stored from a single file, so it never grows; 204 tells EventSource not to reconnect
+        return '', 204
+    try:
+        # A reconnecting EventSource sends the row count of the last event it saw
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'since must be a row count'}), 400
+    
+    lifetime = current_app.config['LIVE_STREAM_SECONDS']
+    slots = current_app.extensions['live_streams']
+    if not slots.acquire():
+        return jsonify({'error': 'Too many live streams open; retry later'}), 503, {'Retry-After': '30'}
+    
+    def stream():
+        try:
+            yield from event_stream(upload_folder, analysis_id, since, lifetime)
+        finally:
+            slots.release()
+    
+    # The generator outlives the request context; everything it needs is bound above
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream(), content_type='text/event-stream', headers=headers)
+
+@main.route('/api/analysis/<analysis_id>/updates')
+def analysis_updates(analysis_id):
+    """Chart data, time labels and statistics of the rows from ?since= on"""
+    from app.utils.append import load_updates
+    
+    with timing_record('updates', log=current_app.logger, analysis_id=analysis_id) as record:
+        try:
+            since = int(request.args.get('since', 0))
+            if since < 0:
+                raise ValueError
+        except ValueError:
+            record['outcome'] = 'rejected'
+            return jsonify({'error': 'since must be a non-negative row count'}), 400
+        
+        with timed_stage('storage_read') as stage:
+            parts = load_updates(current_app.config['UPLOAD_FOLDER'], analysis_id, since)
+            if parts is None or get_analysis_storage().get_analysis(analysis_id) is None:
+                record['outcome'] = 'not_found'
+                return jsonify({'error': 'Analysis not found'}), 404
+            stage['rows'] = sum(part['rows'] for part in parts)
+        
+        return jsonify({
+            'analysis_id': analysis_id,
+            'since': since,
+            'rows': parts[-1]['first_row'] + parts[-1]['rows'] if parts else since,
+            'time_period': parts[-1]['metadata']['time_period'] if parts else None,
+            'parts': parts
+        })
+
+@main.route('/api/analysis/<analysis_id>/resample')
+def resample_analysis(analysis_id):
+    from app.utils.column_store import load_columns
+    from app.utils import resample
+    
+    with timing_record('resample', log=current_app.logger, analysis_id=analysis_id) as record:
+        storage = get_analysis_storage()
+        if storage.get_analysis(analysis_id) is None:
+            record['outcome'] = 'not_found'
+            return jsonify({'error': 'Analysis not found'}), 404
+        
+        output = request.args.get('format', 'json').lower()
+        if output not in ('json', 'csv', 'parquet'):
+            record['outcome'] = 'rejected'
+            return jsonify({'error': 'format must be json, csv or parquet'}), 400
+        
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        with load_columns(upload_folder, analysis_id) as table:
+            try:
+                freq_ns = resample.parse_freq(request.args.get('freq', '1h'))
+                aggregates = resample.parse_aggregates(request.args.get('agg'))
+                families = [f for f in request.args.get('family', '').split(',') if f] or None
+                columns = resample.select_columns(table.columns, families)
+                valid_only = request.args.get('valid', '').lower() in ('1', 'true', 'yes')
+                
+                path = resample.cache_path(upload_folder, analysis_id, freq_ns, aggregates, columns, valid_only)
+                record['cache'] = 'hit' if os.path.exists(path) else 'miss'
+                if record['cache'] == 'hit':
+                    with timed_stage('resample_cache_read'):
+                        bucket_starts, rows_per_bucket, result = resample.load_result(path, aggregates)
+                else:
+                    with timed_stage('resample') as stage:
+                        bucket_starts, rows_per_bucket, result = resample.resample_table(
+                            table, freq_ns, aggregates, columns, valid_only)
+                        stage['rows'] = len(table)
+                    resample.save_result(path, bucket_starts, rows_per_bucket, result, columns)
+            except ValueError as e:
+                record['outcome'] = 'rejected'
+                return jsonify({'error': str(e)}), 400
+        
+        download_name = f"{analysis_id}_{request.args.get('freq', '1h')}"
+        if output == 'csv':
+            return Response(resample.iter_csv(bucket_starts, rows_per_bucket, result, columns),
+                            content_type='text/csv; charset=utf-8',
+                            headers={'Content-Disposition': f'attachment; filename="{download_name}.csv"'})
+        
+        if output == 'parquet':
+            from io import BytesIO
+            try:
+                buffer = BytesIO()
+                resample.to_frame(bucket_starts, rows_per_bucket, result, columns).to_parquet(buffer, index=False)
+            except ImportError:
+                record['outcome'] = 'rejected'
+                return jsonify({'error': 'Parquet output requires pyarrow to be installed'}), 501
+            buffer.seek(0)
+            return send_file(buffer, mimetype='application/vnd.apache.parquet',
+                             as_attachment=True, download_name=f"{download_name}.parquet")
+        
+        return jsonify({
+            'analysis_id': analysis_id,
+            'freq': request.args.get('freq', '1h'),
+            'aggregates': aggregates,
+            'valid_only': valid_only,
+            'columns': columns,
+            **resample.chart_payload(bucket_starts, rows_per_bucket, result, columns)
+        })
+
+@main.route('/api/analysis/<analysis_id>/export')
+def export_analysis(analysis_id):
+    from app.utils.column_store import load_columns
+    from app.utils import export
+    
+    with timing_record('export', log=current_app.logger, analysis_id=analysis_id) as record:
+        storage = get_analysis_storage()
+        metadata = storage.get_analysis(analysis_id)
+        if metadata is None:
+            record['outcome'] = 'not_found'
+            return jsonify({'error': 'Analysis not found'}), 404
+        
+        output = request.args.get('format', 'csv').lower()
+        record['format'] = output
+        if output not in export.EXPORT_FORMATS:
+            record['outcome'] = 'rejected'
+            return jsonify({'error': f"format must be one of {', '.join(export.EXPORT_FORMATS)}"}), 400
+        if output == 'parquet' and not export.parquet_available():
+            record['outcome'] = 'rejected'
+            return jsonify({'error': 'Parquet output requires pyarrow to be installed'}), 501
+        
+        table = load_columns(current_app.config['UPLOAD_FOLDER'], analysis_id)
+        try:
+            families = [f for f in request.args.get('family', '').split(',') if f] or None
+            columns = export.export_columns(table, families)
+            start = export.parse_time(request.args.get('start'))
+            end = export.parse_time(request.args.get('end'))
+            valid_only = request.args.get('valid', '').lower() in ('1', 'true', 'yes')
+        except ValueError as e:
+            table.close()
+            record['outcome'] = 'rejected'
+            return jsonify({'error': str(e)}), 400
+        
+        content_type, extension = export.EXPORT_FORMATS[output]
+        headers = {'Content-Disposition': f'attachment; filename="{analysis_id}.{extension}"'}
+        if output == 'csv':
+            chunks = export.iter_csv(table, columns, start, end, valid_only)
+        elif output == 'parquet':
+            chunks = export.iter_parquet(table, columns, start, end, valid_only)
+        else:
+            # The record count is known up front, so clients get a real Content-Length
+            attributes = {'title': metadata.original_filename, 'analysis_id': analysis_id,
+                          'source': 'EBAS NASA Ames', 'Conventions': 'CF-1.8',
+                          **{key: str(value) for key, value in metadata.header.items()}}
+            with timed_stage('export_count') as stage:
+                n_records = export.count_rows(table, start, end)
+                stage['rows'] = n_records
+            headers['Content-Length'] = str(export.netcdf_size(columns, n_records, attributes))
+            chunks = export.iter_netcdf(table, columns, start, end, valid_only, attributes, n_records)
+        record['columns'] = len(columns)
+    
+    def stream():
+        # Runs after the view returns, one chunk per write
+        sent = 0
+        with timed_stage('export_stream') as stage:
+            for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+            stage['bytes'] = sent
+    
+    response = Response(stream(), content_type=content_type, headers=headers)
+    # The table's mappings stay open until the response is closed: after the last chunk, or
+    # on a disconnect, including one before streaming started, which skips the generator's cleanup
+    response.call_on_close(table.close)
+    return response
+
+@main.route('/api/metrics')
+def api_metrics():
+    return Response(REGISTRY.render_prometheus(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@main.route('/admin/profiles')
+def admin_profiles():
+    # Profiles show code paths and analysis ids: a signed header is required even with profiling enabled
+    if not signed_request():
+        abort(404)
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'profiles': list_profiles(current_app.config['PROFILE_FOLDER'], limit)
+    })
+
+@main.route('/admin/profiles/<path:filename>')
+def download_profile(filename):
+    if not signed_request() or not filename.endswith(PROFILE_SUFFIXES):
+        abort(404)
+    return send_from_directory(current_app.config['PROFILE_FOLDER'], filename, as_attachment=True)
@@ -7,7 +7,8 @@ let totalPoints = 0;
 let currentTimeRange = [0, -1];
 let lastTimeRange = [0, -1]; // ADDED: Track last range to avoid unnecessary updates
 let rangeSlider = null;
-let isUpdating = false; // ADDED: Prevent concurrent updates
+let pendingTimeRange = null; // Latest requested range, applied on the next animation frame
+let frameRequested = false;
 
 // Simple but effective grid for large, aligned charts
 const ALIGNED_GRID = {
@@ -18,6 +19,54 @@ const ALIGNED_GRID = {
     containLabel: false
 };
 
+// Colour scales shared by the ECharts visualMap and the raster renderer
+const COLOUR_SCALES = {
+    grafana_style: [
+        '#0d0887', '#2d1e8f', '#4a0da6', '#6a00a8', '#8b0aa5',
+        '#a9179c', '#c42e88', '#dc4869', '#f0624a', '#fc8023',
+        '#fd9a44', '#feb078', '#fdc7a4', '#fcfdbf'
+    ],
+    standard: ['#313695', '#4575b4', '#74add1', '#abd9e9', '#e0f3f8',
+               '#ffffcc', '#fee090', '#fdae61', '#f46d43', '#d73027', '#a50026']
+};
+
+// PERFORMANCE: Heatmaps with more cells than this are drawn as a single image
+const HEATMAP_RASTER_THRESHOLD = 200000;
+const RASTER_LUT_SIZE = 256;
+const RASTER_TILE_WIDTH = 4096; // Browsers cap canvas width, so wide rasters are tiled
+let heatmapRasters = {};
+let heatmapIndexes = {};
+
+// PERFORMANCE: Charts are built when their container scrolls into view
+const CHART_VIEWPORT_MARGIN = '300px 0px';
+const MAX_OFFSCREEN_CHARTS = 3; // Off-screen charts kept alive before the oldest is disposed
+const HEAP_PRESSURE_RATIO = 0.7; // Dispose every off-screen chart above this JS heap usage
+let chartObserver = null;
+let visibleCharts = new Set();
+let staleCharts = new Set(); // Off-screen charts that missed a time range or resize update
+let chartLastSeen = {};
+
+// PERFORMANCE: Per-cell work (raster colouring, window statistics) runs in a Web Worker
+const WORKER_SCRIPT_URL = document.currentScript
+    ? document.currentScript.src.replace(/analysis\.js(\?.*)?$/, 'analysis_worker.js')
+    : null;
+let analysisWorker = null;
+let workerRequests = {};
+let workerRequestId = 0;
+let workerCharts = new Set(); // Charts whose buffers have been transferred to the worker
+
+// Quality filter: hide values whose EBAS flags mark them invalid (see app/utils/quality.py)
+let validOnly = false;
+
+// Live updates: rows appended on the server are announced over Server-Sent Events (see app/utils/live.py)
+const LIVE_RETRY_DELAY = 30000; // ms before reopening a stream the server refused
+const LIVE_POLL_INTERVAL = 10000; // ms between update requests while the stream is refused
+let livePollTimer = null;
+let liveSource = null;
+let loadedRows = 0;
+let liveRequest = null; // In-flight fetch of new rows; events arriving meanwhile only raise liveTargetRows
+let liveTargetRows = 0;
+
 // Debug function
 function debugLog(message) {
     console.log('[Analysis Debug]:', message);
@@ -81,10 +130,13 @@ function runDiagnostics() {
         timeLabels: timeLabels.length + ' labels loaded',
         chartsData: Object.keys(chartsData).length + ' chart configurations',
         chartsInitialized: Object.keys(charts).length + ' charts created',
+        chartsVisible: visibleCharts.size + ' charts in view',
+        dataWorker: analysisWorker ? `Running ✓ (${workerCharts.size} charts loaded)` : 'Main thread fallback',
         currentTimeRange: `${currentTimeRange[0]} to ${currentTimeRange[1]}`,
         lastTimeRange: `${lastTimeRange[0]} to ${lastTimeRange[1]}`,
         rangeSlider: rangeSlider ? 'Initialized ✓' : 'Not initialized ✗',
         performanceOptimization: 'Range change detection ✓',
+        rasterHeatmaps: Object.keys(heatmapRasters).length + ' charts drawn as images',
         browserInfo: navigator.userAgent.substring(0, 50) + '...'
     };
     
@@ -142,7 +194,8 @@ function initializeAnalysisPage() {
         chartsData = JSON.parse(chartDataElement.textContent);
         originalChartsData = JSON.parse(JSON.stringify(chartsData));
         timeLabels = JSON.parse(timeLabelsElement.textContent);
-        totalPoints = timeLabels.length;
+        // The stored row count, not the label count, bounds the time axis
+        totalPoints = parseInt(timeLabelsElement.dataset.rows, 10) || timeLabels.length;
         currentTimeRange = [0, totalPoints - 1];
         lastTimeRange = [0, totalPoints - 1]; // Initialize last range
         
@@ -160,6 +213,8 @@ function initializeAnalysisPage() {
             throw new Error('ECharts library not loaded. Required for data visualization.');
         }
         
+        initializeWorker();
+        
         try {
             initializeCharts();
             debugLog('Charts initialized');
@@ -180,6 +235,7 @@ function initializeAnalysisPage() {
         
         setupButtons();
         setupGlobalResize();
+        initializeLiveUpdates();
         
         debugLog('Initialization complete!');
         
@@ -190,6 +246,99 @@ function initializeAnalysisPage() {
     }
 }
 
+function initializeWorker() {
+    if (typeof Worker === 'undefined' || !WORKER_SCRIPT_URL) {
+        debugLog('Web Workers unavailable; processing on the main thread');
+        return;
+    }
+    
+    try {
+        analysisWorker = new Worker(WORKER_SCRIPT_URL);
+        analysisWorker.onmessage = function(event) {
+            const reply = event.data;
+            const pending = workerRequests[reply.id];
+            if (!pending) return;
+            
+            delete workerRequests[reply.id];
+            if (reply.error) {
+                pending.reject(new Error(reply.error));
+            } else {
+                pending.resolve(reply.result);
+            }
+        };
+        analysisWorker.onerror = function(event) {
+            console.error('Analysis worker failed:', event.message);
+            shutdownWorker(new Error('Analysis worker failed'));
+        };
+    } catch (error) {
+        console.warn('Could not start analysis worker:', error);
+        analysisWorker = null;
+    }
+}
+
+function shutdownWorker(reason) {
+    if (analysisWorker) {
+        analysisWorker.terminate();
+    }
+    analysisWorker = null;
+    workerCharts.clear();
+    
+    for (const pending of Object.values(workerRequests)) {
+        pending.reject(reason);
+    }
+    workerRequests = {};
+}
+
+function workerRequest(type, payload, transfer) {
+    return new Promise(function(resolve, reject) {
+        if (!analysisWorker) {
+            reject(new Error('Analysis worker not available'));
+            return;
+        }
+        
+        const id = ++workerRequestId;
+        workerRequests[id] = { resolve: resolve, reject: reject };
+        analysisWorker.postMessage(Object.assign({ id: id, type: type }, payload), transfer || []);
+    });
+}
+
+// Transfer a chart's values to the worker once; later queries only send indices
+function ensureWorkerBuffers(chartId, chartInfo, matrix) {
+    if (workerCharts.has(chartId)) {
+        return Promise.resolve(true);
+    }
+    
+    let request;
+    if (chartInfo.config.type === 'heatmap') {
+        matrix = matrix || packHeatmapMatrix(chartInfo);
+        request = workerRequest('loadMatrix', {
+            chartId: chartId,
+            nTimes: matrix.nTimes,
+            nCols: matrix.nCols,
+            values: matrix.values.buffer,
+            validBits: getValidBits(chartInfo)
+        }, [matrix.values.buffer]);
+    } else {
+        const series = Object.values(chartInfo.data.y_data).map(values => Float32Array.from(values).buffer);
+        request = workerRequest('loadSeries', {
+            chartId: chartId,
+            length: chartInfo.data.x_data.length,
+            series: series,
+            validBits: getValidBits(chartInfo)
+        }, series);
+    }
+    
+    workerCharts.add(chartId);
+    return request;
+}
+
+function releaseWorkerBuffers(chartId) {
+    if (!workerCharts.has(chartId)) return;
+    
+    workerCharts.delete(chartId);
+    workerRequest('release', { chartId: chartId }).catch(() => {});
+}
+
 function initializeAdvancedSlider() {
     try {
         debugLog('Setting up timeline slider...');
@@ -227,25 +376,22 @@ function initializeAdvancedSlider() {
             onStart: function(data) {
                 // Always update display immediately
                 updateTimeDisplay(data.from, data.to);
-                // PERFORMANCE: Only update charts if range actually changed
-                if (hasRangeChanged(data.from, data.to)) {
-                    updateAllChartsWithTimeRange(data.from, data.to);
-                }
+                scheduleTimeRangeUpdate(data.from, data.to);
             },
             onChange: function(data) {
                 // Always update display for immediate feedback
                 updateTimeDisplay(data.from, data.to);
-                // But don't update charts during dragging for better performance
+                // PERFORMANCE: Drag bursts collapse into one update per frame
+                scheduleTimeRangeUpdate(data.from, data.to);
             },
             onFinish: function(data) {
-                // Update display
                 updateTimeDisplay(data.from, data.to);
-                // PERFORMANCE: Only update charts if range actually changed
-                if (hasRangeChanged(data.from, data.to)) {
-                    updateAllChartsWithTimeRange(data.from, data.to);
-                } else {
-                    debugLog('Range unchanged, skipping chart update');
-                }
+                scheduleTimeRangeUpdate(data.from, data.to);
+            },
+            onUpdate: function(data) {
+                // Fired by the Reset/Zoom/Move buttons
+                updateTimeDisplay(data.from, data.to);
+                scheduleTimeRangeUpdate(data.from, data.to);
             }
         });
         
@@ -282,10 +428,7 @@ function createFallbackSlider() {
         const end = parseInt(document.getElementById('fallback-end').value) || totalPoints-1;
         updateTimeDisplay(start, end);
         
-        // PERFORMANCE: Check if range changed before updating
-        if (hasRangeChanged(start, end)) {
-            updateAllChartsWithTimeRange(start, end);
-        }
+        scheduleTimeRangeUpdate(start, end);
     });
     
     debugLog('Fallback slider created');
@@ -328,21 +471,29 @@ function updateTimeDisplay(startIdx, endIdx) {
     }
 }
 
+// PERFORMANCE: Coalesce range requests so at most one chart update runs per frame
+function scheduleTimeRangeUpdate(startIdx, endIdx) {
+    pendingTimeRange = [startIdx, endIdx];
+    if (frameRequested) return;
+    
+    frameRequested = true;
+    window.requestAnimationFrame(function() {
+        frameRequested = false;
+        const range = pendingTimeRange;
+        pendingTimeRange = null;
+        if (range) {
+            updateAllChartsWithTimeRange(range[0], range[1]);
+        }
+    });
+}
+
 // PERFORMANCE OPTIMIZED: Only update charts when range actually changes
 function updateAllChartsWithTimeRange(startIdx, endIdx) {
-    // Prevent concurrent updates
-    if (isUpdating) {
-        debugLog('Update already in progress, skipping');
-        return;
-    }
-    
     // Check if range actually changed
     if (!hasRangeChanged(startIdx, endIdx)) {
-        debugLog('Range unchanged, skipping update');
         return;
     }
     
-    isUpdating = true;
     currentTimeRange = [startIdx, endIdx];
     lastTimeRange = [startIdx, endIdx]; // Update last range
     
@@ -351,12 +502,18 @@ function updateAllChartsWithTimeRange(startIdx, endIdx) {
         
         for (const [chartId, chartInfo] of Object.entries(chartsData)) {
             const chart = charts[chartId];
-            if (chart && chartInfo) {
-                if (chartInfo.config.type === 'heatmap') {
-                    createHeatmapChart(chart, chartId, chartInfo);
+            if (chart && !visibleCharts.has(chartId)) {
+                // Frozen: caught up when it scrolls back into view
+                staleCharts.add(chartId);
+            } else if (chart && chartInfo) {
+                if (heatmapRasters[chartId]) {
+                    updateRasterHeatmapWindow(chartId, startIdx, endIdx);
+                    updatedCharts++;
+                } else if (chartInfo.config.type === 'heatmap') {
+                    updateHeatmapWindow(chartId, chartInfo, startIdx, endIdx);
                     updatedCharts++;
                 } else if (chartInfo.config.type === 'line') {
-                    createLineChart(chart, chartId, chartInfo);
+                    updateLineWindow(chartId, chartInfo, startIdx, endIdx);
                     updatedCharts++;
                 }
             }
@@ -367,8 +524,6 @@ function updateAllChartsWithTimeRange(startIdx, endIdx) {
     } catch (error) {
         console.error('Error updating charts:', error);
         debugLog('Chart update failed');
-    } finally {
-        isUpdating = false;
     }
 }
 
@@ -388,10 +543,7 @@ function setupButtons() {
                 if (startInput) startInput.value = 0;
                 if (endInput) endInput.value = totalPoints - 1;
                 updateTimeDisplay(0, totalPoints - 1);
-                
-                if (hasRangeChanged(0, totalPoints - 1)) {
-                    updateAllChartsWithTimeRange(0, totalPoints - 1);
-                }
+                scheduleTimeRangeUpdate(0, totalPoints - 1);
             }
         });
     }
@@ -455,84 +607,178 @@ function setupButtons() {
 }
 
 // Rest of the functions remain the same as in the previous version...
-// (initializeCharts, setupGlobalResize, debounce, filterDataByTimeRange, 
+// (initializeCharts, setupGlobalResize, debounce, getHeatmapIndex,
 //  createHeatmapChart, createLineChart, updateChartRange, resetChartRange, etc.)
 
 function initializeCharts() {
     debugLog('Initializing charts...');
     
-    let chartsInitialized = 0;
-    
-    for (const [chartId, chartInfo] of Object.entries(chartsData)) {
-        try {
-            const element = document.getElementById(chartId);
-            if (!element) {
-                console.warn(`Chart element not found: ${chartId}`);
-                continue;
+    if (typeof IntersectionObserver === 'undefined') {
+        // Older browsers: build everything up front as before
+        let chartsInitialized = 0;
+        for (const chartId of Object.keys(chartsData)) {
+            if (createChart(chartId)) {
+                visibleCharts.add(chartId);
+                chartsInitialized++;
             }
+        }
+        debugLog(`Initialized ${chartsInitialized} charts`);
+        return;
+    }
+    
+    chartObserver = new IntersectionObserver(handleChartVisibility, {
+        root: null,
+        rootMargin: CHART_VIEWPORT_MARGIN,
+        threshold: 0
+    });
+    
+    let chartsObserved = 0;
+    for (const chartId of Object.keys(chartsData)) {
+        const element = document.getElementById(chartId);
+        if (!element) {
+            console.warn(`Chart element not found: ${chartId}`);
+            continue;
+        }
+        chartObserver.observe(element);
+        chartsObserved++;
+    }
+    
+    debugLog(`Observing ${chartsObserved} charts for lazy initialization`);
+}
+
+function createChart(chartId) {
+    const chartInfo = chartsData[chartId];
+    
+    try {
+        const element = document.getElementById(chartId);
+        if (!element || !chartInfo) {
+            console.warn(`Chart element not found: ${chartId}`);
+            return false;
+        }
+        
+        debugLog(`Creating chart: ${chartId}`);
+        
+        element.innerHTML = '';
+        
+        element.style.width = '100%';
+        element.style.height = '500px';
+        element.style.minHeight = '500px';
+        element.style.display = 'block';
+        
+        const chart = echarts.init(element, null, {
+            renderer: 'canvas',
+            width: element.offsetWidth,
+            height: 500
+        });
+        
+        charts[chartId] = chart;
+        
+        if (chartInfo.config.type === 'heatmap') {
+            createHeatmapChart(chart, chartId, chartInfo);
+        } else if (chartInfo.config.type === 'line') {
+            createLineChart(chart, chartId, chartInfo);
+        }
+        
+        return true;
+        
+    } catch (error) {
+        console.error(`Error creating chart ${chartId}:`, error);
+        return false;
+    }
+}
+
+function handleChartVisibility(entries) {
+    for (const entry of entries) {
+        const chartId = entry.target.id;
+        
+        if (entry.isIntersecting) {
+            visibleCharts.add(chartId);
+            chartLastSeen[chartId] = Date.now();
             
-            debugLog(`Creating chart: ${chartId}`);
-            
-            element.innerHTML = '';
-            
-            element.style.width = '100%';
-            element.style.height = '500px';
-            element.style.minHeight = '500px';
-            element.style.display = 'block';
-            
-            const chart = echarts.init(element, null, {
-                renderer: 'canvas',
-                width: element.offsetWidth,
-                height: 500
-            });
-            
-            charts[chartId] = chart;
-            
-            if (chartInfo.config.type === 'heatmap') {
-                createHeatmapChart(chart, chartId, chartInfo);
-            } else if (chartInfo.config.type === 'line') {
-                createLineChart(chart, chartId, chartInfo);
+            if (!charts[chartId]) {
+                createChart(chartId);
+            } else if (staleCharts.has(chartId)) {
+                refreshChart(chartId);
             }
-            
-            chartsInitialized++;
-            
-        } catch (error) {
-            console.error(`Error creating chart ${chartId}:`, error);
+            staleCharts.delete(chartId);
+        } else if (visibleCharts.has(chartId)) {
+            visibleCharts.delete(chartId);
+            chartLastSeen[chartId] = Date.now();
+        }
+    }
+    
+    releaseOffscreenCharts();
+}
+
+// Resize a frozen chart and bring it up to the current time range
+function refreshChart(chartId) {
+    const chart = charts[chartId];
+    const chartInfo = chartsData[chartId];
+    const element = document.getElementById(chartId);
+    if (!chart || !chartInfo || !element) return;
+    
+    try {
+        chart.resize({
+            width: element.offsetWidth,
+            height: 500
+        });
+        
+        if (chartInfo.config.type === 'heatmap') {
+            createHeatmapChart(chart, chartId, chartInfo);
+        } else if (chartInfo.config.type === 'line') {
+            createLineChart(chart, chartId, chartInfo);
         }
+    } catch (error) {
+        console.error(`Error refreshing chart ${chartId}:`, error);
+    }
+}
+
+function isUnderMemoryPressure() {
+    // performance.memory is Chromium-only; other browsers fall back to the chart count limit
+    const memory = window.performance && window.performance.memory;
+    return !!memory && memory.usedJSHeapSize / memory.jsHeapSizeLimit > HEAP_PRESSURE_RATIO;
+}
+
+// Dispose the least recently seen off-screen charts beyond the keep-alive limit
+function releaseOffscreenCharts() {
+    const offscreen = Object.keys(charts)
+        .filter(chartId => !visibleCharts.has(chartId))
+        .sort((a, b) => (chartLastSeen[a] || 0) - (chartLastSeen[b] || 0));
+    
+    const keep = isUnderMemoryPressure() ? 0 : MAX_OFFSCREEN_CHARTS;
+    const toDispose = offscreen.slice(0, Math.max(0, offscreen.length - keep));
+    
+    for (const chartId of toDispose) {
+        disposeChart(chartId);
     }
     
-    debugLog(`Initialized ${chartsInitialized} charts`);
+    if (toDispose.length) {
+        debugLog(`Released ${toDispose.length} off-screen charts`);
+    }
+}
+
+function disposeChart(chartId) {
+    const chart = charts[chartId];
+    if (chart) {
+        chart.dispose();
+    }
+    delete charts[chartId];
+    // Rasters hold the full-resolution tiles; they are rebuilt if the chart comes back
+    delete heatmapRasters[chartId];
+    releaseWorkerBuffers(chartId);
+    staleCharts.delete(chartId);
 }
 
 function setupGlobalResize() {
     const resizeHandler = debounce(() => {
         debugLog('Handling window resize...');
         
-        for (const [chartId, chartInfo] of Object.entries(chartsData)) {
-            const chart = charts[chartId];
-            const element = document.getElementById(chartId);
-            
-            if (chart && element && chartInfo) {
-                try {
-                    element.style.width = '100%';
-                    element.style.height = '500px';
-                    element.style.minHeight = '500px';
-                    element.style.display = 'block';
-                    
-                    chart.resize({
-                        width: element.offsetWidth,
-                        height: 500
-                    });
-                    
-                    if (chartInfo.config.type === 'heatmap') {
-                        createHeatmapChart(chart, chartId, chartInfo);
-                    } else if (chartInfo.config.type === 'line') {
-                        createLineChart(chart, chartId, chartInfo);
-                    }
-                    
-                } catch (error) {
-                    console.error(`Error resizing chart ${chartId}:`, error);
-                }
+        for (const chartId of Object.keys(charts)) {
+            // PERFORMANCE: Off-screen charts are resized when they scroll back in
+            if (visibleCharts.has(chartId)) {
+                refreshChart(chartId);
+            } else {
+                staleCharts.add(chartId);
             }
         }
         
@@ -557,37 +803,470 @@ function debounce(func, wait) {
     };
 }
 
-function filterDataByTimeRange(data, startIdx, endIdx, chartType) {
-    if (chartType === 'heatmap') {
-        return data.filter(point => {
-            const timeIndex = point[0];
-            return timeIndex >= startIdx && timeIndex <= endIdx;
-        }).map(point => [point[0] - startIdx, point[1], point[2]]);
-    } else if (chartType === 'line') {
-        const filteredData = {
-            x_data: data.x_data.slice(startIdx, endIdx + 1),
-            y_data: {}
-        };
+// Row offsets into the [time, column, value] list, built once per heatmap.
+// Points for time index t live in data[rowOffsets[t] .. rowOffsets[t + 1]).
+function getHeatmapIndex(chartId, chartInfo) {
+    let index = heatmapIndexes[chartId];
+    if (index) return index;
+    
+    const data = chartInfo.data;
+    let nTimes = 0;
+    let sorted = true;
+    for (let k = 0; k < data.length; k++) {
+        const t = data[k][0];
+        if (t + 1 > nTimes) nTimes = t + 1;
+        if (k > 0 && t < data[k - 1][0]) sorted = false;
+    }
+    if (!sorted) {
+        data.sort((a, b) => a[0] - b[0]);
+    }
+    
+    const rowOffsets = new Uint32Array(nTimes + 1);
+    for (const point of data) {
+        rowOffsets[point[0] + 1]++;
+    }
+    for (let t = 0; t < nTimes; t++) {
+        rowOffsets[t + 1] += rowOffsets[t];
+    }
+    
+    index = {
+        rowOffsets: rowOffsets,
+        nTimes: nTimes,
+        axisData: Array.from({length: nTimes}, (_, i) => i)
+    };
+    heatmapIndexes[chartId] = index;
+    return index;
+}
+
+// PERFORMANCE: Window lookup is two offset reads; points keep their absolute time index
+function sliceHeatmapWindow(index, data, startIdx, endIdx) {
+    const from = Math.min(Math.max(startIdx, 0), index.nTimes);
+    const to = Math.min(Math.max(endIdx + 1, from), index.nTimes);
+    return data.slice(index.rowOffsets[from], index.rowOffsets[to]);
+}
+
+// Bit-packed validity from the server, one bit per (variable, time), variable-major
+function getValidBits(chartInfo) {
+    if (!chartInfo.valid_mask) return null;
+    if (!chartInfo.validBits) {
+        chartInfo.validBits = decodeBits(chartInfo.valid_mask.bits);
+    }
+    return chartInfo.validBits;
+}
+
+function decodeBits(base64) {
+    const binary = atob(base64);
+    const bits = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bits[i] = binary.charCodeAt(i);
+    }
+    return bits;
+}
+
+function isValidValue(bits, nTimes, colIdx, timeIdx) {
+    const k = colIdx * nTimes + timeIdx;
+    return (bits[k >> 3] & (0x80 >> (k & 7))) !== 0;
+}
+
+function activeStats(chartInfo) {
+    return validOnly && chartInfo.stats_valid ? chartInfo.stats_valid : chartInfo.stats;
+}
+
+// Window of [time, column, value] points, dropping flagged cells when the filter is on
+function visibleHeatmapPoints(chartInfo, points) {
+    const bits = validOnly ? getValidBits(chartInfo) : null;
+    if (!bits) return points;
+    const nTimes = chartInfo.valid_mask.rows;
+    return points.filter(point => isValidValue(bits, nTimes, point[1], point[0]));
+}
+
+// Line series with flagged points as gaps; built once per chart and reused
+function visibleLineData(chartInfo) {
+    const bits = validOnly ? getValidBits(chartInfo) : null;
+    if (!bits) return chartInfo.data.y_data;
+    if (!chartInfo.validYData) {
+        const nTimes = chartInfo.valid_mask.rows;
+        chartInfo.validYData = {};
+        chartInfo.columns.forEach((colName, j) => {
+            const values = chartInfo.data.y_data[colName] || [];
+            chartInfo.validYData[colName] = values.map((value, t) => isValidValue(bits, nTimes, j, t) ? value : null);
+        });
+    }
+    return chartInfo.validYData;
+}
+
+function setValidOnly(enabled) {
+    validOnly = enabled;
+    
+    for (const [chartId, chartInfo] of Object.entries(chartsData)) {
+        if (!chartInfo.valid_mask) continue;
         
-        for (const [key, values] of Object.entries(data.y_data)) {
-            filteredData.y_data[key] = values.slice(startIdx, endIdx + 1);
+        // Follow the filtered statistics unless the user picked a scale
+        if (!chartInfo.userRange && chartInfo.config.show_controls) {
+            const stats = activeStats(chartInfo);
+            const minInput = document.getElementById(`min-${chartId}`);
+            const maxInput = document.getElementById(`max-${chartId}`);
+            if (minInput && chartInfo.config.default_min == null && stats.p5 != null) minInput.value = stats.p5.toFixed(2);
+            if (maxInput && chartInfo.config.default_max == null && stats.p95 != null) maxInput.value = stats.p95.toFixed(2);
         }
         
-        return filteredData;
+        if (!charts[chartId]) continue;
+        const raster = heatmapRasters[chartId];
+        if (raster) {
+            paintHeatmap(chartId, raster, ...getHeatmapRange(chartInfo));
+        }
+        if (visibleCharts.has(chartId)) {
+            refreshChart(chartId);
+        } else {
+            staleCharts.add(chartId);
+        }
     }
     
-    return data;
+    debugLog(validOnly ? 'Showing valid data only' : 'Showing all data');
+}
+
+function getColourScale(config) {
+    return config.colour_scale === 'grafana_style' ? COLOUR_SCALES.grafana_style : COLOUR_SCALES.standard;
+}
+
+function getHeatmapRange(chartInfo) {
+    const config = chartInfo.config;
+    if (chartInfo.userRange) {
+        return chartInfo.userRange;
+    }
+    // Charts without a fixed default (null) open on the same p5-p95 range as their controls
+    const stats = activeStats(chartInfo);
+    return [
+        config.default_min != null ? config.default_min : (stats.p5 != null ? stats.p5 : stats.min),
+        config.default_max != null ? config.default_max : (stats.p95 != null ? stats.p95 : stats.max)
+    ];
+}
+
+// PERFORMANCE: Large heatmaps bypass the ECharts heatmap series entirely
+function shouldRasterizeHeatmap(chartInfo) {
+    return Array.isArray(chartInfo.data) && chartInfo.data.length > HEATMAP_RASTER_THRESHOLD;
+}
+
+// Interpolate the colour scale into a flat RGBA lookup table
+function buildColourLUT(palette) {
+    const rgb = palette.map(hex => [
+        parseInt(hex.slice(1, 3), 16),
+        parseInt(hex.slice(3, 5), 16),
+        parseInt(hex.slice(5, 7), 16)
+    ]);
+    const lut = new Uint8ClampedArray(RASTER_LUT_SIZE * 4);
+
+    for (let k = 0; k < RASTER_LUT_SIZE; k++) {
+        const pos = (k / (RASTER_LUT_SIZE - 1)) * (rgb.length - 1);
+        const lo = Math.floor(pos);
+        const hi = Math.min(rgb.length - 1, lo + 1);
+        const t = pos - lo;
+        for (let c = 0; c < 3; c++) {
+            lut[k * 4 + c] = rgb[lo][c] + (rgb[hi][c] - rgb[lo][c]) * t;
+        }
+        lut[k * 4 + 3] = 255;
+    }
+
+    return lut;
+}
+
+// Pack the [time, column, value] points into a column-major matrix (one row per variable)
+function packHeatmapMatrix(chartInfo) {
+    const nCols = chartInfo.columns.length;
+    let nTimes = 0;
+    for (const point of chartInfo.data) {
+        if (point[0] + 1 > nTimes) nTimes = point[0] + 1;
+    }
+
+    const values = new Float32Array(nTimes * nCols);
+    for (const point of chartInfo.data) {
+        values[point[1] * nTimes + point[0]] = point[2];
+    }
+
+    return { values: values, nTimes: nTimes, nCols: nCols };
+}
+
+function lookupHeatmapValue(chartId, chartInfo, timeIdx, colIdx) {
+    const index = getHeatmapIndex(chartId, chartInfo);
+    for (let k = index.rowOffsets[timeIdx]; k < index.rowOffsets[timeIdx + 1]; k++) {
+        if (chartInfo.data[k][1] === colIdx) return chartInfo.data[k][2];
+    }
+    return null;
+}
+
+function buildHeatmapRaster(chartId, chartInfo) {
+    const matrix = packHeatmapMatrix(chartInfo);
+    const nTimes = matrix.nTimes;
+    const nCols = matrix.nCols;
+    let values = matrix.values;
+
+    // The worker takes ownership of the matrix; the page keeps only the tiles
+    if (analysisWorker) {
+        ensureWorkerBuffers(chartId, chartInfo, matrix).catch(error => {
+            console.warn(`Worker could not load ${chartId}:`, error);
+        });
+        values = null;
+    }
+
+    const tiles = [];
+    for (let x0 = 0; x0 < nTimes; x0 += RASTER_TILE_WIDTH) {
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.min(RASTER_TILE_WIDTH, nTimes - x0);
+        canvas.height = nCols;
+        tiles.push({ x0: x0, canvas: canvas });
+    }
+
+    return {
+        values: values,
+        validBits: getValidBits(chartInfo),
+        nTimes: nTimes,
+        nCols: nCols,
+        tiles: tiles,
+        lut: buildColourLUT(getColourScale(chartInfo.config)),
+        viewCanvas: document.createElement('canvas'),
+        range: null,
+        paintSeq: 0
+    };
+}
+
+// Colour the raster in the worker when it owns the matrix, otherwise inline.
+// Worker results arrive asynchronously and redraw the current window themselves.
+function paintHeatmap(chartId, raster, vmin, vmax) {
+    if (raster.values) {
+        paintHeatmapRaster(raster, vmin, vmax);
+        return;
+    }
+
+    raster.range = [vmin, vmax];
+    const seq = ++raster.paintSeq;
+
+    workerRequest('paint', {
+        chartId: chartId,
+        vmin: vmin,
+        vmax: vmax,
+        lut: raster.lut,
+        tileWidth: RASTER_TILE_WIDTH,
+        validOnly: validOnly,
+        seq: seq
+    }).then(result => {
+        // Ignore replies for disposed charts or superseded colour ranges
+        if (heatmapRasters[chartId] !== raster || result.seq !== raster.paintSeq) return;
+
+        result.tiles.forEach((tileResult, k) => {
+            const pixels = new Uint8ClampedArray(tileResult.pixels);
+            raster.tiles[k].canvas.getContext('2d')
+                .putImageData(new ImageData(pixels, tileResult.width, raster.nCols), 0, 0);
+        });
+        updateRasterHeatmapWindow(chartId, currentTimeRange[0], currentTimeRange[1]);
+    }).catch(error => {
+        console.warn(`Worker paint failed for ${chartId}, painting on main thread:`, error);
+        if (heatmapRasters[chartId] !== raster) return;
+        raster.values = packHeatmapMatrix(chartsData[chartId]).values;
+        paintHeatmapRaster(raster, vmin, vmax);
+        updateRasterHeatmapWindow(chartId, currentTimeRange[0], currentTimeRange[1]);
+    });
+}
+
+// Colour every cell once; window changes only re-blit the tiles
+function paintHeatmapRaster(raster, vmin, vmax) {
+    const scale = vmax > vmin ? (RASTER_LUT_SIZE - 1) / (vmax - vmin) : 0;
+    // Flagged cells are left transparent; the values themselves are never copied or rewritten
+    const bits = validOnly ? raster.validBits : null;
+
+    for (const tile of raster.tiles) {
+        const width = tile.canvas.width;
+        const ctx = tile.canvas.getContext('2d');
+        const image = ctx.createImageData(width, raster.nCols);
+        const pixels = image.data;
+
+        for (let j = 0; j < raster.nCols; j++) {
+            // Variable 0 sits at the bottom of the category axis
+            const rowOffset = (raster.nCols - 1 - j) * width;
+            const valueOffset = j * raster.nTimes + tile.x0;
+            for (let x = 0; x < width; x++) {
+                const p = (rowOffset + x) * 4;
+                if (bits && !isValidValue(bits, raster.nTimes, j, tile.x0 + x)) {
+                    pixels[p + 3] = 0;
+                    continue;
+                }
+                let k = Math.round((raster.values[valueOffset + x] - vmin) * scale);
+                k = k < 0 ? 0 : (k >= RASTER_LUT_SIZE ? RASTER_LUT_SIZE - 1 : k);
+                pixels[p] = raster.lut[k * 4];
+                pixels[p + 1] = raster.lut[k * 4 + 1];
+                pixels[p + 2] = raster.lut[k * 4 + 2];
+                pixels[p + 3] = 255;
+            }
+        }
+
+        ctx.putImageData(image, 0, 0);
+    }
+
+    raster.range = [vmin, vmax];
+}
+
+// Scale the visible window of the raster into the view canvas (cost independent of cell count)
+function drawHeatmapWindow(raster, startIdx, endIdx, width, height) {
+    const view = raster.viewCanvas;
+    if (view.width !== width || view.height !== height) {
+        view.width = width;
+        view.height = height;
+    }
+
+    const ctx = view.getContext('2d');
+    ctx.imageSmoothingEnabled = false;
+    ctx.clearRect(0, 0, width, height);
+
+    const windowSize = endIdx - startIdx + 1;
+    const pxPerPoint = width / windowSize;
+
+    for (const tile of raster.tiles) {
+        const from = Math.max(startIdx, tile.x0);
+        const to = Math.min(endIdx + 1, tile.x0 + tile.canvas.width);
+        if (from >= to) continue;
+
+        ctx.drawImage(tile.canvas,
+                      from - tile.x0, 0, to - from, raster.nCols,
+                      (from - startIdx) * pxPerPoint, 0, (to - from) * pxPerPoint, height);
+    }
+}
+
+function getGridRect(chart) {
+    return {
+        x: ALIGNED_GRID.left,
+        y: ALIGNED_GRID.top,
+        width: Math.max(1, chart.getWidth() - ALIGNED_GRID.left - ALIGNED_GRID.right),
+        height: Math.max(1, chart.getHeight() - ALIGNED_GRID.top - ALIGNED_GRID.bottom)
+    };
+}
+
+function createRasterHeatmapChart(chart, chartId, chartInfo) {
+    const config = chartInfo.config;
+    const columns = chartInfo.columns;
+
+    let raster = heatmapRasters[chartId];
+    if (!raster) {
+        raster = buildHeatmapRaster(chartId, chartInfo);
+        heatmapRasters[chartId] = raster;
+        paintHeatmap(chartId, raster, ...getHeatmapRange(chartInfo));
+
+        chart.getZr().on('mousemove', function(event) {
+            const point = chart.convertFromPixel({ gridIndex: 0 }, [event.offsetX, event.offsetY]);
+            if (!point) return;
+            const timeIdx = Math.round(point[0]);
+            const colIdx = Math.round(point[1]);
+            if (timeIdx < 0 || timeIdx >= raster.nTimes || colIdx < 0 || colIdx >= raster.nCols) {
+                chart.getDom().title = '';
+                return;
+            }
+            const value = lookupHeatmapValue(chartId, chartInfo, timeIdx, colIdx);
+            const valueText = value === null ? 'n/a' : value.toFixed(3);
+            chart.getDom().title = `Time: ${formatTimeLabel(timeIdx)}\nVariable: ${columns[colIdx]}\nValue: ${valueText}`;
+        });
+    }
+
+    const rect = getGridRect(chart);
+    const [startIdx, endIdx] = currentTimeRange;
+    drawHeatmapWindow(raster, startIdx, endIdx, rect.width, rect.height);
+
+    const option = {
+        title: {
+            text: config.title,
+            subtext: `${config.description} (${columns.length} columns, ${endIdx - startIdx + 1} time points, raster)`,
+            left: 'center',
+            top: 15,
+            textStyle: { fontSize: 16 },
+            subtextStyle: { fontSize: 12 }
+        },
+        grid: ALIGNED_GRID,
+        xAxis: {
+            type: 'value',
+            min: startIdx - 0.5,
+            max: endIdx + 0.5,
+            name: 'Time Index',
+            nameLocation: 'middle',
+            nameGap: 30,
+            splitLine: { show: false },
+            axisLabel: { fontSize: 11, formatter: value => Number.isInteger(value) ? value : '' }
+        },
+        yAxis: {
+            type: 'category',
+            data: columns,
+            name: `Variables (${config.units})`,
+            nameLocation: 'middle',
+            nameGap: 80,
+            axisLabel: {
+                fontSize: 10,
+                width: 100,
+                overflow: 'truncate'
+            }
+        },
+        visualMap: {
+            min: raster.range[0],
+            max: raster.range[1],
+            calculable: false,
+            orient: 'horizontal',
+            left: 'center',
+            bottom: 15,
+            inRange: { color: getColourScale(config) }
+        },
+        graphic: [{
+            id: 'heatmap-raster',
+            type: 'image',
+            silent: true,
+            z: -1,
+            left: rect.x,
+            top: rect.y,
+            style: { image: raster.viewCanvas, width: rect.width, height: rect.height }
+        }],
+        series: [],
+        toolbox: {
+            show: true,
+            right: 20,
+            top: 15,
+            feature: {
+                saveAsImage: {
+                    title: 'Save as Image',
+                    name: `${config.title}_heatmap`
+                }
+            }
+        }
+    };
+
+    chart.setOption(option, true);
+}
+
+// PERFORMANCE: Redraw only the raster window and axis bounds, no option rebuild
+function updateRasterHeatmapWindow(chartId, startIdx, endIdx) {
+    const chart = charts[chartId];
+    const raster = heatmapRasters[chartId];
+    if (!chart || !raster) return;
+
+    const rect = getGridRect(chart);
+    drawHeatmapWindow(raster, startIdx, endIdx, rect.width, rect.height);
+
+    chart.setOption({
+        xAxis: { min: startIdx - 0.5, max: endIdx + 0.5 },
+        graphic: [{
+            id: 'heatmap-raster',
+            style: { image: raster.viewCanvas, width: rect.width, height: rect.height }
+        }]
+    });
 }
 
 function createHeatmapChart(chart, chartId, chartInfo) {
+    if (shouldRasterizeHeatmap(chartInfo)) {
+        createRasterHeatmapChart(chart, chartId, chartInfo);
+        return;
+    }
+
     const config = chartInfo.config;
     const data = chartInfo.data;
     const columns = chartInfo.columns;
     
-    const vmin = config.default_min !== undefined ? config.default_min : chartInfo.stats.min;
-    const vmax = config.default_max !== undefined ? config.default_max : chartInfo.stats.max;
+    const [vmin, vmax] = getHeatmapRange(chartInfo);
     
-    const filteredData = filterDataByTimeRange(data, currentTimeRange[0], currentTimeRange[1], 'heatmap');
+    const index = getHeatmapIndex(chartId, chartInfo);
+    const windowData = visibleHeatmapPoints(chartInfo, sliceHeatmapWindow(index, data, currentTimeRange[0], currentTimeRange[1]));
     const timeRangeSize = currentTimeRange[1] - currentTimeRange[0] + 1;
     
     const option = {
@@ -602,7 +1281,7 @@ function createHeatmapChart(chart, chartId, chartInfo) {
         tooltip: {
             position: 'top',
             formatter: function(params) {
-                const timeIdx = params.data[0] + currentTimeRange[0];
+                const timeIdx = params.data[0];
                 const colIdx = params.data[1];
                 const value = params.data[2];
                 const timeLabel = timeIdx < timeLabels.length ? timeLabels[timeIdx] : `Time ${timeIdx}`;
@@ -613,7 +1292,9 @@ function createHeatmapChart(chart, chartId, chartInfo) {
         grid: ALIGNED_GRID,
         xAxis: {
             type: 'category',
-            data: Array.from({length: timeRangeSize}, (_, i) => currentTimeRange[0] + i),
+            data: index.axisData,
+            min: currentTimeRange[0],
+            max: currentTimeRange[1],
             splitArea: { show: true },
             name: 'Time Index',
             nameLocation: 'middle',
@@ -641,18 +1322,13 @@ function createHeatmapChart(chart, chartId, chartInfo) {
             left: 'center',
             bottom: 15,
             inRange: {
-                color: config.colour_scale === 'grafana_style' ? [
-                    '#0d0887', '#2d1e8f', '#4a0da6', '#6a00a8', '#8b0aa5',
-                    '#a9179c', '#c42e88', '#dc4869', '#f0624a', '#fc8023',
-                    '#fd9a44', '#feb078', '#fdc7a4', '#fcfdbf'
-                ] : ['#313695', '#4575b4', '#74add1', '#abd9e9', '#e0f3f8', 
-                     '#ffffcc', '#fee090', '#fdae61', '#f46d43', '#d73027', '#a50026']
+                color: getColourScale(config)
             }
         },
         series: [{
             name: config.title,
             type: 'heatmap',
-            data: filteredData || [],
+            data: windowData,
             label: { show: false },
             emphasis: {
                 itemStyle: {
@@ -686,19 +1362,18 @@ function createLineChart(chart, chartId, chartInfo) {
         return;
     }
     
-    const filteredData = filterDataByTimeRange(data, currentTimeRange[0], currentTimeRange[1], 'line');
-    
     const series = [];
     const colors = ['#5470c6', '#91cc75', '#fac858', '#ee6666', '#73c0de', '#3ba272', '#fc8452', '#9a60b4', '#ea7ccc'];
     let colorIndex = 0;
     
-    for (const [colName, values] of Object.entries(filteredData.y_data)) {
+    for (const [colName, values] of Object.entries(visibleLineData(chartInfo))) {
         series.push({
             name: colName,
             type: 'line',
             data: values || [],
             smooth: true,
             symbol: 'none',
+            sampling: 'lttb',
             lineStyle: { width: 2 },
             color: colors[colorIndex % colors.length]
         });
@@ -708,7 +1383,7 @@ function createLineChart(chart, chartId, chartInfo) {
     const option = {
         title: {
             text: config.title,
-            subtext: `${config.description} (${Object.keys(filteredData.y_data).length} series, ${filteredData.x_data.length} points)`,
+            subtext: lineSubtext(chartInfo, currentTimeRange[0], currentTimeRange[1]),
             left: 'center',
             top: 15,
             textStyle: { fontSize: 16 },
@@ -729,7 +1404,7 @@ function createLineChart(chart, chartId, chartInfo) {
         xAxis: {
             type: 'category',
             boundaryGap: false,
-            data: filteredData.x_data || [],
+            data: data.x_data || [],
             name: 'Time Index',
             nameLocation: 'middle',
             nameGap: 30,
@@ -740,8 +1415,8 @@ function createLineChart(chart, chartId, chartInfo) {
             name: `Value (${config.units})`,
             nameLocation: 'middle',
             nameGap: 60,
-            min: config.default_min,
-            max: config.default_max,
+            min: chartInfo.userRange ? chartInfo.userRange[0] : config.default_min,
+            max: chartInfo.userRange ? chartInfo.userRange[1] : config.default_max,
             axisLabel: {
                 fontSize: 11,
                 width: 100,
@@ -763,20 +1438,50 @@ function createLineChart(chart, chartId, chartInfo) {
                 }
             }
         },
+        // The slider window is applied through dataZoom, so the series data is set only once
         dataZoom: [
-            { type: 'inside', start: 0, end: 100 },
-            { start: 0, end: 100, height: 25, bottom: 40 }
+            { type: 'inside', startValue: currentTimeRange[0], endValue: currentTimeRange[1] },
+            { startValue: currentTimeRange[0], endValue: currentTimeRange[1], height: 25, bottom: 40 }
         ]
     };
     
     chart.setOption(option, true);
 }
 
+function lineSubtext(chartInfo, startIdx, endIdx) {
+    const seriesCount = Object.keys(chartInfo.data.y_data).length;
+    return `${chartInfo.config.description} (${seriesCount} series, ${endIdx - startIdx + 1} points)`;
+}
+
+// PERFORMANCE: Partial option merges instead of full re-renders
+function updateHeatmapWindow(chartId, chartInfo, startIdx, endIdx) {
+    const index = getHeatmapIndex(chartId, chartInfo);
+    const columns = chartInfo.columns;
+    
+    charts[chartId].setOption({
+        title: {
+            subtext: `${chartInfo.config.description} (${columns.length} columns, ${endIdx - startIdx + 1} time points)`
+        },
+        xAxis: { min: startIdx, max: endIdx },
+        series: [{ data: visibleHeatmapPoints(chartInfo, sliceHeatmapWindow(index, chartInfo.data, startIdx, endIdx)) }]
+    });
+}
+
+function updateLineWindow(chartId, chartInfo, startIdx, endIdx) {
+    charts[chartId].setOption({
+        title: { subtext: lineSubtext(chartInfo, startIdx, endIdx) },
+        dataZoom: [
+            { startValue: startIdx, endValue: endIdx },
+            { startValue: startIdx, endValue: endIdx }
+        ]
+    });
+}
+
 function updateChartRange(chartId) {
     const minInput = document.getElementById(`min-${chartId}`);
     const maxInput = document.getElementById(`max-${chartId}`);
     
-    if (!minInput || !maxInput || !charts[chartId]) return;
+    if (!minInput || !maxInput || !chartsData[chartId]) return;
     
     const minValue = parseFloat(minInput.value);
     const maxValue = parseFloat(maxInput.value);
@@ -785,9 +1490,19 @@ function updateChartRange(chartId) {
     
     const chart = charts[chartId];
     const chartInfo = chartsData[chartId];
+    // Remembered so lazily created or rebuilt charts keep the user's scale
+    chartInfo.userRange = [minValue, maxValue];
+    if (!chart) return;
     
     try {
-        if (chartInfo.config.type === 'heatmap') {
+        const raster = heatmapRasters[chartId];
+        if (raster) {
+            paintHeatmap(chartId, raster, minValue, maxValue);
+            updateRasterHeatmapWindow(chartId, currentTimeRange[0], currentTimeRange[1]);
+            chart.setOption({
+                visualMap: { min: minValue, max: maxValue }
+            });
+        } else if (chartInfo.config.type === 'heatmap') {
             chart.setOption({
                 visualMap: { min: minValue, max: maxValue }
             });
@@ -803,13 +1518,229 @@ function updateChartRange(chartId) {
 }
 
 function resetChartRange(chartId, dataMin, dataMax) {
-    const minInput = document.getElementById(`min-${chartId}`);
-    const maxInput = document.getElementById(`max-${chartId}`);
+    const applyRange = function(min, max) {
+        const minInput = document.getElementById(`min-${chartId}`);
+        const maxInput = document.getElementById(`max-${chartId}`);
+        
+        if (minInput) minInput.value = min.toFixed(2);
+        if (maxInput) maxInput.value = max.toFixed(2);
+        
+        updateChartRange(chartId);
+    };
+    
+    const chartInfo = chartsData[chartId];
+    if (chartInfo && validOnly && chartInfo.stats_valid) {
+        dataMin = chartInfo.stats_valid.min;
+        dataMax = chartInfo.stats_valid.max;
+    }
+    if (!analysisWorker || !chartInfo) {
+        applyRange(dataMin, dataMax);
+        return;
+    }
+    
+    // PERFORMANCE: Statistics for the visible window are computed off the UI thread
+    const [startIdx, endIdx] = currentTimeRange;
+    ensureWorkerBuffers(chartId, chartInfo)
+        .then(() => workerRequest('stats', { chartId: chartId, start: startIdx, end: endIdx, validOnly: validOnly }))
+        .then(stats => {
+            if (!stats) {
+                applyRange(dataMin, dataMax);
+                return;
+            }
+            debugLog(`Window stats for ${chartId}: mean ${stats.mean.toFixed(2)}, p5-p95 ${stats.p5.toFixed(2)}-${stats.p95.toFixed(2)}`);
+            applyRange(stats.min, stats.max);
+        })
+        .catch(error => {
+            console.warn(`Worker stats failed for ${chartId}:`, error);
+            applyRange(dataMin, dataMax);
+        });
+}
+
+// Open the event stream of a growing analysis; nothing to do for analyses that cannot grow
+function initializeLiveUpdates() {
+    const element = document.getElementById('live-updates');
+    if (!element || typeof EventSource === 'undefined') return;
+    
+    const live = JSON.parse(element.textContent);
+    loadedRows = liveTargetRows = live.rows;
+    connectLiveUpdates(live);
+}
+
+function connectLiveUpdates(live) {
+    liveSource = new EventSource(`${live.events_url}?since=${loadedRows}`);
+    
+    liveSource.addEventListener('open', () => {
+        stopLivePolling();
+        setLiveStatus('live');
+    });
+    liveSource.addEventListener('rows', event => {
+        liveTargetRows = Math.max(liveTargetRows, JSON.parse(event.data).rows);
+        fetchLiveUpdates(live);
+    });
+    liveSource.addEventListener('gone', () => {
+        liveSource.close();
+        stopLivePolling();
+        setLiveStatus(null);
+        debugLog('Analysis was deleted on the server; live updates stopped');
+    });
+    liveSource.addEventListener('error', () => {
+        // EventSource reconnects by itself unless the server refused the stream (every slot taken);
+        // then the page polls for rows until a stream can be reopened
+        if (liveSource.readyState === EventSource.CLOSED) {
+            startLivePolling(live);
+            setTimeout(() => connectLiveUpdates(live), LIVE_RETRY_DELAY);
+        } else {
+            setLiveStatus(null);
+        }
+    });
+}
+
+function startLivePolling(live) {
+    setLiveStatus('polling');
+    if (livePollTimer) return;
+    livePollTimer = setInterval(() => fetchLiveUpdates(live, true), LIVE_POLL_INTERVAL);
+    fetchLiveUpdates(live, true);
+}
+
+function stopLivePolling() {
+    if (livePollTimer) {
+        clearInterval(livePollTimer);
+        livePollTimer = null;
+    }
+}
+
+function setLiveStatus(mode) {
+    const label = document.getElementById('status-label');
+    if (label) {
+        label.textContent = mode === 'live' ? 'Live' : mode === 'polling' ? 'Polling' : 'Status';
+        label.title = mode === 'live' ? 'New rows appear as they are added'
+            : mode === 'polling' ? `New rows are checked for every ${LIVE_POLL_INTERVAL / 1000} s` : '';
+    }
+}
+
+// PERFORMANCE: Fetch only the rows past the loaded ones, one request at a time
+// (polling asks without an announced row count)
+function fetchLiveUpdates(live, poll = false) {
+    if (liveRequest || (!poll && liveTargetRows <= loadedRows)) return;
+    
+    liveRequest = fetch(`${live.updates_url}?since=${loadedRows}`)
+        .then(response => {
+            if (response.status === 404) stopLivePolling();
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        })
+        .then(update => {
+            liveRequest = null;
+            liveTargetRows = Math.max(liveTargetRows, update.rows);
+            applyLiveUpdate(update);
+            // Rows announced while this request was running
+            fetchLiveUpdates(live);
+        })
+        .catch(error => {
+            liveRequest = null;
+            console.warn('Live update failed:', error);
+        });
+}
+
+function applyLiveUpdate(update) {
+    const previousPoints = totalPoints;
+    const changed = new Set();
     
-    if (minInput) minInput.value = dataMin.toFixed(2);
-    if (maxInput) maxInput.value = dataMax.toFixed(2);
+    for (const part of update.parts) {
+        // Parts follow each other from the loaded row count; anything else is a stale reply
+        if (part.first_row !== loadedRows) continue;
+        
+        // Labels follow on only from a complete list; rows past a gap fall back to their index
+        if (timeLabels.length === part.first_row) {
+            for (const label of part.time_labels) {
+                timeLabels.push(label);
+            }
+        }
+        for (const [chartId, partChart] of Object.entries(part.charts_data)) {
+            if (!chartsData[chartId]) continue;
+            appendChartRows(chartsData[chartId], partChart, part.first_row, part.rows);
+            delete heatmapIndexes[chartId];
+            changed.add(chartId);
+        }
+        loadedRows += part.rows;
+    }
+    if (!changed.size) return;
+    
+    totalPoints = Math.max(totalPoints, loadedRows);
+    const points = document.getElementById('points-display');
+    if (points) points.textContent = loadedRows;
+    
+    // A window ending at the last row follows the new rows, keeping its size unless it shows everything
+    let [startIdx, endIdx] = currentTimeRange;
+    if (endIdx >= previousPoints - 1) {
+        endIdx = totalPoints - 1;
+        startIdx = startIdx === 0 ? 0 : Math.max(0, endIdx - (currentTimeRange[1] - currentTimeRange[0]));
+    }
+    currentTimeRange = [startIdx, endIdx];
+    lastTimeRange = [startIdx, endIdx];
+    
+    // Rasters, indexes and worker buffers cover the old rows, so touched charts are rebuilt
+    for (const chartId of changed) {
+        if (!charts[chartId]) continue;
+        disposeChart(chartId);
+        if (visibleCharts.has(chartId)) {
+            createChart(chartId);
+        }
+    }
+    
+    if (rangeSlider) {
+        rangeSlider.update({ max: totalPoints - 1, from: startIdx, to: endIdx });
+    }
+    updateTimeDisplay(startIdx, endIdx);
+    debugLog(`Appended rows; ${loadedRows} time points`);
+}
+
+// Extend one chart by the rows of an update part
+function appendChartRows(chartInfo, update, firstRow, rows) {
+    if (chartInfo.config.type === 'heatmap') {
+        for (const point of update.data) {
+            chartInfo.data.push(point);
+        }
+    } else {
+        chartInfo.data.x_data = chartInfo.data.x_data.concat(update.data.x_data);
+        for (const [colName, values] of Object.entries(update.data.y_data)) {
+            chartInfo.data.y_data[colName] = (chartInfo.data.y_data[colName] || []).concat(values);
+        }
+        delete chartInfo.validYData;
+    }
+    
+    // Statistics on the server already cover every row
+    chartInfo.stats = update.stats;
+    if (update.stats_valid) {
+        chartInfo.stats_valid = update.stats_valid;
+    }
+    appendValidBits(chartInfo, update.valid_mask, firstRow, rows);
+}
+
+// Re-lay the variable-major validity bits over the old and the appended rows
+function appendValidBits(chartInfo, mask, firstRow, rows) {
+    const oldBits = getValidBits(chartInfo);
+    if (!oldBits && !mask) return;
+    
+    const newBits = mask ? decodeBits(mask.bits) : null;
+    const nCols = chartInfo.columns.length;
+    const nTimes = firstRow + rows;
+    const bits = new Uint8Array(Math.ceil(nCols * nTimes / 8));
+    
+    for (let j = 0; j < nCols; j++) {
+        for (let t = 0; t < nTimes; t++) {
+            const valid = t < firstRow
+                ? !oldBits || isValidValue(oldBits, firstRow, j, t)
+                : !newBits || isValidValue(newBits, rows, j, t - firstRow);
+            if (valid) {
+                const k = j * nTimes + t;
+                bits[k >> 3] |= 0x80 >> (k & 7);
+            }
+        }
+    }
     
-    updateChartRange(chartId);
+    chartInfo.valid_mask = { rows: nTimes, columns: nCols, bits: null };
+    chartInfo.validBits = bits;
 }
 
 // Global filename animation functions
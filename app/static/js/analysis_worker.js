@@ -0,0 +1,165 @@
+// Background data processing for the analysis page.
+// The page transfers each chart's buffers once; afterwards it only sends
+// small queries (paint, stats) and receives typed-array results.
+
+const matrices = {}; // chartId -> { nTimes, nCols, values: Float32Array (column-major by variable), validBits }
+const seriesSets = {}; // chartId -> { length, series: [Float32Array, ...], validBits }
+
+self.onmessage = function(event) {
+    const message = event.data;
+
+    try {
+        const handler = HANDLERS[message.type];
+        if (!handler) {
+            throw new Error(`Unknown request type: ${message.type}`);
+        }
+        const transfer = [];
+        const result = handler(message, transfer);
+        self.postMessage({ id: message.id, result: result }, transfer);
+    } catch (error) {
+        self.postMessage({ id: message.id, error: error.message });
+    }
+};
+
+const HANDLERS = {
+    loadMatrix: function(message) {
+        matrices[message.chartId] = {
+            nTimes: message.nTimes,
+            nCols: message.nCols,
+            values: new Float32Array(message.values),
+            validBits: message.validBits || null
+        };
+        return true;
+    },
+
+    loadSeries: function(message) {
+        seriesSets[message.chartId] = {
+            length: message.length,
+            series: message.series.map(buffer => new Float32Array(buffer)),
+            validBits: message.validBits || null
+        };
+        return true;
+    },
+
+    // Colour every cell through the LUT; tiles come back as transferable RGBA buffers
+    paint: function(message, transfer) {
+        const matrix = getMatrix(message.chartId);
+        const lut = message.lut;
+        const lutSize = lut.length / 4;
+        const vmin = message.vmin;
+        const vmax = message.vmax;
+        const scale = vmax > vmin ? (lutSize - 1) / (vmax - vmin) : 0;
+        const bits = message.validOnly ? matrix.validBits : null;
+        const tiles = [];
+
+        for (let x0 = 0; x0 < matrix.nTimes; x0 += message.tileWidth) {
+            const width = Math.min(message.tileWidth, matrix.nTimes - x0);
+            const pixels = new Uint8ClampedArray(width * matrix.nCols * 4);
+
+            for (let j = 0; j < matrix.nCols; j++) {
+                // Variable 0 sits at the bottom of the category axis
+                const rowOffset = (matrix.nCols - 1 - j) * width;
+                const valueOffset = j * matrix.nTimes + x0;
+                for (let x = 0; x < width; x++) {
+                    const p = (rowOffset + x) * 4;
+                    // Flagged cells stay transparent (pixels start zeroed)
+                    if (bits && !isValid(bits, matrix.nTimes, j, x0 + x)) continue;
+                    let k = Math.round((matrix.values[valueOffset + x] - vmin) * scale);
+                    k = k < 0 ? 0 : (k >= lutSize ? lutSize - 1 : k);
+                    pixels[p] = lut[k * 4];
+                    pixels[p + 1] = lut[k * 4 + 1];
+                    pixels[p + 2] = lut[k * 4 + 2];
+                    pixels[p + 3] = 255;
+                }
+            }
+
+            tiles.push({ x0: x0, width: width, pixels: pixels.buffer });
+            transfer.push(pixels.buffer);
+        }
+
+        return { seq: message.seq, tiles: tiles };
+    },
+
+    stats: function(message) {
+        const values = [];
+        forEachWindowValue(message, function(value) {
+            values.push(value);
+        });
+        if (!values.length) return null;
+
+        const sorted = Float64Array.from(values).sort();
+        let sum = 0;
+        for (const value of sorted) sum += value;
+        const mean = sum / sorted.length;
+        let squares = 0;
+        for (const value of sorted) squares += (value - mean) * (value - mean);
+
+        return {
+            min: sorted[0],
+            max: sorted[sorted.length - 1],
+            mean: mean,
+            std: Math.sqrt(squares / sorted.length),
+            p5: percentile(sorted, 5),
+            p95: percentile(sorted, 95)
+        };
+    },
+
+    release: function(message) {
+        delete matrices[message.chartId];
+        delete seriesSets[message.chartId];
+        return true;
+    }
+};
+
+function getMatrix(chartId) {
+    const matrix = matrices[chartId];
+    if (!matrix) {
+        throw new Error(`No buffers loaded for chart ${chartId}`);
+    }
+    return matrix;
+}
+
+// Visit every finite value in the [start, end] time window of a matrix or series set
+function forEachWindowValue(message, visit) {
+    const matrix = matrices[message.chartId];
+    const seriesSet = seriesSets[message.chartId];
+
+    if (matrix) {
+        const from = Math.max(0, message.start);
+        const to = Math.min(matrix.nTimes, message.end + 1);
+        const bits = message.validOnly ? matrix.validBits : null;
+        for (let j = 0; j < matrix.nCols; j++) {
+            const offset = j * matrix.nTimes;
+            for (let t = from; t < to; t++) {
+                const value = matrix.values[offset + t];
+                if (Number.isFinite(value) && (!bits || isValid(bits, matrix.nTimes, j, t))) visit(value);
+            }
+        }
+    } else if (seriesSet) {
+        const from = Math.max(0, message.start);
+        const to = Math.min(seriesSet.length, message.end + 1);
+        const bits = message.validOnly ? seriesSet.validBits : null;
+        seriesSet.series.forEach((values, j) => {
+            for (let t = from; t < to; t++) {
+                const value = values[t];
+                if (Number.isFinite(value) && (!bits || isValid(bits, seriesSet.length, j, t))) visit(value);
+            }
+        });
+    } else {
+        throw new Error(`No buffers loaded for chart ${message.chartId}`);
+    }
+}
+
+// One bit per (variable, time), variable-major, most significant bit first (numpy.packbits)
+function isValid(bits, nTimes, colIdx, timeIdx) {
+    const k = colIdx * nTimes + timeIdx;
+    return (bits[k >> 3] & (0x80 >> (k & 7))) !== 0;
+}
+
+// Linear interpolation between closest ranks, matching numpy.percentile
+function percentile(sorted, q) {
+    const pos = (q / 100) * (sorted.length - 1);
+    const lo = Math.floor(pos);
+    const hi = Math.min(sorted.length - 1, lo + 1);
+    return sorted[lo] + (sorted[hi] - sorted[lo]) * (pos - lo);
+}
@@ -0,0 +1,577 @@
+"""
+Appending to analyses of growing files
+
+Near-real-time EBAS files grow by whole data lines during the day. Ingesting a
+file records where its data ended in append_<id>.json; a refresh reads only the
+bytes past that offset, parses the new lines with the stored column layout and
+stores them as a column segment plus a chart delta (data_<id>_<generation>_<n>.json)
+holding the new heatmap rows and line points. Chart statistics come from running
+moments and quantile sketches kept in the state file, so no earlier row is read
+again. Readers join the data JSON with its deltas.
+
+Segments are merged like the digits of a binary counter: after each refresh the
+newest segments are rewritten as one while the segment before them holds fewer
+than twice their rows. An analysis thus keeps O(log n) segments, and each
+appended row is rewritten O(log n) times before compaction, which folds every
+segment into a new base once they hold as many rows as the base, so the base is
+rewritten only each time the analysis doubles. A refresh therefore costs
+amortised O(log n) per appended row, not O(n); an individual refresh that
+triggers a large merge or the compaction still does that work in the request.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app.models import AnalysisStorage
+from app.utils.column_store import DATETIME_COLUMN, compact_columns, merge_segments, save_columns, segment_path
+from app.utils.metrics import timed_stage, timing_record
+from app.utils.running_stats import RunningStats
+
+
+class AppendConflict(Exception):
+    """The file no longer continues the data stored for the analysis"""
+
+
+def state_path(storage_path, analysis_id):
+    return os.path.join(storage_path, f"append_{analysis_id}.json")
+
+
+def data_path(storage_path, analysis_id):
+    return os.path.join(storage_path, f"data_{analysis_id}.json")
+
+
+def delta_path(storage_path, analysis_id, generation, number):
+    return os.path.join(storage_path, f"data_{analysis_id}_{generation}_{number}.json")
+
+
+def delta_paths(storage_path, analysis_id, generation):
+    """Existing chart deltas of a generation, in append order"""
+    paths = []
+    while os.path.exists(delta_path(storage_path, analysis_id, generation, len(paths) + 1)):
+        paths.append(delta_path(storage_path, analysis_id, generation, len(paths) + 1))
+    return paths
+
+
+def _write_json(path, data, indent=None):
+    # Deltas and state are written compactly; indenting switches json to its slow pure-Python encoder
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent, separators=None if indent else (',', ':'))
+    os.replace(tmp_path, path)
+
+
+def _read_header(f):
+    """Bytes up to and including the data column line, and its column names; (None, None) without one"""
+    from app.utils.ebas_parser import is_data_header
+
+    lines = []
+    for line in f:
+        lines.append(line)
+        text = line.decode('utf-8', errors='ignore')
+        if is_data_header(text):
+            return b''.join(lines), text.split()
+    return None, None
+
+
+def _time_range(df):
+    times = pd.to_datetime(df[DATETIME_COLUMN]).dropna() if DATETIME_COLUMN in df.columns else ()
+    if not len(times):
+        return None
+    return [int(times.min().value), int(times.max().value)]
+
+
+def _chart_values(df, columns, validity=None):
+    """Every value of the chart's columns, pooled; with a mask, flagged values are left out"""
+    parts = []
+    for col in columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        valid = validity.column(col) if validity is not None else None
+        parts.append(values if valid is None else values[valid])
+    return np.concatenate(parts) if parts else np.empty(0)
+
+
+def init_state(file_path, df, analysis_id, storage_path):
+    """Record where the data of a freshly stored upload ends, with running statistics per chart"""
+    from app.utils.chart_generator import chart_element_id
+    from app.utils.config import CHART_CONFIG
+    from app.utils.ebas_parser import find_columns_for_chart, time_base
+    from app.utils.quality import ValidityMask
+
+    with open(file_path, 'rb') as f:
+        header, source_columns = _read_header(f)
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(size - 1, 0))
+        ends_with_newline = f.read(1) == b'\n'
+    if header is None:
+        return None
+
+    validity = ValidityMask.from_frame(df)
+    flagged = set(validity.names)
+    charts = {}
+    for chart_id, config in CHART_CONFIG.items():
+        columns = find_columns_for_chart(df, config)
+        if not columns:
+            continue
+        chart = {'chart_id': chart_id, 'columns': columns,
+                 'stats': RunningStats.of(_chart_values(df, columns)), 'stats_valid': None}
+        if flagged.intersection(columns):
+            chart['stats_valid'] = RunningStats.of(_chart_values(df, columns, validity))
+        charts[chart_element_id(chart_id, analysis_id)] = chart
+
+    state = {
+        'analysis_id': analysis_id,
+        'header_bytes': len(header),
+        'header_sha1': hashlib.sha1(header).hexdigest(),
+        'source_columns': source_columns,
+        'columns': list(df.columns),
+        'bin_diameters': df.attrs.get('bin_diameters') or {},
+        # Appended rows must count their days from the same date as the stored ones
+        'time_base': time_base(df.attrs.get('header')).isoformat(),
+        'offset': size,
+        # parse_ebas_file also reads a last line without newline; its row is stored already
+        'partial_line': size > 0 and not ends_with_newline,
+        'rows': len(df),
+        'base_rows': len(df),
+        'generation': 0,
+        'segments': 0,
+        'segment_rows': [],
+        'time_range': _time_range(df),
+        'charts': charts,
+    }
+    save_state(storage_path, state)
+    return state
+
+
+def load_state(storage_path, analysis_id):
+    """Append state of an analysis, or None if it was not stored from a readable file"""
+    try:
+        with open(state_path(storage_path, analysis_id), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    for chart in state['charts'].values():
+        chart['stats'] = RunningStats.from_dict(chart['stats'])
+        if chart['stats_valid'] is not None:
+            chart['stats_valid'] = RunningStats.from_dict(chart['stats_valid'])
+    return state
+
+
+def save_state(storage_path, state):
+    charts = {
+        element_id: dict(chart, stats=chart['stats'].to_dict(),
+                         stats_valid=chart['stats_valid'].to_dict() if chart['stats_valid'] is not None else None)
+        for element_id, chart in state['charts'].items()
+    }
+    _write_json(state_path(storage_path, state['analysis_id']), dict(state, charts=charts))
+
+
+def read_new_lines(file_path, state):
+    """Complete lines past the recorded offset, decoded, and the number of bytes consumed"""
+    with open(file_path, 'rb') as f:
+        header = f.read(state['header_bytes'])
+        if hashlib.sha1(header).hexdigest() != state['header_sha1']:
+            raise AppendConflict('The file header changed since it was last read; upload it as a new analysis')
+        if os.fstat(f.fileno()).st_size < state['offset']:
+            raise AppendConflict('The file is shorter than the data already stored; upload it as a new analysis')
+        f.seek(state['offset'])
+        data = f.read()
+
+    skipped = 0
+    if state['partial_line']:
+        # The previous read ended inside a line whose row is stored; skip the rest of that line
+        skipped = data.find(b'\n') + 1
+        if not skipped:
+            return '', 0
+        data = data[skipped:]
+    # A line still being written waits for the next refresh
+    end = data.rfind(b'\n') + 1
+    return data[:end].decode('utf-8', errors='ignore'), skipped + end
+
+
+def _extend_period(header, df):
+    """Widen the header period by the period of the appended rows"""
+    from app.utils.ebas_parser import header_period
+
+    period = header_period(header, df['starttime'], df['endtime'])
+    if period is None:
+        time_range = _time_range(df)
+        if time_range is None:
+            return
+        period = tuple(pd.Timestamp(value).round('s').isoformat() for value in time_range)
+    header['period_start'] = min(header.get('period_start') or period[0], period[0])
+    header['period_end'] = max(header.get('period_end') or period[1], period[1])
+
+
+def _time_period(state):
+    if state['time_range'] is None:
+        return f"{state['rows']} time points"
+    start, end = (pd.Timestamp(value) for value in state['time_range'])
+    return f"{start.strftime('%Y-%m-%d %H:%M')} to {end.strftime('%Y-%m-%d %H:%M')}"
+
+
+def _append_rows(file_path, metadata, state, storage_path, result):
+    from app.utils.chart_generator import chart_series
+    from app.utils.config import CHART_CONFIG
+    from app.utils.ebas_parser import DEFAULT_BASE_DATE, create_time_labels, data_frame, split_data_lines
+    from app.utils.quality import ValidityMask
+    from app.utils.size_distribution import add_derived_quantities
+
+    with timed_stage('append_read') as stage:
+        text, consumed = read_new_lines(file_path, state)
+        stage['bytes'] = consumed
+
+    data_lines = split_data_lines(text.splitlines())
+    if not data_lines:
+        if consumed:
+            state.update(offset=state['offset'] + consumed, partial_line=False)
+            save_state(storage_path, state)
+        return 'unchanged'
+
+    first_row = state['rows']
+    with timed_stage('parse') as stage:
+        # States written before time_base was recorded belong to analyses anchored on the default date
+        base_date = datetime.fromisoformat(state['time_base']) if state.get('time_base') else DEFAULT_BASE_DATE
+        df = data_frame(data_lines, state['source_columns'], base_date)
+        # Row numbers continue the analysis, for 'Sample N' labels and chart indexes
+        df.index = pd.RangeIndex(first_row, first_row + len(df))
+        stage['bytes'] = consumed
+        stage['rows'] = len(df)
+    with timed_stage('derived') as stage:
+        df = add_derived_quantities(df, state['bin_diameters'])
+        stage['rows'] = len(df)
+    if list(df.columns) != state['columns']:
+        raise AppendConflict('The new rows do not have the stored columns; upload the file as a new analysis')
+
+    with timed_stage('validity') as stage:
+        validity = ValidityMask.from_frame(df)
+        stage['rows'] = len(df)
+
+    rows = first_row + len(df)
+    tail_range = _time_range(df)
+    if tail_range is not None:
+        old_range = state['time_range'] or tail_range
+        state['time_range'] = [min(old_range[0], tail_range[0]), max(old_range[1], tail_range[1])]
+    state['rows'] = rows
+    time_period = _time_period(state)
+
+    # Only the new rows are charted: the heatmap tail and line points past the stored ones
+    with timed_stage('charts') as stage:
+        charts_data = {}
+        for element_id, chart in state['charts'].items():
+            columns = chart['columns']
+            chart['stats'].update(_chart_values(df, columns))
+            update = {
+                'data': chart_series(df, columns, CHART_CONFIG[chart['chart_id']], first_row),
+                'stats': chart['stats'].summary(),
+                'valid_mask': validity.encode(columns),
+            }
+            if chart['stats_valid'] is not None:
+                chart['stats_valid'].update(_chart_values(df, columns, validity))
+                update['stats_valid'] = chart['stats_valid'].summary()
+            charts_data[element_id] = update
+        stage['rows'] = len(df)
+
+    with timed_stage('serialize') as stage:
+        delta = {
+            'first_row': first_row,
+            'rows': len(df),
+            'time_labels': create_time_labels(df),
+            'df_data': df.to_json(orient='records'),
+            'charts_data': charts_data,
+            'metadata': {'rows': rows, 'time_period': time_period},
+        }
+        stage['rows'] = len(df)
+
+    analysis_id = state['analysis_id']
+    segment_rows = state.get('segment_rows')
+    if segment_rows is None or len(segment_rows) != state['segments']:
+        # States written before segment sizes were recorded
+        segment_rows = [part['rows'] for part in
+                        _read_deltas(storage_path, analysis_id, state['generation'], state['base_rows'])]
+    with timed_stage('storage_write') as stage:
+        number = state['segments'] + 1
+        written = save_columns(segment_path(storage_path, analysis_id, state['generation'], number), df, validity,
+                               first_row=first_row)
+        _write_json(delta_path(storage_path, analysis_id, state['generation'], number), delta)
+        stage['bytes'] = written + os.path.getsize(delta_path(storage_path, analysis_id, state['generation'], number))
+        state.update(offset=state['offset'] + consumed, partial_line=False, segments=number,
+                     segment_rows=segment_rows + [len(df)])
+        save_state(storage_path, state)
+
+    if rows - state['base_rows'] >= state['base_rows']:
+        with timed_stage('compact') as stage:
+            compact(storage_path, state)
+            stage['rows'] = rows
+        result['compacted'] = True
+    else:
+        with timed_stage('merge_segments') as stage:
+            stage['segments'] = merge_tail(storage_path, state)
+
+    metadata.data_points = rows
+    metadata.time_period = time_period
+    _extend_period(metadata.header, df)
+    AnalysisStorage(storage_path).update_analysis(metadata)
+    result['appended_rows'] = len(df)
+    return 'completed'
+
+
+def append_file(file_path, analysis_id, storage_path, log=None):
+    """Append the rows a grown file gained since the analysis was last updated from it
+
+    Returns a result dict like process_upload's; 'outcome' is 'completed',
+    'unchanged' (no new complete lines), 'not_found', 'conflict' (the file does
+    not continue the stored data) or 'failed'.
+    """
+    result = {'analysis_id': analysis_id, 'filename': os.path.basename(file_path),
+              'appended_rows': 0, 'rows': None, 'compacted': False, 'error': None}
+    record = {}
+    storage = AnalysisStorage(storage_path)
+    try:
+        with timing_record('append', log=log, analysis_id=analysis_id) as record:
+            try:
+                with storage.append_lock(analysis_id):
+                    metadata = storage.get_analysis(analysis_id)
+                    state = load_state(storage_path, analysis_id) if metadata is not None else None
+                    if metadata is None:
+                        record['outcome'] = 'not_found'
+                        result['error'] = 'Analysis not found'
+                        return result
+                    if state is None:
+                        raise AppendConflict('Only analyses stored from a single uploaded file can be appended to')
+                    record['outcome'] = _append_rows(file_path, metadata, state, storage_path, result)
+                    result['rows'] = state['rows']
+            except AppendConflict as e:
+                record['outcome'] = 'conflict'
+                result['error'] = str(e)
+            except Exception as e:
+                record['outcome'] = 'failed'
+                result['error'] = str(e)
+    finally:
+        result['outcome'] = record.get('outcome', 'failed')
+        result['timing'] = record
+    return result
+
+
+def compact(storage_path, state):
+    """Fold the deltas and column segments into new base files of the next generation"""
+    from app.utils.pipeline import save_thumbnails
+
+    analysis_id = state['analysis_id']
+    old_deltas = delta_paths(storage_path, analysis_id, state['generation'])
+    analysis_data = load_analysis_data(storage_path, analysis_id)
+    analysis_data['generation'] = state['generation'] + 1
+    # Written compactly: readers do not care about the layout and indenting is several times slower
+    _write_json(data_path(storage_path, analysis_id), analysis_data)
+    compact_columns(storage_path, analysis_id)
+    state.update(generation=state['generation'] + 1, segments=0, segment_rows=[], base_rows=state['rows'])
+    save_state(storage_path, state)
+    for path in old_deltas:
+        os.remove(path)
+    # Previews follow the data at each compaction rather than at every append
+    save_thumbnails(storage_path, analysis_id)
+
+
+def merge_tail(storage_path, state):
+    """Merge the newest segments and deltas into one while the segment before holds fewer than twice their rows
+
+    Returns the number of segments merged away.
+    """
+    sizes = state['segment_rows']
+    last = state['segments']
+    if not last or len(sizes) != last:
+        return 0
+    first, rows = last, sizes[-1]
+    while first > 1 and sizes[first - 2] < 2 * rows:
+        first -= 1
+        rows += sizes[first - 1]
+    if first == last:
+        return 0
+
+    analysis_id, generation = state['analysis_id'], state['generation']
+    merge_segments(storage_path, analysis_id, generation, first, last,
+                   state['base_rows'] + sum(sizes[:first - 1]))
+    deltas = []
+    for number in range(first, last + 1):
+        with open(delta_path(storage_path, analysis_id, generation, number), 'r', encoding='utf-8') as f:
+            deltas.append(json.load(f))
+    _write_json(delta_path(storage_path, analysis_id, generation, first), _merge_deltas(deltas, state['charts']))
+    state.update(segments=first, segment_rows=sizes[:first - 1] + [rows])
+    save_state(storage_path, state)
+    # Newest first, so a reader probing the numbers in order never finds a gap before a leftover
+    for number in range(last, first, -1):
+        os.remove(segment_path(storage_path, analysis_id, generation, number))
+        os.remove(delta_path(storage_path, analysis_id, generation, number))
+    return last - first
+
+
+def _extend_chart(chart, update):
+    """Add a delta's points and running statistics to a chart of the analysis data or of another delta"""
+    if isinstance(chart['data'], list):
+        # Heatmap points
+        chart['data'].extend(update['data'])
+    else:
+        chart['data']['x_data'].extend(update['data']['x_data'])
+        for col, values in update['data']['y_data'].items():
+            chart['data']['y_data'].setdefault(col, []).extend(values)
+    # Running statistics cover every row up to this delta
+    chart['stats'] = update['stats']
+    if 'stats_valid' in update:
+        chart['stats_valid'] = update['stats_valid']
+
+
+def _merge_deltas(deltas, charts):
+    """One delta holding the rows of consecutive deltas"""
+    from app.utils.quality import concat_encoded
+
+    charts_data = {}
+    for element_id, chart in charts.items():
+        updates = [delta['charts_data'].get(element_id) for delta in deltas]
+        present = [update for update in updates if update is not None]
+        if not present:
+            continue
+        merged = present[0]
+        for update in present[1:]:
+            _extend_chart(merged, update)
+        merged['valid_mask'] = concat_encoded(
+            [(update.get('valid_mask') if update is not None else None, delta['rows'])
+             for update, delta in zip(updates, deltas)], len(chart['columns']))
+        charts_data[element_id] = merged
+    return dict(deltas[0], rows=sum(delta['rows'] for delta in deltas),
+                time_labels=[label for delta in deltas for label in delta['time_labels']],
+                df_data=_join_records([delta['df_data'] for delta in deltas]),
+                charts_data=charts_data, metadata=deltas[-1]['metadata'])
+
+
+def _read_deltas(storage_path, analysis_id, generation, first_row):
+    """The deltas of a generation continuing from row `first_row`, in row order"""
+    deltas = []
+    for path in delta_paths(storage_path, analysis_id, generation):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                delta = json.load(f)
+        except FileNotFoundError:
+            # Compacted or merged meanwhile; the deltas read so far are a consistent, older view
+            break
+        if delta['first_row'] < first_row:
+            # Left over from a merge: an earlier delta holds these rows now
+            continue
+        if delta['first_row'] > first_row:
+            break
+        deltas.append(delta)
+        first_row += delta['rows']
+    return deltas
+
+
+def _join_records(parts):
+    """Concatenate JSON arrays given as text"""
+    items = [part.strip()[1:-1].strip() for part in parts]
+    return '[' + ','.join(item for item in items if item) + ']'
+
+
+def load_analysis_data(storage_path, analysis_id):
+    """The stored analysis data JSON with the rows of any appended deltas joined in"""
+    from app.utils.quality import concat_encoded
+
+    with open(data_path(storage_path, analysis_id), 'r', encoding='utf-8') as f:
+        analysis_data = json.load(f)
+
+    deltas = _read_deltas(storage_path, analysis_id, analysis_data.get('generation', 0),
+                          analysis_data['metadata']['rows'])
+    if not deltas:
+        return analysis_data
+
+    charts_data = analysis_data['charts_data']
+    masks = {element_id: [(chart.get('valid_mask'), analysis_data['metadata']['rows'])]
+             for element_id, chart in charts_data.items()}
+    for delta in deltas:
+        analysis_data['time_labels'].extend(delta['time_labels'])
+        analysis_data['metadata'].update(delta['metadata'])
+        for element_id, chart in charts_data.items():
+            update = delta['charts_data'].get(element_id)
+            if update is None:
+                masks[element_id].append((None, delta['rows']))
+                continue
+            _extend_chart(chart, update)
+            masks[element_id].append((update.get('valid_mask'), delta['rows']))
+
+    for element_id, parts in masks.items():
+        valid_mask = concat_encoded(parts, len(charts_data[element_id]['columns']))
+        if valid_mask:
+            charts_data[element_id]['valid_mask'] = valid_mask
+    analysis_data['df_data'] = _join_records([analysis_data['df_data']] + [delta['df_data'] for delta in deltas])
+    return analysis_data
+
+
+def stored_rows(storage_path, analysis_id):
+    """Row count recorded in the append state, or None for an analysis that cannot grow"""
+    try:
+        with open(state_path(storage_path, analysis_id), 'r', encoding='utf-8') as f:
+            return json.load(f)['rows']
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def _rows_from(part, since):
+    """A delta cut to its rows from index `since` on"""
+    from app.utils.quality import slice_encoded
+
+    skip = since - part['first_row']
+    if skip <= 0:
+        return part
+    charts_data = {}
+    for element_id, update in part['charts_data'].items():
+        data = update['data']
+        if isinstance(data, list):
+            # Heatmap points carry their absolute row index
+            data = [point for point in data if point[0] >= since]
+        else:
+            data = {'x_data': data['x_data'][skip:],
+                    'y_data': {col: values[skip:] for col, values in data['y_data'].items()}}
+        n_columns = update['valid_mask']['columns'] if update.get('valid_mask') else 0
+        charts_data[element_id] = dict(update, data=data,
+                                       valid_mask=slice_encoded(update.get('valid_mask'), n_columns, skip))
+    return dict(part, first_row=since, rows=part['rows'] - skip,
+                time_labels=part['time_labels'][skip:], charts_data=charts_data)
+
+
+def load_updates(storage_path, analysis_id, since):
+    """Rows from index `since` on, as a list of delta-shaped parts in row order
+
+    Rows still in the deltas of the current generation are read from them alone;
+    rows already folded into the base (or compacted while reading) come from the
+    joined analysis data. Returns None when the analysis has no data file.
+    """
+    state = None
+    try:
+        with open(state_path(storage_path, analysis_id), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    if state is not None and since >= state['base_rows']:
+        deltas = _read_deltas(storage_path, analysis_id, state['generation'], state['base_rows'])
+        # Fewer rows than the state records means a compaction moved them into the new base
+        if state['base_rows'] + sum(delta['rows'] for delta in deltas) >= state['rows']:
+            parts = []
+            for delta in deltas:
+                if delta['first_row'] + delta['rows'] > since:
+                    delta.pop('df_data', None)
+                    parts.append(_rows_from(delta, since))
+            return parts
+
+    try:
+        analysis_data = load_analysis_data(storage_path, analysis_id)
+    except FileNotFoundError:
+        return None
+    rows = analysis_data['metadata']['rows']
+    if since >= rows:
+        return []
+    charts_data = {element_id: {key: chart[key] for key in ('data', 'stats', 'stats_valid', 'valid_mask') if key in chart}
+                   for element_id, chart in analysis_data['charts_data'].items()}
+    whole = {'first_row': 0, 'rows': rows, 'time_labels': analysis_data['time_labels'],
+             'charts_data': charts_data, 'metadata': analysis_data['metadata']}
+    return [_rows_from(whole, since)]
@@ -1,50 +1,59 @@
-import pandas as pd
 import numpy as np
-from pyecharts import options as opts
-from pyecharts.charts import HeatMap, Line
-from pyecharts.globals import ThemeType
 from app.utils.config import CHART_CONFIG
 from app.utils.ebas_parser import find_columns_for_chart, calculate_data_statistics
+from app.utils.metrics import timed_stage
 
-def generate_charts_data(df, unique_id):
-    """Generate chart configuration data for frontend rendering"""
+def chart_element_id(chart_id, unique_id):
+    """Chart element id; UUID hyphens become underscores to avoid JavaScript syntax errors"""
+    return f"{chart_id}_{unique_id.replace('-', '_')}"
+
+def chart_series(df, columns, config, first_row=0):
+    """Chart payload for the rows of df; first_row is the index of its first row within the analysis"""
+    if config["type"] == "heatmap":
+        # One bulk conversion instead of a df.loc lookup per cell
+        matrix = df[columns].to_numpy(dtype=float)
+        rows = np.where(np.isnan(matrix), 0, matrix).tolist()
+        return [[first_row + i, j, value] for i, row in enumerate(rows) for j, value in enumerate(row)]
     
-    # Convert UUID hyphens to underscores to avoid JavaScript syntax errors
-    safe_unique_id = unique_id.replace('-', '_')
+    # line chart
+    x_data = list(range(first_row, first_row + len(df)))
+    y_data = {}
+    for col in columns:
+        if col in df.columns:
+            y_data[col] = df[col].fillna(0).tolist()
+    return {'x_data': x_data, 'y_data': y_data}
+
+def generate_charts_data(df, unique_id, validity=None):
+    """Generate chart configuration data for frontend rendering"""
     
     charts_data = {}
     
     for chart_id, config in CHART_CONFIG.items():
         columns = find_columns_for_chart(df, config)
-        stats = calculate_data_statistics(df, columns)
+        with timed_stage('statistics') as stage:
+            stats = calculate_data_statistics(df, columns)
+            stage['rows'] = len(df)
         
         if not columns:
             continue
             
         # Use safe ID for JavaScript compatibility
-        safe_chart_id = f"{chart_id}_{safe_unique_id}"
-        
-        # Prepare chart data
-        chart_data = []
-        if config["type"] == "heatmap":
-            for i, time_idx in enumerate(df.index):
-                for j, col_name in enumerate(columns):
-                    value = df.loc[time_idx, col_name] if col_name in df.columns else 0
-                    chart_data.append([i, j, float(value) if not pd.isna(value) else 0])
-        else:  # line chart
-            x_data = list(range(len(df)))
-            y_data = {}
-            for col in columns:
-                if col in df.columns:
-                    y_data[col] = df[col].fillna(0).tolist()
-            chart_data = {'x_data': x_data, 'y_data': y_data}
+        safe_chart_id = chart_element_id(chart_id, unique_id)
         
         charts_data[safe_chart_id] = {
             'config': config,
             'columns': columns,
             'stats': stats,
-            'data': chart_data,
+            'data': chart_series(df, columns, config),
             'original_id': chart_id
         }
+        
+        # Flag-derived validity for the page's "valid only" switch
+        valid_mask = validity.encode(columns) if validity is not None else None
+        if valid_mask:
+            with timed_stage('statistics') as stage:
+                charts_data[safe_chart_id]['stats_valid'] = calculate_data_statistics(df, columns, validity)
+                stage['rows'] = len(df)
+            charts_data[safe_chart_id]['valid_mask'] = valid_mask
     
     return charts_data
@@ -0,0 +1,304 @@
+"""
+Columnar storage of parsed analyses
+
+Each analysis keeps its parsed values in columns_<id>.npz next to the data JSON:
+one float64 array per column plus 'datetime' as int64 nanoseconds. The archive
+is written uncompressed, so every member is memory-mapped in place: callers
+that need a few columns (merging, resampling) or a few rows at a time
+(exports) never load the whole table. A table keeps its files mapped until it
+is closed, so open it in a with block or close it when a stream ends.
+
+Rows appended to a growing analysis go to segment files,
+columns_<id>_<generation>_<n>.npz, in the same layout. Readers see the base
+file followed by the segments of its generation. Each segment records the row
+it starts at: merging the newest segments rewrites them as the first of them
+before deleting the rest, and a reader skips any leftover whose rows an earlier
+segment already holds. Compaction folds all segments into a new base of the
+next generation, so a reader never sees rows twice. Until then a column of a
+segmented table is a SegmentedColumn: slices read only the parts they overlap,
+so chunked readers stay on the memory maps.
+"""
+import json
+import mmap
+import os
+import struct
+import zipfile
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+from app.utils.quality import ValidityMask
+
+DATETIME_COLUMN = 'datetime'
+TIME_COLUMNS = ('starttime', 'endtime')
+NAT = np.iinfo(np.int64).min
+
+
+def columns_path(storage_path, analysis_id):
+    return os.path.join(storage_path, f"columns_{analysis_id}.npz")
+
+
+def segment_path(storage_path, analysis_id, generation, number):
+    return os.path.join(storage_path, f"columns_{analysis_id}_{generation}_{number}.npz")
+
+
+def segment_paths(storage_path, analysis_id, generation):
+    """Existing segment files of a generation, in append order"""
+    paths = []
+    while os.path.exists(segment_path(storage_path, analysis_id, generation, len(paths) + 1)):
+        paths.append(segment_path(storage_path, analysis_id, generation, len(paths) + 1))
+    return paths
+
+
+def save_columns(path, df, validity=None, first_row=None):
+    """Write the DataFrame as one array per column, plus its packed validity mask; returns bytes written"""
+    arrays = {}
+    for name in df.columns:
+        if name == DATETIME_COLUMN:
+            arrays[name] = pd.to_datetime(df[name]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            arrays[name] = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64)
+    return _write_columns(path, arrays, list(df.columns), validity, first_row=first_row)
+
+
+def _write_columns(path, arrays, names, validity=None, generation=0, first_row=None):
+    # Keep column order; npz member order is not guaranteed to survive tools that rewrite it
+    arrays['__columns__'] = np.array(names, dtype=str)
+    if validity is not None:
+        arrays['__valid__'] = validity.packed
+        arrays['__valid_columns__'] = np.array(validity.names, dtype=str)
+    if generation:
+        arrays['__generation__'] = np.array(generation)
+    if first_row is not None:
+        arrays['__first_row__'] = np.array(first_row)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+# Fixed part of a zip local file header; the name and extra field follow it
+_LOCAL_HEADER = struct.Struct('<4s5H3I2H')
+
+
+def _mapped_members(path):
+    """(name -> read-only array over one mapping of the file, the mapping) for the uncompressed .npy members"""
+    mapped = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith('.npy'):
+                continue
+            f.seek(info.header_offset)
+            fields = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+            f.seek(info.header_offset + _LOCAL_HEADER.size + fields[-2] + fields[-1])
+            read_header = (np.lib.format.read_array_header_1_0 if np.lib.format.read_magic(f) == (1, 0)
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran_order, dtype = read_header(f)
+            if dtype.hasobject:
+                continue
+            name = info.filename[:-len('.npy')]
+            # frombuffer keeps the mapping exported while any view of it lives, so it cannot be unmapped under one
+            count = int(np.prod(shape, dtype=np.int64))
+            mapped[name] = np.frombuffer(mapping, dtype=dtype, count=count, offset=f.tell()).reshape(
+                shape, order='F' if fortran_order else 'C')
+    return mapped, mapping
+
+
+def _unmap(mapped, mapping):
+    mapped.clear()
+    try:
+        mapping.close()
+    except BufferError:
+        # A caller still holds one of the arrays; the mapping goes with the last of them
+        pass
+
+
+class SegmentedColumn(np.lib.mixins.NDArrayOperatorsMixin):
+    """A column stored as the base array followed by segment arrays
+
+    A slice reads only the parts it overlaps; any other use (fancy indexing,
+    ufuncs, np.asarray) concatenates the parts into a new array each time.
+    """
+
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self.bounds = np.cumsum([0] + [len(part) for part in self.parts])
+        self.dtype = self.parts[0].dtype
+        self.shape = (int(self.bounds[-1]),)
+        self.ndim = 1
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, stop, _ = key.indices(len(self))
+            pieces = [part[max(start - low, 0):stop - low]
+                      for part, low, high in zip(self.parts, self.bounds[:-1], self.bounds[1:])
+                      if low < stop and high > start]
+            if len(pieces) == 1:
+                return pieces[0]
+            return np.concatenate(pieces) if pieces else self.parts[0][:0]
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None):
+        values = np.concatenate(self.parts)
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [np.asarray(value) if isinstance(value, SegmentedColumn) else value for value in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+
+class ColumnTable:
+    """Read-only view over a stored analysis; columns load on first access"""
+
+    def __init__(self, columns, loader, close=None, validity=None, generation=0):
+        self.columns = list(columns)
+        self._loader = loader
+        self._close = close
+        self._cache = {}
+        self.validity = validity
+        self.generation = generation
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Release the archives and their memory mappings; arrays returned by column() must not be used after"""
+        self._cache.clear()
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __len__(self):
+        return len(self.times())
+
+    def column(self, name):
+        if name not in self._cache:
+            self._cache[name] = self._loader(name)
+        return self._cache[name]
+
+    def times(self):
+        """Datetime column as int64 nanoseconds (NaT as int64 min)"""
+        return self.column(DATETIME_COLUMN)
+
+    def to_frame(self, names=None):
+        names = self.columns if names is None else [name for name in names if name in self.columns]
+        data = {}
+        for name in names:
+            values = np.asarray(self.column(name))
+            data[name] = pd.to_datetime(values, unit='ns') if name == DATETIME_COLUMN else values
+        return pd.DataFrame(data)
+
+
+def _open_archive(path):
+    """(archive, loader, validity, close) for one column file; the loader prefers memory-mapped members"""
+    archive = np.load(path, allow_pickle=False)
+    mapped, mapping = _mapped_members(path)
+    validity = None
+    if '__valid__' in archive.files:
+        validity = ValidityMask([str(name) for name in archive['__valid_columns__']],
+                                archive['__valid__'], len(archive[DATETIME_COLUMN]))
+
+    def close():
+        archive.close()
+        _unmap(mapped, mapping)
+
+    return archive, (lambda name: mapped[name] if name in mapped else archive[name]), validity, close
+
+
+def load_columns(storage_path, analysis_id):
+    """Open an analysis' columns, converting from the data JSON for analyses stored before the column files"""
+    path = columns_path(storage_path, analysis_id)
+    if os.path.exists(path):
+        archive, loader, validity, close = _open_archive(path)
+        names = [str(name) for name in archive['__columns__']]
+        generation = int(archive['__generation__']) if '__generation__' in archive.files else 0
+        parts = [(archive, loader, validity, close)]
+        covered = len(loader(DATETIME_COLUMN))
+        for segment in segment_paths(storage_path, analysis_id, generation):
+            try:
+                part = _open_archive(segment)
+            except FileNotFoundError:
+                # Compacted or merged meanwhile; the parts read so far are still a consistent, older view
+                break
+            # Segments written before they recorded their first row are contiguous
+            first_row = int(part[0]['__first_row__']) if '__first_row__' in part[0].files else covered
+            if first_row != covered:
+                part[3]()
+                if first_row < covered:
+                    # Left over from a merge: an earlier segment holds these rows now
+                    continue
+                break
+            parts.append(part)
+            covered += len(part[1](DATETIME_COLUMN))
+        if len(parts) > 1:
+            loader = lambda name: SegmentedColumn([load(name) for _, load, _, _ in parts])
+            masks = [mask for _, _, mask, _ in parts]
+            validity = ValidityMask.concat(masks) if all(mask is not None for mask in masks) else None
+        return ColumnTable(names, loader, lambda: [close() for _, _, _, close in parts], validity, generation)
+
+    data_path = os.path.join(storage_path, f"data_{analysis_id}.json")
+    with open(data_path, 'r', encoding='utf-8') as f:
+        df = pd.read_json(StringIO(json.load(f)['df_data']), orient='records', convert_dates=False)
+    if DATETIME_COLUMN in df.columns:
+        # to_json writes datetimes as epoch milliseconds
+        df[DATETIME_COLUMN] = pd.to_datetime(df[DATETIME_COLUMN], unit='ms', errors='coerce')
+    save_columns(path, df, ValidityMask.from_frame(df))
+    return load_columns(storage_path, analysis_id)
+
+
+def columns_version(storage_path, analysis_id):
+    """Changes whenever rows are stored, appended or compacted; keys caches derived from the columns"""
+    path = columns_path(storage_path, analysis_id)
+    if not os.path.exists(path):
+        return '0'
+    version = os.stat(path).st_mtime_ns
+    with np.load(path, allow_pickle=False) as archive:
+        generation = int(archive['__generation__']) if '__generation__' in archive.files else 0
+    segments = segment_paths(storage_path, analysis_id, generation)
+    # A merge can bring the count back to an earlier value; the newest segment's mtime still moves
+    try:
+        newest = os.stat(segments[-1]).st_mtime_ns if segments else 0
+    except FileNotFoundError:
+        newest = 0
+    return f"{version}:{len(segments)}:{newest}"
+
+
+def merge_segments(storage_path, analysis_id, generation, first, last, first_row):
+    """Rewrite segments first..last as segment `first`; the caller removes the others afterwards"""
+    parts = [_open_archive(segment_path(storage_path, analysis_id, generation, number))
+             for number in range(first, last + 1)]
+    try:
+        names = [str(name) for name in parts[0][0]['__columns__']]
+        arrays = {name: np.concatenate([load(name) for _, load, _, _ in parts]) for name in names}
+        masks = [mask for _, _, mask, _ in parts]
+        validity = ValidityMask.concat(masks) if all(mask is not None for mask in masks) else None
+    finally:
+        for _, _, _, close in parts:
+            close()
+    return _write_columns(segment_path(storage_path, analysis_id, generation, first), arrays, names, validity,
+                          first_row=first_row)
+
+
+def compact_columns(storage_path, analysis_id):
+    """Fold appended segments into a base file of the next generation; returns bytes written"""
+    with load_columns(storage_path, analysis_id) as table:
+        old_segments = segment_paths(storage_path, analysis_id, table.generation)
+        arrays = {name: np.asarray(table.column(name)) for name in table.columns}
+        written = _write_columns(columns_path(storage_path, analysis_id), arrays, table.columns,
+                                 table.validity, table.generation + 1)
+    for segment in old_segments:
+        os.remove(segment)
+    return written
@@ -108,5 +108,62 @@ CHART_CONFIG = {
         "show_controls": True,
         "default_min": 0,
         "default_max": 1
+    },
+    "chart_surface_distribution": {
+        "title": "Surface Distribution (dS/dlogDp)",
+        "type": "heatmap",
+        "columns_pattern": r"^dS_bin_\d+$",
+        "exclude_pattern": None,
+        "description": "Particle surface by bin size, derived from the number distribution",
+        "units": "µm²/cm³",
+        "colour_scale": "grafana_style",
+        "show_controls": True,
+        "default_min": None,
+        "default_max": None
+    },
+    "chart_volume_distribution": {
+        "title": "Volume Distribution (dV/dlogDp)",
+        "type": "heatmap",
+        "columns_pattern": r"^dV_bin_\d+$",
+        "exclude_pattern": None,
+        "description": "Particle volume by bin size, derived from the number distribution",
+        "units": "µm³/cm³",
+        "colour_scale": "grafana_style",
+        "show_controls": True,
+        "default_min": None,
+        "default_max": None
+    },
+    "chart_number_total": {
+        "title": "Total Number Concentration",
+        "type": "line",
+        "columns_pattern": r"^N_(total|nucleation|aitken|accumulation)$",
+        "exclude_pattern": None,
+        "description": "Integrated number concentration, in total and per mode",
+        "units": "particles/cm³",
+        "show_controls": True,
+        "default_min": None,
+        "default_max": None
+    },
+    "chart_surface_volume_total": {
+        "title": "Total Surface and Volume",
+        "type": "line",
+        "columns_pattern": r"^(S|V)_total$",
+        "exclude_pattern": None,
+        "description": "Integrated surface and volume concentration",
+        "units": "µm²/cm³, µm³/cm³",
+        "show_controls": True,
+        "default_min": None,
+        "default_max": None
+    },
+    "chart_diameters": {
+        "title": "Characteristic Diameters",
+        "type": "line",
+        "columns_pattern": r"^Dp_(median|geomean|nucleation|aitken|accumulation)$",
+        "exclude_pattern": None,
+        "description": "Median and geometric mean diameter, and geometric mean diameter per mode",
+        "units": "nm",
+        "show_controls": True,
+        "default_min": None,
+        "default_max": None
     }
 }
@@ -3,6 +3,139 @@ import numpy as np
 from datetime import datetime, timedelta
 import re
 
+# 'D=20.5 nm' in the NASA Ames variable descriptions gives a size bin's midpoint diameter
+DIAMETER_PATTERN = re.compile(r'\bD\s*=\s*(\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)\s*(nm|um|µm)?', re.IGNORECASE)
+DIAMETER_UNITS_NM = {'nm': 1.0, 'um': 1000.0, 'µm': 1000.0}
+BIN_COLUMN = re.compile(r'^bin_(\d+)$')
+
+# EBAS 'Key: value' header lines kept as searchable metadata
+HEADER_FIELDS = {
+    'station code': 'station_code',
+    'station name': 'station_name',
+    'instrument type': 'instrument_type',
+    'instrument name': 'instrument_name',
+    'component': 'component',
+    'matrix': 'matrix',
+    'originator': 'pi',
+    'laboratory code': 'laboratory',
+    'period code': 'period_code',
+    'resolution code': 'resolution',
+    'startdate': 'startdate',
+}
+HEADER_LINE = re.compile(r'^\s*([A-Za-z][A-Za-z ]*?)\s*:\s*(.+?)\s*$')
+# NASA Ames line 7: date of the first data point and revision date
+NASA_AMES_DATES = re.compile(r'^\s*(\d{4})\s+(\d{1,2})\s+(\d{1,2})\s+\d{4}\s+\d{1,2}\s+\d{1,2}\s*$')
+# starttime/endtime count days from the header reference date; files without one count from here
+DEFAULT_BASE_DATE = datetime(2024, 1, 1)
+
+def extract_header_metadata(header_lines):
+    """Station, instrument, component, matrix, PI and reference date from the file header"""
+    header = {}
+    for line in header_lines:
+        match = HEADER_LINE.match(line)
+        if not match:
+            continue
+        field = HEADER_FIELDS.get(match.group(1).lower())
+        if field is None:
+            continue
+        value = match.group(2)
+        # Originator may be given once per person
+        if field == 'pi' and field in header:
+            header[field] = f"{header[field]}; {value}"
+        else:
+            header.setdefault(field, value)
+
+    # NASA Ames line 2 names the PI when there is no Originator line
+    if 'pi' not in header and len(header_lines) > 1 and ':' not in header_lines[1]:
+        header['pi'] = header_lines[1].strip()
+
+    reference = None
+    startdate = re.match(r'^(\d{4})(\d{2})(\d{2})', header.get('startdate', ''))
+    dates = NASA_AMES_DATES.match(header_lines[6]) if len(header_lines) > 6 else None
+    for match in (startdate, dates):
+        if match:
+            try:
+                reference = datetime(*(int(part) for part in match.groups()))
+                break
+            except ValueError:
+                continue
+    if reference is not None:
+        header['reference_date'] = reference.isoformat()
+    return header
+
+def time_base(header):
+    """Date the time columns count from: the header reference date, or DEFAULT_BASE_DATE without one"""
+    reference = (header or {}).get('reference_date')
+    return datetime.fromisoformat(reference) if reference else DEFAULT_BASE_DATE
+
+def header_period(header, start_days, end_days):
+    """(start, end) ISO timestamps from the header reference date and the time columns in days, or None"""
+    if 'reference_date' not in header:
+        return None
+    start_days = pd.to_numeric(start_days, errors='coerce')
+    end_days = pd.to_numeric(end_days, errors='coerce')
+    if start_days.isna().all():
+        return None
+    reference = datetime.fromisoformat(header['reference_date'])
+    last = end_days.max() if not end_days.isna().all() else start_days.max()
+    # Times are fractional days; round to the second so float noise does not leak into the period
+    return ((reference + timedelta(seconds=round(float(start_days.min()) * 86400))).isoformat(),
+            (reference + timedelta(seconds=round(float(last) * 86400))).isoformat())
+
+def extract_bin_diameters(header_lines, columns):
+    """Map bin_N columns to their diameter in nm from the header, or {} if not all are given"""
+    bin_columns = sorted((col for col in columns if BIN_COLUMN.match(col)),
+                         key=lambda col: int(BIN_COLUMN.match(col).group(1)))
+    if not bin_columns:
+        return {}
+
+    named = {}
+    ordered = []
+    for line in header_lines:
+        match = DIAMETER_PATTERN.search(line)
+        if not match:
+            continue
+        diameter = float(match.group(1)) * DIAMETER_UNITS_NM[(match.group(2) or 'nm').lower()]
+        column = re.search(r'\bbin_\d+\b', line)
+        if column:
+            named[column.group(0)] = diameter
+        else:
+            # Unlabelled descriptions follow the variable order; the bin family comes first
+            ordered.append(diameter)
+
+    if all(col in named for col in bin_columns):
+        return {col: named[col] for col in bin_columns}
+    if len(ordered) >= len(bin_columns):
+        return dict(zip(bin_columns, ordered))
+    return {}
+
+def is_data_header(line):
+    """True for the column line that precedes the data rows"""
+    return line.strip().startswith('starttime') and 'endtime' in line
+
+def split_data_lines(lines):
+    """Whitespace-split fields of data lines, skipping blank lines and # comments"""
+    return [line.strip().split() for line in lines if line.strip() and not line.startswith('#')]
+
+def data_frame(data_lines, columns, base_date=DEFAULT_BASE_DATE):
+    """Typed DataFrame from split data lines: numeric variables, the raw time columns and datetime last"""
+    df = pd.DataFrame(data_lines, columns=columns)
+
+    # Convert numerical types
+    numeric_columns = [col for col in df.columns if col not in ['starttime', 'endtime']]
+    converted_data = {}
+    converted_data['starttime'] = df['starttime']
+    converted_data['endtime'] = df['endtime']
+
+    for col in numeric_columns:
+        converted_data[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Convert time
+    df_times = pd.to_numeric(df['starttime'], errors='coerce') * 24
+    converted_data['datetime'] = df_times.apply(lambda x: base_date + timedelta(hours=x) if not pd.isna(x) else pd.NaT)
+
+    return pd.DataFrame(converted_data)
+
 def parse_ebas_file(file_path):
     """Parse the EBAS file and extract the data"""
     try:
@@ -12,7 +145,7 @@ def parse_ebas_file(file_path):
         # Find where the data starts
         data_start = 0
         for i, line in enumerate(lines):
-            if line.strip().startswith('starttime') and 'endtime' in line:
+            if is_data_header(line):
                 data_start = i + 1
                 header_line = line.strip()
                 break
@@ -23,31 +156,20 @@ def parse_ebas_file(file_path):
         columns = header_line.split()
 
         # Read data
-        data_lines = []
-        for line in lines[data_start:]:
-            if line.strip() and not line.startswith('#'):
-                data_lines.append(line.strip().split())
+        data_lines = split_data_lines(lines[data_start:])
 
         if not data_lines:
             raise ValueError("No data found in file")
 
-        df = pd.DataFrame(data_lines, columns=columns)
-
-        # Convert numerical types
-        numeric_columns = [col for col in df.columns if col not in ['starttime', 'endtime']]
-        converted_data = {}
-        converted_data['starttime'] = df['starttime']
-        converted_data['endtime'] = df['endtime']
-
-        for col in numeric_columns:
-            converted_data[col] = pd.to_numeric(df[col], errors='coerce')
-
-        # Convert time
-        df_times = pd.to_numeric(df['starttime'], errors='coerce') * 24
-        base_date = datetime(2024, 1, 1)
-        converted_data['datetime'] = df_times.apply(lambda x: base_date + timedelta(hours=x) if not pd.isna(x) else pd.NaT)
-
-        df_final = pd.DataFrame(converted_data)
+        header = extract_header_metadata(lines[:data_start - 1])
+        # Whether datetime counts from the file's own date; merges only line up anchored files
+        header['time_anchor'] = 'reference' if 'reference_date' in header else 'default'
+        df_final = data_frame(data_lines, columns, time_base(header))
+        df_final.attrs['bin_diameters'] = extract_bin_diameters(lines[:data_start - 1], columns)
+        period = header_period(header, df_final['starttime'], df_final['endtime'])
+        if period:
+            header['period_start'], header['period_end'] = period
+        df_final.attrs['header'] = header
         return df_final
 
     except Exception as e:
@@ -66,28 +188,35 @@ def create_time_labels(df):
 
 def find_columns_for_chart(df, chart_config):
     """Find columns that match the chart configuration"""
+    return match_columns(df.columns, chart_config)
+
+def match_columns(names, chart_config):
+    """Column names matching a chart configuration, sorted"""
     pattern = chart_config["columns_pattern"]
     exclude_pattern = chart_config.get("exclude_pattern")
 
     matching_columns = []
 
-    for col in df.columns:
+    for col in names:
         if re.search(pattern, col, re.IGNORECASE):
             if exclude_pattern is None or not re.search(exclude_pattern, col, re.IGNORECASE):
                 matching_columns.append(col)
 
     return sorted(matching_columns)
 
-def calculate_data_statistics(df, columns):
-    """Calculate data statistics for min/max controls"""
+def calculate_data_statistics(df, columns, validity=None):
+    """Calculate data statistics for min/max controls; with a ValidityMask, flagged values are left out"""
     if not columns:
         return {"min": 0, "max": 100, "mean": 50, "std": 25}
 
     all_values = []
     for col in columns:
         if col in df.columns:
-            values = df[col].dropna()
-            all_values.extend(values.tolist())
+            values = df[col]
+            valid = validity.column(col) if validity is not None else None
+            if valid is not None:
+                values = values[valid]
+            all_values.extend(values.dropna().tolist())
 
     if not all_values:
         return {"min": 0, "max": 100, "mean": 50, "std": 25}
@@ -0,0 +1,246 @@
+"""
+Streaming export of stored analyses
+
+Rows are read from the memory-mapped column file in fixed-size chunks and
+encoded as they go, so an export holds one chunk in memory whatever the size
+of the analysis and the first bytes leave before the last rows are read.
+CSV and NetCDF are written here; Parquet row groups go through pyarrow when it
+is installed. NetCDF is the classic 64-bit offset format (CDF-2): every row is
+one record along the unlimited 'time' dimension, so records can be appended
+in order after a header that only needs the row count.
+"""
+import re
+import struct
+
+import numpy as np
+
+from app.utils.column_store import DATETIME_COLUMN, NAT
+
+# Values per chunk; rows per chunk shrink as the column count grows
+CHUNK_CELLS = 500_000
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'netcdf': ('application/x-netcdf', 'nc'),
+}
+
+
+def parse_time(value):
+    """ISO date or datetime -> int64 nanoseconds, None when empty"""
+    if not value:
+        return None
+    try:
+        return int(np.datetime64(value.strip(), 'ns').astype(np.int64))
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}'; use an ISO date such as 2024-01-31 or 2024-01-31T12:00")
+
+
+def export_columns(table, families=None):
+    """Value columns to export: the requested CHART_CONFIG families, or every stored column"""
+    from app.utils.resample import select_columns
+
+    if families:
+        return select_columns(table.columns, families)
+    return [name for name in table.columns if name != DATETIME_COLUMN]
+
+
+def chunk_rows_for(columns):
+    return max(1, CHUNK_CELLS // (len(columns) + 1))
+
+
+def row_chunks(table, start=None, end=None, chunk_rows=CHUNK_CELLS):
+    """(first, last, row_mask or None) for each chunk of rows that has rows in the [start, end) window"""
+    total = len(table)
+    times = table.times()
+    for first in range(0, total, chunk_rows):
+        last = min(first + chunk_rows, total)
+        if start is None and end is None:
+            yield first, last, None
+            continue
+        chunk_times = np.asarray(times[first:last])
+        keep = chunk_times != NAT
+        if start is not None:
+            keep &= chunk_times >= start
+        if end is not None:
+            keep &= chunk_times < end
+        if keep.any():
+            yield first, last, keep
+
+
+def count_rows(table, start=None, end=None, chunk_rows=CHUNK_CELLS):
+    return sum(last - first if keep is None else int(keep.sum())
+               for first, last, keep in row_chunks(table, start, end, chunk_rows))
+
+
+def iter_blocks(table, columns, start=None, end=None, valid_only=False, chunk_rows=None):
+    """(times_ns, {column: float64 values}) per chunk, windowed and optionally validity-masked"""
+    validity = table.validity if valid_only else None
+    for first, last, keep in row_chunks(table, start, end, chunk_rows or chunk_rows_for(columns)):
+        times = np.asarray(table.times()[first:last])
+        values = {}
+        for name in columns:
+            block = np.array(table.column(name)[first:last], dtype=np.float64)
+            valid = validity.column(name, first, last) if validity is not None else None
+            if valid is not None:
+                block[~valid] = np.nan
+            values[name] = block if keep is None else block[keep]
+        yield (times if keep is None else times[keep]), values
+
+
+def _time_strings(times):
+    labels = np.datetime_as_string(times.astype('datetime64[ns]'), unit='s')
+    return np.where(times == NAT, '', labels)
+
+
+def iter_csv(table, columns, start=None, end=None, valid_only=False, chunk_rows=None):
+    """CSV text, one chunk per yield; datetime first, empty fields for missing values"""
+    yield ','.join([DATETIME_COLUMN] + list(columns)) + '\n'
+    for times, values in iter_blocks(table, columns, start, end, valid_only, chunk_rows):
+        fields = [_time_strings(times).tolist()]
+        for name in columns:
+            # Shortest round-trip text, as resample.iter_csv writes; NaN becomes an empty field
+            fields.append(['' if value != value else repr(value) for value in values[name].tolist()])
+        lines = [','.join(row) for row in zip(*fields)]
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+
+class _ChunkSink:
+    """Write-only file object for pyarrow that hands written bytes back in pieces"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def iter_parquet(table, columns, start=None, end=None, valid_only=False, chunk_rows=None):
+    """Parquet bytes, one row group per chunk"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(DATETIME_COLUMN, pa.timestamp('ns'))] + [(name, pa.float64()) for name in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for times, values in iter_blocks(table, columns, start, end, valid_only, chunk_rows):
+            arrays = [pa.array(times.astype('datetime64[ns]'), mask=times == NAT)]
+            arrays += [pa.array(values[name], from_pandas=True) for name in columns]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# NetCDF classic format tags (see the NetCDF Classic Format Specification)
+NC_DIMENSION, NC_VARIABLE, NC_ATTRIBUTE = 0x0A, 0x0B, 0x0C
+NC_CHAR, NC_DOUBLE = 2, 6
+_NETCDF_NAME = re.compile(r'[^A-Za-z0-9_]')
+
+
+def _nc_name(name):
+    name = _NETCDF_NAME.sub('_', name)
+    return name if re.match(r'^[A-Za-z_]', name) else f'_{name}'
+
+
+def _nc_padded(data):
+    return data + b'\0' * (-len(data) % 4)
+
+
+def _nc_string(text):
+    data = text.encode('utf-8')
+    return struct.pack('>i', len(data)) + _nc_padded(data)
+
+
+def _nc_attributes(attributes):
+    if not attributes:
+        return b'\0' * 8
+    parts = [struct.pack('>ii', NC_ATTRIBUTE, len(attributes))]
+    for name, value in attributes.items():
+        if isinstance(value, str):
+            data = value.encode('utf-8')
+            parts.append(_nc_string(name) + struct.pack('>ii', NC_CHAR, len(data)) + _nc_padded(data))
+        else:
+            parts.append(_nc_string(name) + struct.pack('>iid', NC_DOUBLE, 1, float(value)))
+    return b''.join(parts)
+
+
+def netcdf_header(columns, n_records, global_attributes=None):
+    """CDF-2 header for 'time' plus one double record variable per column"""
+    variables = [('time', {'units': 'seconds since 1970-01-01 00:00:00', 'standard_name': 'time',
+                           'calendar': 'standard', '_FillValue': float('nan')})]
+    used = {'time'}
+    for column in columns:
+        name = _nc_name(column)
+        while name in used:
+            name += '_'
+        used.add(name)
+        attributes = {'_FillValue': float('nan')}
+        if name != column:
+            attributes['long_name'] = column
+        variables.append((name, attributes))
+
+    def build(data_start):
+        parts = [b'CDF\x02', struct.pack('>i', n_records)]
+        parts.append(struct.pack('>ii', NC_DIMENSION, 1) + _nc_string('time') + struct.pack('>i', 0))
+        parts.append(_nc_attributes(global_attributes or {}))
+        parts.append(struct.pack('>ii', NC_VARIABLE, len(variables)))
+        for index, (name, attributes) in enumerate(variables):
+            # One dimension (time, id 0); each record holds 8 bytes of every variable, in order
+            parts.append(_nc_string(name) + struct.pack('>ii', 1, 0) + _nc_attributes(attributes)
+                         + struct.pack('>iiq', NC_DOUBLE, 8, data_start + 8 * index))
+        return b''.join(parts)
+
+    # Offsets are fixed-width, so the header length does not depend on where data starts
+    return build(len(build(0)))
+
+
+def netcdf_size(columns, n_records, global_attributes=None):
+    return len(netcdf_header(columns, n_records, global_attributes)) + n_records * 8 * (len(columns) + 1)
+
+
+def iter_netcdf(table, columns, start=None, end=None, valid_only=False, global_attributes=None,
+                n_records=None, chunk_rows=None):
+    """NetCDF bytes: the header, then one block of big-endian records per chunk"""
+    if n_records is None:
+        n_records = count_rows(table, start, end)
+    yield netcdf_header(columns, n_records, global_attributes)
+    for times, values in iter_blocks(table, columns, start, end, valid_only, chunk_rows):
+        records = np.empty((len(times), len(columns) + 1), dtype='>f8')
+        seconds = times / 1e9
+        seconds[times == NAT] = np.nan
+        records[:, 0] = seconds
+        for j, name in enumerate(columns, start=1):
+            records[:, j] = values[name]
+        yield records.tobytes()
@@ -0,0 +1,84 @@
+"""
+Live updates for open analysis pages
+
+An open /analysis/<id> page keeps one Server-Sent Events stream. The stream
+watches the analysis' append state (a stat per tick, the file is read only when
+it changed) and sends the new row count whenever rows are appended, whichever
+process appended them; the page then fetches just those rows. Each event id is
+the row count, so a reconnecting EventSource resumes from Last-Event-ID.
+
+Every stream holds a server thread, so StreamSlots bounds them per process and
+streams end after a while; browsers reconnect on their own.
+"""
+import json
+import os
+import threading
+import time
+
+POLL_INTERVAL = 1.0  # seconds between checks of the append state
+HEARTBEAT_INTERVAL = 15.0  # comment lines keep proxies from timing the stream out
+RECONNECT_DELAY = 3000  # milliseconds, sent to the browser as the EventSource retry
+
+
+class StreamSlots:
+    """Per-process limit on concurrently open event streams"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._open >= self.limit:
+                return False
+            self._open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._open -= 1
+
+
+def _event(name, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {name}', f'data: {json.dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def event_stream(storage_path, analysis_id, since, lifetime, poll_interval=POLL_INTERVAL,
+                 heartbeat_interval=HEARTBEAT_INTERVAL):
+    """SSE text: a 'rows' event whenever the analysis has more than `since` rows, until lifetime ends
+
+    A 'gone' event ends the stream for good when the analysis is deleted.
+    """
+    from app.utils.append import state_path, stored_rows
+
+    path = state_path(storage_path, analysis_id)
+    yield f'retry: {RECONNECT_DELAY}\n\n'
+    started = last_sent = time.monotonic()
+    stamp = None
+    while time.monotonic() - started < lifetime:
+        current = _stamp(path)
+        if current is None:
+            yield _event('gone', {'analysis_id': analysis_id})
+            return
+        if current != stamp:
+            stamp = current
+            rows = stored_rows(storage_path, analysis_id)
+            if rows is not None and rows > since:
+                since = rows
+                last_sent = time.monotonic()
+                yield _event('rows', {'analysis_id': analysis_id, 'rows': rows}, event_id=rows)
+        if time.monotonic() - last_sent >= heartbeat_interval:
+            last_sent = time.monotonic()
+            yield ': keepalive\n\n'
+        time.sleep(poll_interval)
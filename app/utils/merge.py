@@ -0,0 +1,133 @@
+"""
+Merge several stored analyses on their datetime axis
+
+Sources are given in priority order, lowest first. Where the time spans of two
+sources overlap, rows of the lower-priority source inside the higher one's span
+are dropped ('last' wins, the default) or the higher-priority rows are dropped
+instead ('first' wins), so every timestamp comes from exactly one file and the
+result does not depend on upload order. Columns are aligned by name across the
+CHART_CONFIG families; a column missing from a source is NaN for its rows.
+
+Times only line up when every source counts them from its own header date;
+sources without one are placed in 2024 and merge only among themselves.
+"""
+import numpy as np
+
+from app.utils.column_store import DATETIME_COLUMN, NAT, TIME_COLUMNS
+from app.utils.config import CHART_CONFIG
+from app.utils.ebas_parser import DEFAULT_BASE_DATE, match_columns
+
+OVERLAP_POLICIES = ('last', 'first')
+
+
+def time_anchor(header):
+    """'reference' or 'default' (see parse_ebas_file), or None when the stored times are misplaced
+
+    Analyses stored before the anchor was recorded always counted from the
+    default date, which is only right for files without another header date.
+    """
+    if 'time_anchor' in header:
+        return header['time_anchor']
+    reference = header.get('reference_date')
+    if reference is None:
+        return 'default'
+    return 'reference' if reference == DEFAULT_BASE_DATE.isoformat() else None
+
+
+def incomparable_sources(sources):
+    """Why the time axes of the sources' metadata cannot be merged, or None"""
+    anchors = [time_anchor(source.header) for source in sources]
+    stale = [source.original_filename for source, anchor in zip(sources, anchors) if anchor is None]
+    if stale:
+        return f"Stored before times followed the header date, upload again to merge: {', '.join(stale)}"
+    if len(set(anchors)) > 1:
+        return 'Files without a header reference date cannot be lined up in time with files that have one'
+    return None
+
+
+def merged_column_names(tables):
+    """Time columns, then family columns in the order they first appear across sources"""
+    family = set()
+    for table in tables:
+        for config in CHART_CONFIG.values():
+            family.update(match_columns(table.columns, config))
+
+    names = [name for name in TIME_COLUMNS if any(name in table for table in tables)]
+    for table in tables:
+        for name in table.columns:
+            if name in family and name not in names:
+                names.append(name)
+    return names
+
+
+def _sorted_times(table):
+    """Row order sorting the table by time (stable, NaT rows dropped) and the sorted times"""
+    times = np.asarray(table.times())
+    valid = np.flatnonzero(times != NAT)
+    order = valid[np.argsort(times[valid], kind='stable')]
+    return order, times[order]
+
+
+def _keep_masks(spans_times, overlap):
+    """Per source, which sorted rows survive overlap resolution"""
+    count = len(spans_times)
+    ranks = range(count) if overlap == 'last' else range(count - 1, -1, -1)
+    priority = {source: rank for rank, source in enumerate(ranks)}
+
+    masks = []
+    for source, times in enumerate(spans_times):
+        keep = np.ones(len(times), dtype=bool)
+        for other, other_times in enumerate(spans_times):
+            if other == source or priority[other] < priority[source] or not len(other_times):
+                continue
+            # times are sorted, so the covered block is one contiguous slice
+            lo = np.searchsorted(times, other_times[0], side='left')
+            hi = np.searchsorted(times, other_times[-1], side='right')
+            keep[lo:hi] = False
+        masks.append(keep)
+    return masks
+
+
+def merge_tables(tables, overlap='last'):
+    """Merge ColumnTables into one dict of columns sorted by time
+
+    Returns (columns, sources) where columns maps name -> array (datetime as
+    int64 ns) and sources describes the rows each input contributed.
+    """
+    if overlap not in OVERLAP_POLICIES:
+        raise ValueError(f"overlap must be one of {', '.join(OVERLAP_POLICIES)}")
+
+    orders, sorted_times = zip(*(_sorted_times(table) for table in tables))
+    masks = _keep_masks(sorted_times, overlap)
+    rows = [order[mask] for order, mask in zip(orders, masks)]
+    times = [t[mask] for t, mask in zip(sorted_times, masks)]
+
+    # Each input is already sorted, so the stable sort is a k-way merge of runs;
+    # ties between sources cannot happen after overlap resolution
+    all_times = np.concatenate(times)
+    merge_order = np.argsort(all_times, kind='stable')
+    destination = np.empty_like(merge_order)
+    destination[merge_order] = np.arange(len(merge_order))
+
+    total = len(all_times)
+    offsets = np.cumsum([0] + [len(r) for r in rows])
+    names = merged_column_names(tables)
+    columns = {DATETIME_COLUMN: all_times[merge_order]}
+    for name in names:
+        out = np.full(total, np.nan)
+        for table, source_rows, start, stop in zip(tables, rows, offsets[:-1], offsets[1:]):
+            if name in table:
+                out[destination[start:stop]] = table.column(name)[source_rows]
+        columns[name] = out
+
+    source_index = np.empty(total, dtype=np.int16)
+    for index, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:])):
+        source_index[destination[start:stop]] = index
+    columns['source_index'] = source_index
+
+    sources = [{
+        'rows': int(len(table)),
+        'kept_rows': int(len(source_rows)),
+        'dropped_rows': int(len(table) - len(source_rows)),
+    } for table, source_rows in zip(tables, rows)]
+    return columns, sources
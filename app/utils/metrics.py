@@ -0,0 +1,327 @@
+"""
+Stage timing instrumentation and Prometheus text exposition
+
+Each process counts in memory. Once the registry shares a folder, every process
+writes its totals to metrics_<pid>_<token>.json there every few seconds, and
+/api/metrics renders the sum over all files, whichever worker serves the
+scrape. Files of exited workers are folded into metrics_archive.json, so
+counters keep growing when gunicorn recycles a worker.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: exited workers' files are kept rather than folded
+    fcntl = None
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 4e6, 1.6e7, 6.4e7, 2.56e8)
+ROWS_BUCKETS = (10, 100, 1e3, 1e4, 1e5, 1e6, 1e7)
+FLUSH_INTERVAL = 5.0  # seconds between writes of a process' totals to the shared folder
+ARCHIVE_FILENAME = 'metrics_archive.json'
+
+logger = logging.getLogger(__name__)
+
+# Timing record of the request currently being handled (see timing_record)
+_current_record = contextvars.ContextVar('ebas_timing_record', default=None)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labelnames=('stage',)):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {'counts': list(series['counts']), 'sum': series['sum'], 'count': series['count']}
+                    for key, series in self._series.items()}
+
+    @staticmethod
+    def merge(values, other):
+        for key, series in other.items():
+            total = values.setdefault(key, {'counts': [0] * len(series['counts']), 'sum': 0.0, 'count': 0})
+            total['counts'] = [a + b for a, b in zip(total['counts'], series['counts'])]
+            total['sum'] += series['sum']
+            total['count'] += series['count']
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for key, series in sorted((self.snapshot() if values is None else values).items()):
+            for bound, count in zip(self.buckets, series['counts']):
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {series["sum"]!r}')
+            lines.append(f'{self.name}_count{labels} {series["count"]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(values, other):
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for key, value in sorted((self.snapshot() if values is None else values).items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+def _read_values(path):
+    """{metric name: {label key: value}} from a file written by MetricsRegistry.flush"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {name: {tuple(key): value for key, value in series} for name, series in data.items()}
+
+
+def _write_values(path, values):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({name: [[list(key), value] for key, value in series.items()] for name, series in values.items()}, f)
+    os.replace(tmp_path, path)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    """Metrics of this process; with a shared folder, rendered summed over every process using it"""
+
+    def __init__(self):
+        self._metrics = []
+        self.folder = None
+        self._pid = None
+        self._path = None
+        self._flusher = None
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets, labelnames=('stage',)):
+        metric = Histogram(name, help_text, buckets, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def share(self, folder):
+        """Publish this process' totals to folder and render the totals of every process publishing there"""
+        self.folder = folder
+
+    def ensure_flushing(self):
+        """Start this process' flush thread; called per process so it survives forking"""
+        if self.folder is None or (self._pid == os.getpid() and self._flusher is not None):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._flusher is not None:
+                return
+            self._pid = os.getpid()
+            # A fresh name per process: a reused pid must not overwrite an exited worker's totals
+            self._path = os.path.join(self.folder, f'metrics_{self._pid}_{uuid.uuid4().hex[:8]}.json')
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def flush(self):
+        """Write this process' totals to the shared folder"""
+        if self._path is None or self._pid != os.getpid():
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        _write_values(self._path, self.snapshot())
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error(f'Could not write metrics: {str(e)}')
+
+    @contextmanager
+    def _folder_lock(self):
+        with open(os.path.join(self.folder, '.metrics.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def shared_values(self):
+        """Totals over every process publishing to the shared folder, folding those of exited ones"""
+        self.flush()
+        archive_path = os.path.join(self.folder, ARCHIVE_FILENAME)
+        with self._folder_lock():
+            try:
+                archive = _read_values(archive_path)
+            except FileNotFoundError:
+                archive = {}
+            totals = {metric.name: {} for metric in self._metrics}
+            exited = []
+            for name in os.listdir(self.folder):
+                if not (name.startswith('metrics_') and name.endswith('.json')) or name == ARCHIVE_FILENAME:
+                    continue
+                path = os.path.join(self.folder, name)
+                try:
+                    values = _read_values(path)
+                    pid = int(name.split('_')[1])
+                except (FileNotFoundError, ValueError, IndexError, json.JSONDecodeError):
+                    continue
+                live = pid == os.getpid() or fcntl is None or _process_alive(pid)
+                for metric in self._metrics:
+                    metric.merge(totals[metric.name] if live else archive.setdefault(metric.name, {}),
+                                 values.get(metric.name, {}))
+                if not live:
+                    exited.append(path)
+            if exited:
+                # Archive first: a crash in between counts an exited worker twice, never zero times
+                _write_values(archive_path, archive)
+                for path in exited:
+                    os.remove(path)
+        for metric in self._metrics:
+            metric.merge(totals[metric.name], archive.get(metric.name, {}))
+        return totals
+
+    def render_prometheus(self):
+        values = self.shared_values() if self._path is not None else None
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(None if values is None else values[metric.name]))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    'ebas_stage_duration_seconds', 'Time spent in each processing stage', DURATION_BUCKETS)
+STAGE_BYTES = REGISTRY.histogram(
+    'ebas_stage_bytes', 'Bytes read or written by each processing stage', BYTES_BUCKETS)
+STAGE_ROWS = REGISTRY.histogram(
+    'ebas_stage_rows', 'Data rows processed by each processing stage', ROWS_BUCKETS)
+REQUESTS = REGISTRY.counter(
+    'ebas_requests_total', 'Instrumented requests by operation and outcome', ('operation', 'outcome'))
+
+
+@contextmanager
+def timed_stage(stage):
+    """Time a block and record it; callers may set 'rows' and 'bytes' on the yielded dict"""
+    sizes = {}
+    start = time.perf_counter()
+    try:
+        yield sizes
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_DURATION.observe(duration, stage=stage)
+        if sizes.get('bytes') is not None:
+            STAGE_BYTES.observe(sizes['bytes'], stage=stage)
+        if sizes.get('rows') is not None:
+            STAGE_ROWS.observe(sizes['rows'], stage=stage)
+
+        record = _current_record.get()
+        if record is not None:
+            # Stages may run several times per request (e.g. statistics per chart)
+            stages = record['stages']
+            stages[stage] = round(stages.get(stage, 0.0) + duration, 6)
+            for key in ('rows', 'bytes'):
+                if sizes.get(key) is not None:
+                    record[key].setdefault(stage, sizes[key])
+
+
+@contextmanager
+def timing_record(operation, log=None, **fields):
+    """Collect stage timings for one request and log them as a single JSON line"""
+    record = {'operation': operation, 'stages': {}, 'rows': {}, 'bytes': {}, **fields}
+    token = _current_record.set(record)
+    start = time.perf_counter()
+    outcome = 'failed'
+    try:
+        yield record
+        outcome = record.get('outcome', 'completed')
+    finally:
+        _current_record.reset(token)
+        record['outcome'] = outcome
+        record['total_seconds'] = round(time.perf_counter() - start, 6)
+        REQUESTS.inc(operation=operation, outcome=outcome)
+        STAGE_DURATION.observe(record['total_seconds'], stage=f'{operation}_total')
+        (log or logger).info('timing %s', json.dumps(record, default=str))
+
+
+def observe_record(record, log=None):
+    """Fold a timing record produced in another process into this process' metrics and log"""
+    for stage, duration in record['stages'].items():
+        STAGE_DURATION.observe(duration, stage=stage)
+        if record['bytes'].get(stage) is not None:
+            STAGE_BYTES.observe(record['bytes'][stage], stage=stage)
+        if record['rows'].get(stage) is not None:
+            STAGE_ROWS.observe(record['rows'][stage], stage=stage)
+    REQUESTS.inc(operation=record['operation'], outcome=record['outcome'])
+    STAGE_DURATION.observe(record['total_seconds'], stage=f"{record['operation']}_total")
+    (log or logger).info('timing %s', json.dumps(record, default=str))
@@ -0,0 +1,240 @@
+"""
+Upload processing pipeline
+
+store_analysis turns a parsed DataFrame into a stored analysis and
+process_upload runs the whole upload (parse, derived quantities, store) for one
+saved file. Neither needs a Flask context, so batches can run on UploadPool:
+a bounded pool of spawned worker processes, since parsing is mostly
+GIL-bound Python. Workers send their timing record back with the result and
+the request process folds it into its own metrics.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import get_context
+
+from app.models import AnalysisMetadata, AnalysisStorage
+from app.utils.metrics import timed_stage, timing_record
+
+
+def determine_time_period(df):
+    """Determine the time period covered by the data"""
+    import pandas as pd
+
+    try:
+        if 'datetime' in df.columns and not df['datetime'].isna().all():
+            start_time = df['datetime'].min()
+            end_time = df['datetime'].max()
+            if pd.notna(start_time) and pd.notna(end_time):
+                return f"{start_time.strftime('%Y-%m-%d %H:%M')} to {end_time.strftime('%Y-%m-%d %H:%M')}"
+
+        # Fallback to row count
+        return f"{len(df)} time points"
+    except Exception:
+        return f"{len(df)} data points"
+
+
+def header_metadata(df):
+    """Searchable header fields of a parsed file, with the data's own span when the header has no period"""
+    import pandas as pd
+
+    header = dict(df.attrs.get('header') or {})
+    if 'period_start' not in header and 'datetime' in df.columns:
+        start_time, end_time = df['datetime'].min(), df['datetime'].max()
+        if pd.notna(start_time) and pd.notna(end_time):
+            header['period_start'] = start_time.round('s').isoformat()
+            header['period_end'] = end_time.round('s').isoformat()
+    return header
+
+
+def store_analysis(df, unique_id, filename, upload_folder, status="completed", extra_metadata=None):
+    """Build chart data for a parsed DataFrame and persist it as a stored analysis; returns its metadata"""
+    from app.utils.ebas_parser import create_time_labels
+    from app.utils.chart_generator import generate_charts_data
+    from app.utils.column_store import columns_path, save_columns
+    from app.utils.quality import ValidityMask
+
+    with timed_stage('validity') as stage:
+        validity = ValidityMask.from_frame(df)
+        stage['rows'] = len(df)
+
+    # Generate charts data
+    with timed_stage('time_labels') as stage:
+        time_labels = create_time_labels(df)
+        stage['rows'] = len(df)
+    with timed_stage('charts') as stage:
+        charts_data = generate_charts_data(df, unique_id, validity)
+        stage['rows'] = len(df)
+
+    # Save processed data as JSON for the analysis view
+    time_period = determine_time_period(df)
+    with timed_stage('serialize') as stage:
+        analysis_data = {
+            'df_data': df.to_json(orient='records'),
+            'time_labels': time_labels,
+            'charts_data': charts_data,
+            'metadata': {
+                'rows': len(df),
+                'columns': len(df.columns),
+                'time_period': time_period,
+                'original_filename': filename,
+                **(extra_metadata or {})
+            }
+        }
+        payload = json.dumps(analysis_data, ensure_ascii=False, indent=2)
+        stage['rows'] = len(df)
+        stage['bytes'] = len(payload)
+
+    data_path = os.path.join(upload_folder, f"data_{unique_id}.json")
+
+    with timed_stage('storage_write') as stage:
+        with open(data_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        # Columnar copy for merging and other whole-column operations
+        columns_bytes = save_columns(columns_path(upload_folder, unique_id), df, validity)
+        stage['bytes'] = len(payload) + columns_bytes
+
+        # Save analysis metadata
+        metadata = AnalysisMetadata(
+            analysis_id=unique_id,
+            original_filename=filename,
+            creation_date=datetime.now().isoformat(),
+            data_points=len(df),
+            variables=len(df.columns),
+            time_period=time_period,
+            status=status,
+            header=header_metadata(df)
+        )
+
+        storage = AnalysisStorage(upload_folder)
+        storage.save_analysis(metadata)
+
+    with timed_stage('thumbnails') as stage:
+        stage['bytes'] = save_thumbnails(upload_folder, unique_id)
+
+    return metadata
+
+
+def save_thumbnails(upload_folder, unique_id):
+    """Render the history-page previews; returns their total size, 0 if they could not be drawn"""
+    from app.utils.thumbnails import render_thumbnails
+
+    try:
+        return sum(os.path.getsize(path) for path in render_thumbnails(upload_folder, unique_id).values())
+    except Exception as e:
+        # The analysis is complete without its previews; the history page renders them on demand
+        print(f"Error rendering thumbnails: {e}")
+        return 0
+
+
+def save_append_state(file_path, df, unique_id, upload_folder, log=None):
+    """Record where the upload's data ends; returns False if it could not be, leaving the analysis as stored"""
+    from app.utils.append import init_state
+
+    try:
+        init_state(file_path, df, unique_id, upload_folder)
+        return True
+    except Exception as e:
+        # The analysis is complete; only appending a grown copy of the file is unavailable
+        if log:
+            log.error(f'Error saving append state ({unique_id}): {str(e)}')
+        else:
+            print(f"Error saving append state: {e}")
+        return False
+
+
+def process_upload(file_path, unique_id, filename, upload_folder, log=None):
+    """Parse, derive and store one saved upload; the saved file is removed afterwards
+
+    Returns a result dict with 'outcome' ('completed', 'rejected' or 'failed'),
+    the stored metadata or an error message, and the timing record.
+    """
+    from app.utils.ebas_parser import parse_ebas_file
+    from app.utils.size_distribution import add_derived_quantities
+
+    result = {'analysis_id': unique_id, 'filename': filename, 'metadata': None, 'error': None}
+    record = {}
+    try:
+        with timing_record('upload', log=log, analysis_id=unique_id, filename=filename) as record:
+            try:
+                with timed_stage('parse') as stage:
+                    df = parse_ebas_file(file_path)
+                    stage['bytes'] = os.path.getsize(file_path)
+                    stage['rows'] = len(df) if df is not None else 0
+
+                if df is None or df.empty:
+                    record['outcome'] = 'rejected'
+                    result['error'] = 'Could not parse the file or file is empty'
+                    return result
+
+                # Size-distribution quantities from the bin diameters in the header
+                with timed_stage('derived') as stage:
+                    df = add_derived_quantities(df)
+                    stage['rows'] = len(df)
+
+                result['metadata'] = store_analysis(df, unique_id, filename, upload_folder).to_dict()
+                result['columns'] = len(df.columns)
+            except Exception as e:
+                record['outcome'] = 'failed'
+                result['error'] = str(e)
+                return result
+
+            # Where the data ended, so a grown copy of the file can be appended later;
+            # failing that leaves a complete analysis, so the upload still succeeds
+            with timed_stage('append_state') as stage:
+                save_append_state(file_path, df, unique_id, upload_folder, log)
+                stage['rows'] = len(df)
+    finally:
+        result['outcome'] = record.get('outcome', 'failed')
+        result['timing'] = record
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    return result
+
+
+class UploadPool:
+    """Bounded process pool for batch uploads, created on first use in each process"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # spawn, not fork: the request process has threads (retention, server) holding locks
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def map(self, jobs):
+        """Run process_upload for each (file_path, unique_id, filename, upload_folder) job
+
+        Results come back in job order; a job whose worker died is reported as
+        failed without affecting the others.
+        """
+        futures = [self.executor().submit(process_upload, *job) for job in jobs]
+        results = []
+        for job, future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except BrokenProcessPool as e:
+                with self._lock:
+                    self._executor = None
+                results.append(_failed(job, f'Worker process died: {str(e)}'))
+            except Exception as e:
+                results.append(_failed(job, str(e)))
+        return results
+
+
+def _failed(job, error):
+    file_path, unique_id, filename, _ = job
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    return {'analysis_id': unique_id, 'filename': filename, 'metadata': None,
+            'error': error, 'outcome': 'failed', 'timing': None}
@@ -0,0 +1,194 @@
+"""
+Opt-in request profiling with pstats and flamegraph output
+
+Profiling runs when PROFILING_ENABLED is set, or per request when the
+X-Profile-Token header carries a valid signature made with PROFILING_SECRET.
+When neither applies the wrapped view is called directly. Listing and
+downloading profiles always takes a valid signature, even with profiling
+enabled for every request.
+"""
+import cProfile
+import functools
+import hashlib
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+
+PROFILE_HEADER = 'X-Profile-Token'
+TOKEN_MAX_AGE = 300  # seconds
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_SUFFIXES = ('.pstats', '.speedscope.json', '.folded')
+
+
+def make_profile_token(secret, now=None):
+    """Build a header value '<timestamp>.<hmac>' that enables profiling for one request"""
+    timestamp = str(int(now if now is not None else time.time()))
+    signature = hmac.new(secret.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+    return f"{timestamp}.{signature}"
+
+
+def profile_token_valid(token, secret, max_age=TOKEN_MAX_AGE, now=None):
+    if not token or not secret or '.' not in token:
+        return False
+    timestamp, signature = token.split('.', 1)
+    if not timestamp.isdigit():
+        return False
+    now = now if now is not None else time.time()
+    if abs(now - int(timestamp)) > max_age:
+        return False
+    expected = hmac.new(secret.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def signed_request():
+    """True when the request carries a valid token for PROFILING_SECRET"""
+    secret = current_app.config.get('PROFILING_SECRET')
+    return bool(secret) and profile_token_valid(request.headers.get(PROFILE_HEADER), secret)
+
+
+def profiling_requested():
+    return bool(current_app.config.get('PROFILING_ENABLED')) or signed_request()
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval for flamegraph output"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _speedscope_document(name, stacks, interval):
+    frames = []
+    frame_index = {}
+    samples = []
+    weights = []
+    for stack, count in stacks.items():
+        indices = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+            indices.append(frame_index[frame])
+        samples.append(indices)
+        weights.append(count * interval)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'ebas-profiling',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
+
+
+def _folded_lines(stacks):
+    """Brendan Gregg's folded format, readable by flamegraph.pl and speedscope"""
+    for stack, count in stacks.items():
+        names = ';'.join(f"{name} ({os.path.basename(filename)}:{line})" for name, filename, line in stack)
+        yield f"{names} {count}\n"
+
+
+def save_profile(folder, endpoint, analysis_id, profiler, sampler):
+    os.makedirs(folder, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    base = os.path.join(folder, f"{stamp}_{endpoint}_{analysis_id or 'none'}")
+
+    profiler.dump_stats(base + '.pstats')
+    with open(base + '.speedscope.json', 'w', encoding='utf-8') as f:
+        json.dump(_speedscope_document(os.path.basename(base), sampler.stacks, sampler.interval), f)
+    with open(base + '.folded', 'w', encoding='utf-8') as f:
+        f.writelines(_folded_lines(sampler.stacks))
+    return base
+
+
+def profiled(view):
+    """Wrap a view so opted-in requests are profiled and saved under PROFILE_FOLDER"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profiling_requested():
+            return view(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+        profiler.enable()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            profiler.disable()
+            sampler.stop()
+            analysis_id = kwargs.get('analysis_id') or g.get('analysis_id')
+            try:
+                base = save_profile(current_app.config['PROFILE_FOLDER'], request.endpoint.split('.')[-1],
+                                    analysis_id, profiler, sampler)
+                current_app.logger.info(f'Profile saved: {base}')
+            except OSError as e:
+                current_app.logger.error(f'Could not save profile: {str(e)}')
+
+    return wrapper
+
+
+_PROFILE_NAME = re.compile(r'^(\d{8}T\d{12})_([a-z_]+)_([0-9a-f-]+|none)$')
+
+
+def list_profiles(folder, limit=50):
+    """Most recent profiles first, one entry per profiled request"""
+    if not os.path.isdir(folder):
+        return []
+
+    profiles = {}
+    for filename in os.listdir(folder):
+        suffix = next((s for s in PROFILE_SUFFIXES if filename.endswith(s)), None)
+        if suffix is None:
+            continue
+        base = filename[:-len(suffix)]
+        match = _PROFILE_NAME.match(base)
+        if not match:
+            continue
+        entry = profiles.setdefault(base, {
+            'name': base,
+            'created': datetime.strptime(match.group(1), '%Y%m%dT%H%M%S%f').isoformat(),
+            'endpoint': match.group(2),
+            'analysis_id': None if match.group(3) == 'none' else match.group(3),
+            'files': [],
+            'bytes': 0,
+        })
+        entry['files'].append(filename)
+        entry['bytes'] += os.path.getsize(os.path.join(folder, filename))
+
+    return sorted(profiles.values(), key=lambda p: p['name'], reverse=True)[:limit]
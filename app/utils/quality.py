@@ -0,0 +1,152 @@
+"""
+Validity masks decoded from EBAS flag columns
+
+A flag value packs up to three 3-digit EBAS flag codes into its decimals
+(0.456 is flag 456, 0.147456 is flags 147 and 456). A value is invalid when any
+of its codes is in INVALID_FLAGS or is a 9xx missing/hidden code. Validity is
+kept as one bit per (variable, row) with np.packbits, built once at ingest.
+"""
+import base64
+import re
+
+import numpy as np
+
+# EBAS flags that invalidate a value, besides the 9xx missing codes
+INVALID_FLAGS = frozenset({
+    256,  # Invalidated by database co-ordinator
+    456,  # Invalidated by data originator
+    457,  # Extremely high value, outside four times standard deviation in a lognormal distribution
+    459,  # Extreme value, unspecified error
+    460,  # Contamination suspected
+    599,  # Unspecified contamination or local influence
+    659,  # Unspecified sampling anomaly
+    699,  # Mechanical problem, unspecified reason
+})
+MISSING_FLAG_MIN = 900
+FLAG_PREFIX = 'flag_'
+
+# Derived per-bin columns share the flags of their bin
+_DERIVED_BIN = re.compile(r'^d[SV]_(bin_\d+)$')
+# Integrated quantities depend on every bin of the distribution
+_DERIVED_TOTAL = re.compile(r'^(N|S|V)_total$|^N_(nucleation|aitken|accumulation)$|^Dp_\w+$')
+
+
+def decode_flags(values):
+    """Flag column values -> (rows x 3) int array of flag codes, 0 where unset"""
+    scaled = np.rint(np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0) * 1e9).astype(np.int64)
+    return np.stack([scaled // 1_000_000 % 1000, scaled // 1000 % 1000, scaled % 1000], axis=1)
+
+
+def flags_valid(values):
+    """True where none of the packed flag codes invalidates the value"""
+    codes = decode_flags(values)
+    invalid = (codes >= MISSING_FLAG_MIN) | np.isin(codes, list(INVALID_FLAGS))
+    return ~invalid.any(axis=1)
+
+
+def flag_sources(columns):
+    """Map each flagged variable to the flag columns that decide its validity"""
+    columns = list(columns)
+    present = set(columns)
+    bin_flags = sorted(col for col in columns if re.match(r'^flag_bin_\d+$', col))
+    sources = {}
+    for col in columns:
+        if col.startswith(FLAG_PREFIX):
+            continue
+        if f'{FLAG_PREFIX}{col}' in present:
+            sources[col] = [f'{FLAG_PREFIX}{col}']
+            continue
+        match = _DERIVED_BIN.match(col)
+        if match and f'{FLAG_PREFIX}{match.group(1)}' in present:
+            sources[col] = [f'{FLAG_PREFIX}{match.group(1)}']
+        elif _DERIVED_TOTAL.match(col) and bin_flags:
+            sources[col] = bin_flags
+    return sources
+
+
+class ValidityMask:
+    """Bit-packed validity per variable; variables without flags are always valid"""
+
+    def __init__(self, names, packed, n_rows):
+        self.names = list(names)
+        self.packed = packed
+        self.n_rows = n_rows
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_frame(cls, df):
+        sources = flag_sources(df.columns)
+        decoded = {}
+        names, rows = [], []
+        for name, flag_columns in sources.items():
+            valid = np.ones(len(df), dtype=bool)
+            for flag_column in flag_columns:
+                if flag_column not in decoded:
+                    decoded[flag_column] = flags_valid(df[flag_column].to_numpy())
+                valid &= decoded[flag_column]
+            names.append(name)
+            rows.append(valid)
+        matrix = np.vstack(rows) if rows else np.empty((0, len(df)), dtype=bool)
+        return cls(names, np.packbits(matrix, axis=1), len(df))
+
+    @classmethod
+    def concat(cls, masks):
+        """One mask over the rows of consecutive masks for the same variables"""
+        rows = [np.unpackbits(mask.packed, axis=1, count=mask.n_rows) for mask in masks]
+        return cls(masks[0].names, np.packbits(np.hstack(rows), axis=1), sum(mask.n_rows for mask in masks))
+
+    def column(self, name, start=0, stop=None):
+        """Boolean validity of one variable (rows start:stop), or None if it has no flags"""
+        i = self._index.get(name)
+        if i is None:
+            return None
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        # Unpack only the bytes covering the requested rows
+        first = start // 8
+        bits = np.unpackbits(self.packed[i, first:(stop + 7) // 8])
+        return bits[start - first * 8:stop - first * 8].view(bool)
+
+    def encode(self, columns):
+        """Base64 bits, variable-major, for the analysis page; None if every value is valid"""
+        matrix = np.ones((len(columns), self.n_rows), dtype=bool)
+        for j, name in enumerate(columns):
+            valid = self.column(name)
+            if valid is not None:
+                matrix[j] = valid
+        if matrix.all():
+            return None
+        return _encode_matrix(matrix)
+
+
+def _encode_matrix(matrix):
+    return {
+        'rows': matrix.shape[1],
+        'columns': matrix.shape[0],
+        'bits': base64.b64encode(np.packbits(matrix.ravel()).tobytes()).decode('ascii'),
+    }
+
+
+def concat_encoded(parts, n_columns):
+    """Join encode() results of consecutive row ranges, given as (encoded or None, rows) pairs"""
+    if all(encoded is None for encoded, _ in parts):
+        return None
+    blocks = []
+    for encoded, rows in parts:
+        if encoded is None:
+            blocks.append(np.ones((n_columns, rows), dtype=bool))
+        else:
+            bits = np.unpackbits(np.frombuffer(base64.b64decode(encoded['bits']), dtype=np.uint8),
+                                 count=n_columns * rows)
+            blocks.append(bits.reshape(n_columns, rows).view(bool))
+    return _encode_matrix(np.hstack(blocks))
+
+
+def slice_encoded(encoded, n_columns, start):
+    """An encode() result restricted to its rows from start on; None (all valid) stays None"""
+    if encoded is None or start <= 0:
+        return encoded
+    rows = encoded['rows']
+    bits = np.unpackbits(np.frombuffer(base64.b64decode(encoded['bits']), dtype=np.uint8),
+                         count=n_columns * rows)
+    matrix = bits.reshape(n_columns, rows)[:, start:].view(bool)
+    return _encode_matrix(matrix) if not matrix.all() else None
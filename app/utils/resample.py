@@ -0,0 +1,270 @@
+"""
+Time resampling of stored analyses
+
+Rows are assigned to fixed-width buckets aligned to the epoch (so '1d' buckets
+start at midnight) and every aggregate is computed for all buckets at once with
+reduceat over the bucket-sorted column matrix. Results are cached on disk as
+resample_<id>_<version>_<key>.npz next to the analysis, so retention removes
+them with the analysis. <version> follows the column files, which appends
+change; writing a result removes those of older versions and keeps at most
+MAX_CACHED per analysis.
+"""
+import hashlib
+import os
+import re
+
+import numpy as np
+
+from app.utils.column_store import columns_version
+from app.utils.config import CHART_CONFIG
+from app.utils.ebas_parser import match_columns
+from app.utils.quality import decode_flags, flag_sources
+
+FREQ_UNITS = {
+    's': 10 ** 9,
+    'min': 60 * 10 ** 9,
+    'h': 3600 * 10 ** 9,
+    'd': 86400 * 10 ** 9,
+    'w': 7 * 86400 * 10 ** 9,
+}
+BASIC_AGGREGATES = ('mean', 'min', 'max', 'sum', 'count', 'std', 'median', 'flag_fraction')
+MAX_BUCKETS = 1_000_000
+MAX_CACHED = 16  # cached results per analysis
+
+_FREQ = re.compile(r'^(\d*)(s|min|h|d|w)$')
+_PERCENTILE = re.compile(r'^p(\d{1,2}(?:\.\d+)?)$')
+
+
+def parse_freq(freq):
+    """'15min', '1h', 'd' -> bucket width in nanoseconds"""
+    match = _FREQ.match((freq or '').strip().lower())
+    if not match:
+        raise ValueError(f"Unsupported freq '{freq}'; use e.g. 30s, 15min, 1h, 1d or 1w")
+    count = int(match.group(1) or 1)
+    if count <= 0:
+        raise ValueError('freq must be positive')
+    return count * FREQ_UNITS[match.group(2)]
+
+
+def parse_aggregates(agg):
+    """'mean,max,p95' -> ['mean', 'max', 'p95'], validated and de-duplicated"""
+    names = [name.strip().lower() for name in (agg or 'mean').split(',') if name.strip()]
+    for name in names:
+        if name not in BASIC_AGGREGATES and not _PERCENTILE.match(name):
+            raise ValueError(f"Unsupported aggregate '{name}'; use {', '.join(BASIC_AGGREGATES)} or pNN")
+    return list(dict.fromkeys(names))
+
+
+def select_columns(names, families=None):
+    """Columns of the requested CHART_CONFIG families (all families by default)"""
+    chart_ids = families or list(CHART_CONFIG)
+    unknown = [chart_id for chart_id in chart_ids if chart_id not in CHART_CONFIG]
+    if unknown:
+        raise ValueError(f"Unknown column family: {', '.join(unknown)}")
+    selected = []
+    for chart_id in chart_ids:
+        for name in match_columns(names, CHART_CONFIG[chart_id]):
+            if name not in selected:
+                selected.append(name)
+    return selected
+
+
+def _group_quantile(values, starts, counts, q):
+    """Per-bucket linear-interpolated quantile of one column, NaN-aware"""
+    group = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(values))))
+    # lexsort puts NaN last within each bucket, so the first counts[g] entries are the valid values
+    ordered = values[np.lexsort((values, group))]
+    position = starts + q * np.maximum(counts - 1, 0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, starts + np.maximum(counts - 1, 0))
+    fraction = position - lower
+    result = ordered[lower] + (ordered[upper] - ordered[lower]) * fraction
+    result[counts == 0] = np.nan
+    return result
+
+
+def _flag_fraction(table, columns, rows, starts, rows_per_bucket):
+    """Per-bucket fraction of rows whose flags are set, NaN for columns without flags
+
+    rows indexes the table in bucket order. A column's flags are those
+    flag_sources assigns it (its flag_<col>, its bin's, or every bin's for
+    integrated quantities); a row counts when any of them holds a non-zero code,
+    which includes every invalidating one.
+    """
+    sources = flag_sources(table.columns)
+    flagged_by = {}
+    result = np.full((len(starts), len(columns)), np.nan)
+    for j, name in enumerate(columns):
+        if name not in sources:
+            continue
+        flagged = np.zeros(len(rows), dtype=bool)
+        for flag_column in sources[name]:
+            if flag_column not in flagged_by:
+                codes = decode_flags(np.asarray(table.column(flag_column), dtype=np.float64)[rows])
+                flagged_by[flag_column] = (codes != 0).any(axis=1)
+            flagged |= flagged_by[flag_column]
+        result[:, j] = np.add.reduceat(flagged, starts) / rows_per_bucket
+    return result
+
+
+def resample_table(table, freq_ns, aggregates, columns, valid_only=False):
+    """Aggregate columns of a ColumnTable into freq_ns buckets
+
+    With valid_only, values flagged invalid in the table's validity mask are
+    treated as missing. Returns (bucket_starts_ns, rows_per_bucket,
+    {aggregate: matrix[bucket, column]}).
+    """
+    times = np.asarray(table.times())
+    valid = times != np.iinfo(np.int64).min
+    buckets = times[valid] // freq_ns
+    if len(buckets) and (buckets.max() - buckets.min()) > MAX_BUCKETS:
+        raise ValueError('freq is too fine for the time span of this analysis')
+
+    order = np.argsort(buckets, kind='stable')
+    buckets = buckets[order]
+    boundaries = np.flatnonzero(np.diff(buckets)) + 1
+    starts = np.concatenate(([0], boundaries)) if len(buckets) else np.array([], dtype=np.int64)
+    rows_per_bucket = np.diff(np.append(starts, len(buckets)))
+
+    matrix = np.empty((len(buckets), len(columns)))
+    validity = table.validity if valid_only else None
+    for j, name in enumerate(columns):
+        matrix[:, j] = table.column(name)[valid][order]
+        column_valid = validity.column(name) if validity is not None else None
+        if column_valid is not None:
+            # Masked in place in the bucket-sorted copy that is built anyway
+            matrix[~column_valid[valid][order], j] = np.nan
+
+    if not len(starts):
+        empty = np.empty((0, len(columns)))
+        return np.array([], dtype=np.int64), rows_per_bucket, {name: empty for name in aggregates}
+
+    result = {}
+    present = ~np.isnan(matrix)
+    counts = np.add.reduceat(present, starts, axis=0)
+    sums = np.add.reduceat(np.where(present, matrix, 0.0), starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+        for name in aggregates:
+            if name == 'mean':
+                result[name] = means
+            elif name == 'sum':
+                result[name] = np.where(counts > 0, sums, np.nan)
+            elif name == 'count':
+                result[name] = counts.astype(np.float64)
+            elif name == 'min':
+                result[name] = np.fmin.reduceat(matrix, starts, axis=0)
+            elif name == 'max':
+                result[name] = np.fmax.reduceat(matrix, starts, axis=0)
+            elif name == 'std':
+                squares = np.add.reduceat(np.where(present, matrix, 0.0) ** 2, starts, axis=0)
+                result[name] = np.sqrt(np.maximum(squares / counts - means ** 2, 0.0))
+            elif name == 'flag_fraction':
+                rows = np.flatnonzero(valid)[order]
+                result[name] = _flag_fraction(table, columns, rows, starts, rows_per_bucket)
+            else:
+                q = 0.5 if name == 'median' else float(_PERCENTILE.match(name).group(1)) / 100
+                result[name] = np.column_stack([
+                    _group_quantile(matrix[:, j], starts, counts[:, j], q) for j in range(len(columns))
+                ]) if columns else np.empty((len(starts), 0))
+
+    return buckets[starts] * freq_ns, rows_per_bucket, result
+
+
+def cache_path(storage_path, analysis_id, freq_ns, aggregates, columns, valid_only=False):
+    version = hashlib.sha1(columns_version(storage_path, analysis_id).encode()).hexdigest()[:8]
+    key = f"{freq_ns}|{','.join(aggregates)}|{','.join(columns)}|{int(valid_only)}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(storage_path, f"resample_{analysis_id}_{version}_{digest}.npz")
+
+
+def save_result(path, bucket_starts, rows_per_bucket, aggregates, columns):
+    arrays = {f"agg_{name}": matrix for name, matrix in aggregates.items()}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, time=bucket_starts, rows=rows_per_bucket, columns=np.array(columns, dtype=str), **arrays)
+    os.replace(tmp_path, path)
+    prune_cache(path)
+
+
+def prune_cache(path):
+    """Remove the analysis' results cached for other column versions, then the oldest beyond MAX_CACHED"""
+    storage_path, name = os.path.split(path)
+    version_prefix = name.rsplit('_', 1)[0] + '_'
+    analysis_prefix = version_prefix.rsplit('_', 2)[0] + '_'
+    current = []
+    with os.scandir(storage_path) as entries:
+        for entry in entries:
+            if not entry.name.startswith(analysis_prefix) or not entry.name.endswith('.npz'):
+                continue
+            try:
+                if entry.name == name:
+                    continue
+                if entry.name.startswith(version_prefix):
+                    current.append((entry.stat().st_mtime, entry.path))
+                else:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # Pruned by a concurrent request
+                continue
+    current.sort(reverse=True)
+    # The result just written counts towards MAX_CACHED
+    for _, stale in current[MAX_CACHED - 1:]:
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            continue
+
+
+def load_result(path, aggregates):
+    with np.load(path, allow_pickle=False) as archive:
+        return archive['time'], archive['rows'], {name: archive[f"agg_{name}"] for name in aggregates}
+
+
+def _time_labels(bucket_starts):
+    return np.datetime_as_string(bucket_starts.astype('datetime64[ns]'), unit='m').tolist()
+
+
+def _json_values(values):
+    return [None if np.isnan(v) else round(float(v), 6) for v in values]
+
+
+def chart_payload(bucket_starts, rows_per_bucket, aggregates, columns):
+    """Line-chart payload per aggregate, in the x_data/y_data shape of charts_data"""
+    labels = [label.replace('T', ' ') for label in _time_labels(bucket_starts)]
+    return {
+        'time_labels': labels,
+        'rows_per_bucket': rows_per_bucket.tolist(),
+        'charts': {
+            name: {
+                'x_data': list(range(len(labels))),
+                'y_data': {column: _json_values(matrix[:, j]) for j, column in enumerate(columns)},
+            }
+            for name, matrix in aggregates.items()
+        },
+    }
+
+
+def iter_csv(bucket_starts, rows_per_bucket, aggregates, columns, chunk_rows=1000):
+    """CSV text in chunks: one row per bucket, one '<column>_<aggregate>' field per pair"""
+    header = ['time', 'rows'] + [f"{column}_{name}" for column in columns for name in aggregates]
+    yield ','.join(header) + '\n'
+    labels = _time_labels(bucket_starts)
+    # Interleave to the header order: column-major over aggregates
+    stacked = np.stack([aggregates[name] for name in aggregates], axis=2).reshape(len(labels), -1) \
+        if aggregates and columns else np.empty((len(labels), 0))
+    for start in range(0, len(labels), chunk_rows):
+        lines = []
+        for i in range(start, min(start + chunk_rows, len(labels))):
+            values = ','.join('' if np.isnan(v) else repr(float(v)) for v in stacked[i])
+            lines.append(f"{labels[i]},{rows_per_bucket[i]},{values}" if values else f"{labels[i]},{rows_per_bucket[i]}")
+        yield '\n'.join(lines) + '\n'
+
+
+def to_frame(bucket_starts, rows_per_bucket, aggregates, columns):
+    import pandas as pd
+    data = {'time': pd.to_datetime(bucket_starts, unit='ns'), 'rows': rows_per_bucket}
+    for j, column in enumerate(columns):
+        for name, matrix in aggregates.items():
+            data[f"{column}_{name}"] = matrix[:, j]
+    return pd.DataFrame(data)
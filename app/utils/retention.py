@@ -0,0 +1,259 @@
+"""
+Background retention of stored analyses
+
+Enforces age, count and total-size quotas on the upload folder. Every file whose
+name carries an analysis id (data_<id>.json, analysis_<id>.html, leftover
+<id>_<upload> files, ...) is treated as an artifact of that analysis, so removing
+an analysis removes all of them, and files whose id is missing from the metadata
+are reclaimed as orphans.
+"""
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app.utils.metrics import REGISTRY
+
+# A whole id token: not part of a longer run of hex digits or dashes
+ANALYSIS_ID = re.compile(r'(?<![0-9a-f-])[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?![0-9a-f-])')
+STATUS_FILENAME = 'retention_status.json'
+BATCH_SIZE = 100
+BATCH_PAUSE = 0.01  # seconds between delete batches, keeps disk I/O from starving requests
+ORPHAN_GRACE = 600  # seconds; uploads write their files before the metadata entry
+
+RECLAIMED_BYTES = REGISTRY.counter(
+    'ebas_retention_reclaimed_bytes_total', 'Bytes deleted by retention runs', ('reason',))
+REMOVED_ANALYSES = REGISTRY.counter(
+    'ebas_retention_removed_analyses_total', 'Analyses or orphan groups deleted by retention runs', ('reason',))
+
+
+class RetentionPolicy:
+    def __init__(self, max_age_days=None, max_count=None, max_bytes=None):
+        self.max_age_days = max_age_days
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(max_age_days=config.get('RETENTION_MAX_AGE_DAYS'),
+                   max_count=config.get('RETENTION_MAX_ANALYSES'),
+                   max_bytes=config.get('RETENTION_MAX_BYTES'))
+
+    def to_dict(self):
+        return {'max_age_days': self.max_age_days, 'max_count': self.max_count, 'max_bytes': self.max_bytes}
+
+
+def is_analysis_id(value):
+    """True only for a complete analysis id, so no request can select other files by a fragment"""
+    return isinstance(value, str) and ANALYSIS_ID.fullmatch(value) is not None
+
+
+def artifact_id(name):
+    """The analysis id a file is named after (its first id token), or None"""
+    match = ANALYSIS_ID.search(name)
+    return match.group(0) if match else None
+
+
+def scan_artifacts(storage_path):
+    """Map analysis id -> list of (path, size, mtime) for every file named after it"""
+    artifacts = {}
+    with os.scandir(storage_path) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            analysis_id = artifact_id(entry.name)
+            if analysis_id is None:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            artifacts.setdefault(analysis_id, []).append((entry.path, stat.st_size, stat.st_mtime))
+    return artifacts
+
+
+def analysis_artifacts(storage_path, analysis_id):
+    """Paths of all files belonging to one analysis; none for anything but a complete id"""
+    if not is_analysis_id(analysis_id):
+        return []
+    return [os.path.join(storage_path, name) for name in os.listdir(storage_path)
+            if artifact_id(name) == analysis_id]
+
+
+def remove_files(paths, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Delete paths in batches; return bytes reclaimed"""
+    reclaimed = 0
+    for start in range(0, len(paths), batch_size):
+        for path in paths[start:start + batch_size]:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                reclaimed += size
+            except FileNotFoundError:
+                continue
+        if pause and start + batch_size < len(paths):
+            time.sleep(pause)
+    return reclaimed
+
+
+def _creation_time(entry):
+    try:
+        return datetime.fromisoformat(entry['creation_date'])
+    except (KeyError, TypeError, ValueError):
+        return datetime.min
+
+
+def select_expired(metadata_list, artifacts, policy, now=None):
+    """Return {analysis_id: reason} for entries that break the age, count or size quota"""
+    now = now or datetime.now()
+    newest_first = sorted(metadata_list, key=_creation_time, reverse=True)
+    expired = {}
+
+    if policy.max_age_days is not None:
+        cutoff = now - timedelta(days=policy.max_age_days)
+        for entry in newest_first:
+            if _creation_time(entry) <= cutoff:
+                expired[entry['analysis_id']] = 'age'
+
+    remaining = [entry for entry in newest_first if entry['analysis_id'] not in expired]
+    if policy.max_count is not None:
+        for entry in remaining[policy.max_count:]:
+            expired[entry['analysis_id']] = 'count'
+        remaining = remaining[:policy.max_count]
+
+    if policy.max_bytes is not None:
+        total = 0
+        for entry in remaining:
+            total += sum(size for _, size, _ in artifacts.get(entry['analysis_id'], ()))
+            if total > policy.max_bytes:
+                expired[entry['analysis_id']] = 'bytes'
+
+    return expired
+
+
+def enforce_retention(storage, policy, batch_size=BATCH_SIZE, orphan_grace=ORPHAN_GRACE):
+    """Apply policy to storage, reconcile orphans and return a report of what was reclaimed"""
+    started = time.perf_counter()
+    artifacts = scan_artifacts(storage.storage_path)
+
+    # Drop metadata first so no page links to an analysis whose files are half gone. Unreadable
+    # metadata raises instead of reading as empty, which would make every analysis an orphan
+    with storage.metadata_lock():
+        metadata_list = storage._load_metadata(strict=True)
+        expired = select_expired(metadata_list, artifacts, policy)
+        if expired:
+            storage._save_metadata([entry for entry in metadata_list if entry['analysis_id'] not in expired])
+        known = {entry['analysis_id'] for entry in metadata_list}
+
+    cutoff = time.time() - orphan_grace
+    orphans = [analysis_id for analysis_id, files in artifacts.items()
+               if analysis_id not in known and all(mtime < cutoff for _, _, mtime in files)]
+
+    groups = {'orphan': orphans}
+    for analysis_id, reason in expired.items():
+        groups.setdefault(reason, []).append(analysis_id)
+
+    reclaimed = {}
+    for reason, ids in groups.items():
+        if not ids:
+            continue
+        paths = [path for analysis_id in ids for path, _, _ in artifacts.get(analysis_id, ())]
+        reclaimed[reason] = remove_files(paths, batch_size)
+        RECLAIMED_BYTES.inc(reclaimed[reason], reason=reason)
+        REMOVED_ANALYSES.inc(len(ids), reason=reason)
+
+    return {
+        'finished': datetime.now().isoformat(),
+        'duration_seconds': round(time.perf_counter() - started, 3),
+        'policy': policy.to_dict(),
+        'removed_analyses': len(expired),
+        'removed_orphans': len(orphans),
+        'removed_by_reason': {reason: len(ids) for reason, ids in groups.items() if reason != 'orphan'},
+        'reclaimed_bytes': sum(reclaimed.values()),
+        'reclaimed_by_reason': reclaimed,
+    }
+
+
+def write_status(storage_path, report):
+    """Persist the last report so every worker process can serve it"""
+    status = read_status(storage_path)
+    status['last_run'] = report
+    status['runs'] = status.get('runs', 0) + 1
+    status['total_reclaimed_bytes'] = status.get('total_reclaimed_bytes', 0) + report['reclaimed_bytes']
+    tmp_path = os.path.join(storage_path, f'.{STATUS_FILENAME}.{os.getpid()}')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, indent=2)
+    os.replace(tmp_path, os.path.join(storage_path, STATUS_FILENAME))
+
+
+def read_status(storage_path):
+    try:
+        with open(os.path.join(storage_path, STATUS_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+class RetentionScheduler:
+    """Runs retention on a daemon thread at a fixed interval or when triggered
+
+    The thread is started lazily from the first request in each process so it
+    survives gunicorn's fork of a preloaded app; a file lock in the storage keeps
+    concurrent workers from running the same pass twice. With interval None it
+    only runs triggered passes.
+    """
+
+    def __init__(self, storage_factory, policy, interval, logger=None):
+        self.storage_factory = storage_factory
+        self.policy = policy
+        self.interval = interval
+        self.logger = logger
+        self._pid = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+            self._thread.start()
+
+    def trigger(self, policy=None):
+        """Queue a run (optionally with a one-off policy) and return immediately"""
+        with self._lock:
+            self._pending.append(policy or self.policy)
+        self.ensure_started()
+        self._wakeup.set()
+
+    def run_once(self, policy=None):
+        storage = self.storage_factory()
+        with storage.retention_lock(blocking=False) as acquired:
+            if not acquired:
+                return None
+            report = enforce_retention(storage, policy or self.policy)
+            write_status(storage.storage_path, report)
+        if self.logger:
+            self.logger.info(f"Retention reclaimed {report['reclaimed_bytes']} bytes "
+                             f"({report['removed_analyses']} analyses, {report['removed_orphans']} orphans)")
+        return report
+
+    def _run(self):
+        # First pass right away reconciles whatever accumulated while the app was down
+        while True:
+            with self._lock:
+                policies = self._pending or ([self.policy] if self.interval is not None else [])
+                self._pending = []
+            for policy in policies:
+                try:
+                    self.run_once(policy)
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f'Retention error: {str(e)}')
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
@@ -0,0 +1,169 @@
+"""
+Statistics that grow chunk by chunk
+
+RunningStats keeps the count, mean and sum of squared deviations (merged with
+Chan et al.'s pairwise update) plus min and max, so adding rows to an analysis
+costs only the new rows. Percentiles come from QuantileSketch, a DDSketch-style
+histogram over logarithmic buckets: every quantile is within RELATIVE_ACCURACY
+of a true value, and two sketches merge by adding their bucket counts.
+"""
+import numpy as np
+
+RELATIVE_ACCURACY = 0.01
+MAX_BUCKETS = 2048
+# Magnitudes below this count as zero; they have no useful logarithm
+MIN_MAGNITUDE = 1e-12
+DEFAULT_STATS = {"min": 0, "max": 100, "mean": 50, "std": 25}
+
+
+def _merge_buckets(offset, counts, other_offset, other_counts):
+    """Sum two dense (first key, counts) bucket ranges; the lowest keys collapse beyond MAX_BUCKETS"""
+    if not len(counts):
+        offset, counts = other_offset, other_counts.copy()
+    elif len(other_counts):
+        low = min(offset, other_offset)
+        high = max(offset + len(counts), other_offset + len(other_counts))
+        merged = np.zeros(high - low, dtype=np.int64)
+        merged[offset - low:offset - low + len(counts)] += counts
+        merged[other_offset - low:other_offset - low + len(other_counts)] += other_counts
+        offset, counts = low, merged
+    if len(counts) > MAX_BUCKETS:
+        extra = len(counts) - MAX_BUCKETS
+        collapsed = counts[extra:].copy()
+        collapsed[0] += counts[:extra].sum()
+        offset, counts = offset + extra, collapsed
+    return offset, counts
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.zero_count = 0
+        # Dense counts per bucket key, for positive values and for magnitudes of negative ones
+        self.positive = (0, np.zeros(0, dtype=np.int64))
+        self.negative = (0, np.zeros(0, dtype=np.int64))
+
+    @property
+    def count(self):
+        return self.zero_count + int(self.positive[1].sum()) + int(self.negative[1].sum())
+
+    def _buckets(self, magnitudes):
+        if not len(magnitudes):
+            return 0, np.zeros(0, dtype=np.int64)
+        keys = np.ceil(np.log(magnitudes) / np.log(self.gamma)).astype(np.int64)
+        low = int(keys.min())
+        return low, np.bincount(keys - low).astype(np.int64)
+
+    def add(self, values):
+        """Add finite values"""
+        values = np.asarray(values, dtype=np.float64)
+        small = np.abs(values) < MIN_MAGNITUDE
+        self.zero_count += int(small.sum())
+        self.positive = _merge_buckets(*self.positive, *self._buckets(values[~small & (values > 0)]))
+        self.negative = _merge_buckets(*self.negative, *self._buckets(-values[~small & (values < 0)]))
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Sketches with different accuracy cannot be merged')
+        self.zero_count += other.zero_count
+        self.positive = _merge_buckets(*self.positive, *other.positive)
+        self.negative = _merge_buckets(*self.negative, *other.negative)
+
+    def _values(self, buckets):
+        offset, counts = buckets
+        # Bucket k holds (gamma^(k-1), gamma^k]; this estimate is within the relative accuracy of both ends
+        return 2 * self.gamma ** np.arange(offset, offset + len(counts)) / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Value at quantile q (0..1), or None for an empty sketch"""
+        total = self.count
+        if not total:
+            return None
+        counts = np.concatenate((self.negative[1][::-1], [self.zero_count], self.positive[1]))
+        values = np.concatenate((-self._values(self.negative)[::-1], [0.0], self._values(self.positive)))
+        index = np.searchsorted(np.cumsum(counts), q * (total - 1), side='right')
+        return float(values[min(index, len(values) - 1)])
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'zero': self.zero_count,
+            'positive': {'offset': int(self.positive[0]), 'counts': self.positive[1].tolist()},
+            'negative': {'offset': int(self.negative[0]), 'counts': self.negative[1].tolist()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'])
+        sketch.zero_count = data['zero']
+        for name in ('positive', 'negative'):
+            buckets = data[name]
+            setattr(sketch, name, (buckets['offset'], np.array(buckets['counts'], dtype=np.int64)))
+        return sketch
+
+
+class RunningStats:
+    """Count, mean, std, min, max and sketch percentiles of every finite value added"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch()
+
+    @classmethod
+    def of(cls, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        stats = cls()
+        if len(values):
+            stats.count = len(values)
+            stats.mean = float(values.mean())
+            stats.m2 = float(((values - stats.mean) ** 2).sum())
+            stats.min, stats.max = float(values.min()), float(values.max())
+            stats.sketch.add(values)
+        return stats
+
+    def update(self, values):
+        self.merge(RunningStats.of(values))
+
+    def merge(self, other):
+        if not other.count:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+        self.mean += delta * other.count / total
+        self.count = total
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def summary(self):
+        """Same keys as calculate_data_statistics; percentiles are clamped to the exact min and max"""
+        if not self.count:
+            return dict(DEFAULT_STATS)
+        return {
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "std": float(np.sqrt(self.m2 / self.count)),
+            "p5": min(max(self.sketch.quantile(0.05), self.min), self.max),
+            "p95": min(max(self.sketch.quantile(0.95), self.min), self.max),
+        }
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min if self.count else None, 'max': self.max if self.count else None,
+                'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count, stats.mean, stats.m2 = data['count'], data['mean'], data['m2']
+        if stats.count:
+            stats.min, stats.max = data['min'], data['max']
+        stats.sketch = QuantileSketch.from_dict(data['sketch'])
+        return stats
@@ -0,0 +1,208 @@
+"""
+Searchable index of stored analyses
+
+The metadata JSON stays the record of which analyses exist; this SQLite file
+(analyses_index.sqlite in the upload folder) mirrors it with the NASA Ames
+header fields as indexed attribute columns and an FTS5 table over the text, so
+history filters and the search API never scan the JSON. The index remembers the
+(mtime, size) of the metadata file it last mirrored and re-syncs when they differ.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+
+INDEX_FILENAME = 'analyses_index.sqlite'
+
+# Attribute columns, filterable by exact (case-insensitive) value
+ATTRIBUTE_FIELDS = ('station_code', 'instrument_type', 'component', 'matrix', 'laboratory')
+# Free-text columns of the FTS table
+TEXT_FIELDS = ('original_filename', 'station_code', 'station_name', 'instrument_type',
+               'instrument_name', 'component', 'matrix', 'pi', 'laboratory')
+MAX_LIMIT = 500
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    analysis_id TEXT UNIQUE NOT NULL,
+    original_filename TEXT,
+    creation_date TEXT,
+    status TEXT,
+    {', '.join(f'{field} TEXT COLLATE NOCASE' for field in ATTRIBUTE_FIELDS)},
+    pi TEXT,
+    period_start TEXT,
+    period_end TEXT
+);
+-- Full metadata entries live apart so filters scan narrow rows only
+CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, entry TEXT);
+CREATE INDEX IF NOT EXISTS idx_station_instrument
+    ON analyses(station_code, instrument_type, period_start, period_end);
+CREATE INDEX IF NOT EXISTS idx_instrument ON analyses(instrument_type, period_start, period_end);
+CREATE INDEX IF NOT EXISTS idx_component ON analyses(component, period_start, period_end);
+CREATE INDEX IF NOT EXISTS idx_matrix ON analyses(matrix);
+CREATE INDEX IF NOT EXISTS idx_laboratory ON analyses(laboratory);
+CREATE INDEX IF NOT EXISTS idx_period ON analyses(period_start, period_end);
+CREATE INDEX IF NOT EXISTS idx_created ON analyses(creation_date);
+-- One row per calendar year an analysis covers, ordered for paging, so a bare
+-- 'in 2023' is an index range instead of a scan over every earlier period
+CREATE TABLE IF NOT EXISTS analysis_years (
+    year INTEGER, creation_date TEXT, id INTEGER, PRIMARY KEY (year, creation_date, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_years_id ON analysis_years(id);
+-- rowid matches analyses.id; prefix indexes keep 'dmp*'-style queries off full scans
+CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(
+    {', '.join(TEXT_FIELDS)}, prefix='2 3'
+);
+CREATE TABLE IF NOT EXISTS index_state (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(text):
+    """User text -> FTS5 query: every word must match, as a prefix, in any field"""
+    return ' '.join(f'"{token}"*' for token in _TOKEN.findall(text or ''))
+
+
+def _row(entry):
+    header = entry.get('header') or {}
+    row = {
+        'analysis_id': entry['analysis_id'],
+        'original_filename': entry.get('original_filename'),
+        'creation_date': entry.get('creation_date'),
+        'status': entry.get('status'),
+        'pi': header.get('pi'),
+        'period_start': header.get('period_start'),
+        'period_end': header.get('period_end'),
+    }
+    for field in ATTRIBUTE_FIELDS:
+        row[field] = header.get(field)
+    return row
+
+
+def _years(row):
+    try:
+        first, last = int(row['period_start'][:4]), int(row['period_end'][:4])
+    except (TypeError, ValueError):
+        return range(0)
+    return range(first, last + 1)
+
+
+def _text_row(row_id, entry):
+    header = entry.get('header') or {}
+    row = {field: header.get(field) for field in TEXT_FIELDS}
+    row['original_filename'] = entry.get('original_filename')
+    row['rowid'] = row_id
+    return row
+
+
+# One connection per thread and index file; reusing it keeps SQLite's page cache warm
+_connections = threading.local()
+
+
+class SearchIndex:
+    def __init__(self, storage_path):
+        self.path = os.path.join(storage_path, INDEX_FILENAME)
+
+    def _connect(self):
+        cache = getattr(_connections, 'by_path', None)
+        if cache is None:
+            cache = _connections.by_path = {}
+        connection = cache.get(self.path)
+        # A removed or replaced index file gets a fresh connection and schema
+        if connection is not None and os.path.exists(self.path):
+            return connection
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(_SCHEMA)
+        cache[self.path] = connection
+        return connection
+
+    def stamp(self):
+        row = self._connect().execute("SELECT value FROM index_state WHERE key = 'stamp'").fetchone()
+        return row[0] if row else None
+
+    def sync(self, metadata_list, stamp, changed=()):
+        """Mirror metadata_list: add new entries, drop removed ones, re-index changed ids, then record stamp"""
+        wanted = {entry['analysis_id']: entry for entry in metadata_list}
+        connection = self._connect()
+        with connection:
+            indexed = dict(connection.execute('SELECT analysis_id, id FROM analyses'))
+            changed = indexed.keys() & set(changed)
+            stale = [(indexed[analysis_id],) for analysis_id in (indexed.keys() - wanted.keys()) | changed]
+            for table in ('analyses', 'entries', 'analysis_years'):
+                connection.executemany(f'DELETE FROM {table} WHERE id = ?', stale)
+            connection.executemany('DELETE FROM analyses_fts WHERE rowid = ?', stale)
+
+            added = [entry for analysis_id, entry in wanted.items()
+                     if analysis_id not in indexed or analysis_id in changed]
+            for entry in added:
+                row = _row(entry)
+                row_id = connection.execute(
+                    f"INSERT INTO analyses ({', '.join(row)}) VALUES ({', '.join(':' + f for f in row)})", row).lastrowid
+                connection.execute('INSERT INTO entries VALUES (?, ?)',
+                                   (row_id, json.dumps(entry, ensure_ascii=False)))
+                connection.executemany('INSERT INTO analysis_years VALUES (?, ?, ?)',
+                                       [(year, row['creation_date'], row_id) for year in _years(row)])
+                connection.execute(
+                    f"INSERT INTO analyses_fts (rowid, {', '.join(TEXT_FIELDS)}) "
+                    f"VALUES (:rowid, {', '.join(':' + f for f in TEXT_FIELDS)})", _text_row(row_id, entry))
+
+            # Refresh planner statistics after bulk changes (first sync of an existing storage)
+            if len(stale) + len(added) > 100:
+                connection.execute('ANALYZE')
+            connection.execute("INSERT OR REPLACE INTO index_state VALUES ('stamp', ?)", (stamp,))
+
+    def search(self, text=None, filters=None, year=None, start=None, end=None, limit=100, offset=0):
+        """Matching metadata entries, newest first, and the total number of matches
+
+        filters maps ATTRIBUTE_FIELDS to values; year, or start/end ISO dates,
+        keep analyses whose header period overlaps that range.
+        """
+        clauses, params = [], []
+        for field, value in (filters or {}).items():
+            if field not in ATTRIBUTE_FIELDS:
+                raise ValueError(f"Unknown filter '{field}'")
+            if value:
+                clauses.append(f'{field} = ?')
+                params.append(value)
+        query = fts_query(text)
+        if query:
+            clauses.append('id IN (SELECT rowid FROM analyses_fts WHERE analyses_fts MATCH ?)')
+            params.append(query)
+
+        source = 'analyses'
+        if year is not None and not clauses and not (start or end):
+            source = 'analysis_years'
+            clauses.append('year = ?')
+            params.append(int(year))
+        else:
+            if year is not None:
+                # With other filters the composite (attribute, period) indexes are the narrower path
+                start, end = f'{int(year):04d}-01-01', f'{int(year) + 1:04d}-01-01'
+            if start:
+                clauses.append('period_end >= ?')
+                params.append(start)
+            if end:
+                clauses.append('period_start < ?')
+                params.append(end)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        connection = self._connect()
+        total = connection.execute(f'SELECT COUNT(*) FROM {source} {where}', params).fetchone()[0]
+        rows = connection.execute(
+            f'SELECT entry FROM entries JOIN ('
+            f'SELECT id, creation_date FROM {source} {where} ORDER BY creation_date DESC LIMIT ? OFFSET ?'
+            f') page USING (id) ORDER BY page.creation_date DESC',
+            params + [limit, max(0, int(offset))]).fetchall()
+        return [json.loads(row[0]) for row in rows], total
+
+    def facets(self, field):
+        """Distinct values of an attribute column with their counts, most common first"""
+        if field not in ATTRIBUTE_FIELDS:
+            raise ValueError(f"Unknown filter '{field}'")
+        return self._connect().execute(
+            f'SELECT {field}, COUNT(*) FROM analyses WHERE {field} IS NOT NULL '
+            f'GROUP BY {field} ORDER BY COUNT(*) DESC, {field}').fetchall()
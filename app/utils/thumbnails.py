@@ -0,0 +1,181 @@
+"""
+PNG thumbnails of stored analyses for the history page
+
+Each thumbnail is drawn from the column file with NumPy alone: the time axis is
+reduced to one pixel column per bin (means for heatmaps, min/max envelopes for
+line charts), values become indices into the chart's colour scale, and the
+pixels are written as an indexed-colour PNG with zlib and struct. They are
+rendered when an analysis is stored or compacted and kept next to its other
+files as thumb_<id>_<chart>.png, so retention removes them with the analysis.
+"""
+import os
+import struct
+import zlib
+
+import numpy as np
+
+THUMBNAIL_CHARTS = ('chart_bins', 'chart_number_total', 'chart_rh')
+WIDTH = 240
+HEIGHTS = {'heatmap': 64, 'line': 40}
+# Colour steps of a heatmap; the last palette entry is left for missing values
+LUT_SIZE = 255
+
+# Same stops as COLOUR_SCALES in static/js/analysis.js
+COLOUR_SCALES = {
+    'grafana_style': ['#0d0887', '#2d1e8f', '#4a0da6', '#6a00a8', '#8b0aa5',
+                      '#a9179c', '#c42e88', '#dc4869', '#f0624a', '#fc8023',
+                      '#fd9a44', '#feb078', '#fdc7a4', '#fcfdbf'],
+    'standard': ['#313695', '#4575b4', '#74add1', '#abd9e9', '#e0f3f8',
+                 '#ffffcc', '#fee090', '#fdae61', '#f46d43', '#d73027', '#a50026'],
+}
+# ECharts' default series colours, as on the analysis page
+LINE_COLOURS = ['#5470c6', '#91cc75', '#fac858', '#ee6666', '#73c0de', '#3ba272', '#fc8452', '#9a60b4']
+
+
+def thumbnail_path(storage_path, analysis_id, chart_id):
+    return os.path.join(storage_path, f"thumb_{analysis_id}_{chart_id}.png")
+
+
+def _rgb(hex_colour):
+    return [int(hex_colour[k:k + 2], 16) for k in (1, 3, 5)]
+
+
+def colour_lut(palette, size=LUT_SIZE):
+    """(size, 3) uint8 table interpolated linearly between the palette stops"""
+    stops = np.array([_rgb(colour) for colour in palette], dtype=np.float64)
+    positions = np.linspace(0, len(stops) - 1, size)
+    return np.stack([np.interp(positions, np.arange(len(stops)), stops[:, c]) for c in range(3)],
+                    axis=1).round().astype(np.uint8)
+
+
+def encode_png(indices, palette, alpha=None):
+    """(height, width) uint8 palette indices -> indexed-colour PNG bytes
+
+    One byte per pixel instead of four for RGBA; alpha gives per-entry opacity (tRNS).
+    """
+    height, width = indices.shape
+    # Filter type 0 on every row; the PNG spec recommends no filtering for palette images
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), indices.astype(np.uint8)]).tobytes()
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    chunks = [chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+              chunk(b'PLTE', np.asarray(palette, dtype=np.uint8).tobytes())]
+    if alpha is not None:
+        chunks.append(chunk(b'tRNS', np.asarray(alpha, dtype=np.uint8).tobytes()))
+    chunks += [chunk(b'IDAT', zlib.compress(raw, 9)), chunk(b'IEND', b'')]
+    return b'\x89PNG\r\n\x1a\n' + b''.join(chunks)
+
+
+def _bin_starts(n_rows, width):
+    return np.arange(width) * n_rows // width
+
+
+def bin_means(matrix, width):
+    """(variables, rows) -> (variables, width) means of the finite values per pixel column, NaN where none"""
+    n_rows = matrix.shape[1]
+    if n_rows <= width:
+        return matrix[:, _bin_starts(n_rows, width)]
+    starts = _bin_starts(n_rows, width)
+    finite = np.isfinite(matrix)
+    sums = np.add.reduceat(np.where(finite, matrix, 0.0), starts, axis=1)
+    counts = np.add.reduceat(finite, starts, axis=1)
+    with np.errstate(invalid='ignore'):
+        return sums / counts
+
+
+def bin_envelope(series, width):
+    """Min and max of the finite values of one series per pixel column, NaN where none"""
+    n_rows = len(series)
+    if n_rows <= width:
+        values = series[_bin_starts(n_rows, width)]
+        return values, values
+    starts = _bin_starts(n_rows, width)
+    return np.fmin.reduceat(series, starts), np.fmax.reduceat(series, starts)
+
+
+def _value_range(values, default_min, default_max, percentiles):
+    """The chart's fixed range where configured, otherwise the given percentiles of the finite values"""
+    finite = values[np.isfinite(values)]
+    low, high = np.percentile(finite, percentiles) if len(finite) else (0.0, 1.0)
+    low = default_min if default_min is not None else low
+    high = default_max if default_max is not None else high
+    return (low, high) if high > low else (low, low + 1.0)
+
+
+def render_heatmap(matrix, config, width=WIDTH, height=HEIGHTS['heatmap']):
+    """(indices, palette, alpha) of a (variables, rows) matrix; variable 0 at the bottom, missing values transparent"""
+    means = bin_means(matrix, width)
+    # Same default scale as the page: the configured range, or p5-p95
+    vmin, vmax = _value_range(means, config.get('default_min'), config.get('default_max'), (5, 95))
+    # One pixel row per variable, stretched to the height, flipped so variable 0 is at the bottom
+    cells = means[(np.arange(height) * len(means) // height)[::-1]]
+
+    finite = np.isfinite(cells)
+    index = np.clip(np.round((np.where(finite, cells, vmin) - vmin) / (vmax - vmin) * (LUT_SIZE - 1)),
+                    0, LUT_SIZE - 1).astype(np.uint8)
+    index[~finite] = LUT_SIZE
+    palette = np.vstack([colour_lut(COLOUR_SCALES.get(config.get('colour_scale'), COLOUR_SCALES['standard'])),
+                         [[0, 0, 0]]])
+    alpha = np.full(LUT_SIZE + 1, 255, dtype=np.uint8)
+    alpha[LUT_SIZE] = 0
+    return index, palette, alpha
+
+
+def render_lines(matrix, config, width=WIDTH, height=HEIGHTS['line']):
+    """(indices, palette, alpha) of one line per (variables, rows) row on a transparent background"""
+    envelopes = [bin_envelope(series, width) for series in matrix]
+    lows = np.array([low for low, _ in envelopes])
+    highs = np.array([high for _, high in envelopes])
+    vmin, vmax = _value_range(np.concatenate([lows.ravel(), highs.ravel()]),
+                              config.get('default_min'), config.get('default_max'), (0, 100))
+
+    def pixel_row(values):
+        return np.clip(np.round((vmax - values) / (vmax - vmin) * (height - 1)), 0, height - 1)
+
+    # Entry 0 is the transparent background, then one colour per series
+    index = np.zeros((height, width), dtype=np.uint8)
+    ys = np.arange(height)[:, None]
+    for j, (low, high) in enumerate(zip(lows, highs)):
+        # Reach back to the previous column's range so consecutive points stay connected
+        previous_low = np.concatenate([low[:1], low[:-1]])
+        previous_high = np.concatenate([high[:1], high[:-1]])
+        top = pixel_row(np.fmax(high, previous_low))
+        bottom = pixel_row(np.fmin(low, previous_high))
+        index[(ys >= top) & (ys <= bottom) & np.isfinite(low)] = 1 + j % len(LINE_COLOURS)
+    palette = [[0, 0, 0]] + [_rgb(colour) for colour in LINE_COLOURS]
+    alpha = [0] + [255] * len(LINE_COLOURS)
+    return index, palette, alpha
+
+
+def render_thumbnails(storage_path, analysis_id):
+    """Write the thumbnails of every THUMBNAIL_CHARTS chart the analysis has; returns their paths"""
+    from app.utils.column_store import load_columns
+    from app.utils.config import CHART_CONFIG
+    from app.utils.resample import select_columns
+
+    written = {}
+    with load_columns(storage_path, analysis_id) as table:
+        for chart_id in THUMBNAIL_CHARTS:
+            config = CHART_CONFIG[chart_id]
+            columns = select_columns(table.columns, [chart_id])
+            if not columns:
+                continue
+            matrix = np.vstack([np.asarray(table.column(name), dtype=np.float64) for name in columns])
+            if not matrix.shape[1]:
+                continue
+            render = render_heatmap if config['type'] == 'heatmap' else render_lines
+            path = thumbnail_path(storage_path, analysis_id, chart_id)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(encode_png(*render(matrix, config)))
+            os.replace(tmp_path, path)
+            written[chart_id] = path
+    return written
+
+
+def available_thumbnails(storage_path, analysis_id):
+    """Chart ids whose thumbnail has been rendered, in THUMBNAIL_CHARTS order"""
+    return [chart_id for chart_id in THUMBNAIL_CHARTS
+            if os.path.exists(thumbnail_path(storage_path, analysis_id, chart_id))]
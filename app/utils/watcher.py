@@ -0,0 +1,174 @@
+"""
+Ingestion of files dropped into a watched directory
+
+Data loggers write EBAS files into WATCH_FOLDER. DirectoryWatcher polls it
+(one scandir per interval; inotify would need a third-party binding) and
+debounces writes: a file is ingested only once its size and mtime have held
+still for the settle time. A new file goes through process_upload like a form
+upload; a file that grew since it was ingested has its new lines appended to
+the same analysis (see app/utils/append.py), and one that was rewritten
+rather than grown becomes a new analysis. What was ingested from each path is
+kept in watch_state.json in the upload folder, so restarts resume where they
+stopped.
+
+Like the retention scheduler, the thread starts lazily in every process; a
+file lock lets only one of them watch, and another takes over if it exits.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from werkzeug.utils import secure_filename
+
+STATE_FILENAME = 'watch_state.json'
+
+
+def scan_directory(watch_folder, extensions):
+    """Map path -> (size, mtime_ns) for the files with an accepted extension"""
+    files = {}
+    with os.scandir(watch_folder) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            if '.' not in entry.name or entry.name.rsplit('.', 1)[1].lower() not in extensions:
+                continue
+            stat = entry.stat()
+            files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def read_state(storage_path):
+    try:
+        with open(os.path.join(storage_path, STATE_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_state(storage_path, state):
+    tmp_path = os.path.join(storage_path, f'.{STATE_FILENAME}.{os.getpid()}')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, os.path.join(storage_path, STATE_FILENAME))
+
+
+class DirectoryWatcher:
+    """Polls a directory on a daemon thread and ingests files once they stop changing"""
+
+    def __init__(self, storage_factory, watch_folder, extensions, interval=1.0, settle=2.0, logger=None):
+        self.storage_factory = storage_factory
+        self.watch_folder = watch_folder
+        self.extensions = extensions
+        self.interval = interval
+        self.settle = settle
+        self.logger = logger
+        self._pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # path -> (size, mtime_ns, monotonic time that signature was first seen)
+        self._pending = {}
+
+    def ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._pending = {}
+            self._thread = threading.Thread(target=self._run, name='watcher', daemon=True)
+            self._thread.start()
+
+    def ready(self, files, state, now=None):
+        """Paths whose current signature differs from the ingested one and has held for the settle time"""
+        now = time.monotonic() if now is None else now
+        ready = []
+        for path, signature in files.items():
+            ingested = state.get(path)
+            if ingested and (ingested['size'], ingested['mtime_ns']) == signature:
+                self._pending.pop(path, None)
+                continue
+            seen = self._pending.get(path)
+            if seen is None or seen[:2] != signature:
+                self._pending[path] = (*signature, now)
+            elif now - seen[2] >= self.settle:
+                ready.append(path)
+        for path in set(self._pending) - set(files):
+            del self._pending[path]
+        return ready
+
+    def ingest(self, path, storage, state):
+        """Append to the analysis the path was ingested as, or store it as a new one; returns the result"""
+        from app.utils.append import append_file
+        from app.utils.pipeline import process_upload
+
+        stat = os.stat(path)
+        entry = state.get(path)
+        result = None
+        if entry and entry['analysis_id'] and stat.st_size >= entry['size']:
+            result = append_file(path, entry['analysis_id'], storage.storage_path, log=self.logger)
+            if result['outcome'] in ('not_found', 'conflict'):
+                if self.logger:
+                    self.logger.info(f"Watched file {path} no longer continues {entry['analysis_id']}: "
+                                     f"{result['error']}; ingesting it as a new analysis")
+                result = None
+
+        if result is None:
+            unique_id = str(uuid.uuid4())
+            filename = secure_filename(os.path.basename(path))
+            # process_upload removes the file it is given; the watched file stays for later appends
+            file_path = os.path.join(storage.storage_path, f"{unique_id}_{filename}")
+            shutil.copyfile(path, file_path)
+            result = process_upload(file_path, unique_id, filename, storage.storage_path, log=self.logger)
+            if result['outcome'] == 'completed':
+                entry = {'analysis_id': unique_id}
+
+        if result['outcome'] != 'completed' and result['outcome'] != 'unchanged' and self.logger:
+            self.logger.error(f"Watched file processing error ({path}): {result['error']}")
+        # Recorded even on failure, so a bad file is retried only after it changes again
+        state[path] = {'analysis_id': entry['analysis_id'] if entry else None,
+                       'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        return result
+
+    def poll_once(self, storage, state):
+        """Scan once and ingest every settled file; returns the results"""
+        files = scan_directory(self.watch_folder, self.extensions)
+        results = []
+        for path in self.ready(files, state):
+            try:
+                results.append(self.ingest(path, storage, state))
+            except OSError as e:
+                # Removed or unreadable between the scan and the read; seen again on the next scan
+                if self.logger:
+                    self.logger.error(f'Watched file error ({path}): {str(e)}')
+            self._pending.pop(path, None)
+        removed = set(state) - set(files)
+        for path in removed:
+            del state[path]
+        if results or removed:
+            write_state(storage.storage_path, state)
+        return results
+
+    def _run(self):
+        while True:
+            storage = self.storage_factory()
+            with storage.watcher_lock(blocking=False) as acquired:
+                if acquired:
+                    if self.logger:
+                        self.logger.info(f'Watching {self.watch_folder} for new files (pid {os.getpid()})')
+                    self._watch(storage)
+            # Another process watches; take over if it goes away
+            time.sleep(max(self.interval, 1.0) * 10)
+
+    def _watch(self, storage):
+        state = read_state(storage.storage_path)
+        while True:
+            try:
+                self.poll_once(storage, state)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f'Watcher error: {str(e)}')
+            time.sleep(self.interval)
@@ -0,0 +1,67 @@
+"""
+Cold-start import budget check
+
+Starts a fresh interpreter, builds the app and fails if startup exceeds the
+time budget or pulls in modules that should only load on first use.
+
+Usage:
+    python -m benchmarks.import_time --budget-ms 400
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Loaded lazily by the upload pipeline; must not be imported by create_app()
+LAZY_MODULES = ("pandas", "numpy", "pyecharts")
+BUDGET_MS = 400.0
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def measure_cold_start(repeat=3):
+    """Best-of-N wall time for 'from app import create_app; create_app()' in a new process"""
+    runs = []
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    # Run from a scratch directory: create_app() writes its log file under ./logs
+    with tempfile.TemporaryDirectory(prefix="ebas-bench-") as workdir:
+        for _ in range(repeat):
+            completed = subprocess.run([sys.executable, "-c", _PROBE], capture_output=True, text=True,
+                                       check=True, cwd=workdir, env=env)
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run["seconds"])
+    return {"seconds": best["seconds"], "loaded": sorted({m for run in runs for m in run["loaded"]})}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the app's cold-start import budget")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    result = measure_cold_start(args.repeat)
+    elapsed_ms = result["seconds"] * 1000
+    print(f"create_app cold start: {elapsed_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if result["loaded"]:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(result['loaded'])}")
+        failed = True
+    if elapsed_ms > args.budget_ms:
+        print("FAIL: cold start exceeds budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
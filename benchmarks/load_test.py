@@ -0,0 +1,135 @@
+"""
+Concurrent load test against a running server
+
+Usage:
+    gunicorn -c gunicorn.conf.py run:app &
+    python -m benchmarks.load_test --url http://localhost:5000 --concurrency 16 --duration 30
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+
+from benchmarks.synthetic import generate_ebas_file
+
+
+def _multipart_body(filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def upload(base_url, content, timeout):
+    body, content_type = _multipart_body("load_test.nas", content)
+    req = urllib.request.Request(f"{base_url}/upload", data=body, method="POST",
+                                 headers={"Content-Type": content_type})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        page = response.read()
+    match = re.search(rb"/analysis/([0-9a-f-]{36})", page)
+    if not match:
+        raise RuntimeError("Upload response did not contain an analysis link")
+    return match.group(1).decode()
+
+
+def view(base_url, analysis_id, timeout):
+    with urllib.request.urlopen(f"{base_url}/analysis/{analysis_id}", timeout=timeout) as response:
+        response.read()
+
+
+def run_load(name, func, concurrency, duration):
+    """Call func from concurrency threads for duration seconds; return throughput and latency"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                func()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "wall_s": round(wall, 2),
+        "requests_per_s": round(len(latencies) / wall, 2) if wall else 0.0,
+    }
+    if latencies:
+        result.update({
+            "p50_ms": round(statistics.median(latencies) * 1000, 1),
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+            "max_ms": round(latencies[-1] * 1000, 1),
+        })
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test concurrent uploads and analysis views")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--upload-concurrency", type=int, default=None,
+                        help="threads for the upload scenario (default: --concurrency)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per scenario")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--bins", type=int, default=30)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args(argv)
+    base_url = args.url.rstrip("/")
+
+    with tempfile.TemporaryDirectory(prefix="ebas-load-") as workdir:
+        path = os.path.join(workdir, "load_test.nas")
+        generate_ebas_file(path, args.rows, args.bins)
+        with open(path, "rb") as f:
+            content = f.read()
+
+    analysis_id = upload(base_url, content, args.timeout)
+    results = [
+        run_load("view", lambda: view(base_url, analysis_id, args.timeout),
+                 args.concurrency, args.duration),
+        run_load("upload", lambda: upload(base_url, content, args.timeout),
+                 args.upload_concurrency or args.concurrency, args.duration),
+    ]
+
+    for result in results:
+        print(f"{result['scenario']:8s} x{result['concurrency']:<3d} "
+              f"{result['requests_per_s']:8.2f} req/s   p50 {result.get('p50_ms', 0):8.1f} ms   "
+              f"p95 {result.get('p95_ms', 0):8.1f} ms   errors {result['errors']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"url": base_url, "rows": args.rows, "bins": args.bins, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Stage and end-to-end benchmarks with JSON results and regression checks
+
+Usage:
+    python -m benchmarks.run --rows 5000 --bins 30 --output bench.json
+    python -m benchmarks.run --baseline bench.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.import_time import measure_cold_start
+from benchmarks.synthetic import DEFAULT_FAMILIES, FAMILIES, generate_ebas_file
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_stage(func, repeat):
+    """Run func repeat times; return timing summary and the last result"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start)
+    summary = {
+        "min_s": min(durations),
+        "median_s": statistics.median(durations),
+        "max_s": max(durations),
+        "repeat": repeat,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    return summary, result
+
+
+def run_pipeline_benchmarks(path, repeat):
+    from app.utils.config import CHART_CONFIG
+    from app.utils.ebas_parser import (parse_ebas_file, create_time_labels,
+                                       find_columns_for_chart, calculate_data_statistics)
+    from app.utils.chart_generator import generate_charts_data
+    from app.utils.size_distribution import add_derived_quantities
+
+    results = {}
+    results["parse_ebas_file"], df = time_stage(lambda: parse_ebas_file(path), repeat)
+    if df is None:
+        raise RuntimeError(f"Synthetic file could not be parsed: {path}")
+    results["add_derived_quantities"], df = time_stage(lambda: add_derived_quantities(df), repeat)
+    results["create_time_labels"], _ = time_stage(lambda: create_time_labels(df), repeat)
+
+    column_sets = [find_columns_for_chart(df, config) for config in CHART_CONFIG.values()]
+    results["calculate_data_statistics"], _ = time_stage(
+        lambda: [calculate_data_statistics(df, columns) for columns in column_sets], repeat)
+    results["generate_charts_data"], _ = time_stage(
+        lambda: generate_charts_data(df, "00000000-0000-0000-0000-000000000000"), repeat)
+    return results, len(df), len(df.columns)
+
+
+def run_http_benchmarks(path, repeat):
+    from app import create_app
+
+    with tempfile.TemporaryDirectory(prefix="ebas-bench-") as upload_folder:
+        # Configured up front so no log file or background job touches the checkout
+        app = create_app({"TESTING": True, "UPLOAD_FOLDER": upload_folder})
+        return _http_stages(app.test_client(), path, repeat)
+
+
+def _http_stages(client, path, repeat):
+    with open(path, "rb") as f:
+        content = f.read()
+    analysis_ids = []
+
+    def upload():
+        from io import BytesIO
+        response = client.post("/upload", data={"file": (BytesIO(content), "synthetic.nas")},
+                               content_type="multipart/form-data")
+        match = re.search(rb"/analysis/([0-9a-f-]{36})", response.data)
+        if response.status_code != 200 or not match:
+            raise RuntimeError(f"Upload failed with status {response.status_code}")
+        analysis_ids.append(match.group(1).decode())
+
+    def view():
+        response = client.get(f"/analysis/{analysis_ids[-1]}")
+        if response.status_code != 200:
+            raise RuntimeError(f"View failed with status {response.status_code}")
+
+    results = {}
+    results["http_upload"], _ = time_stage(upload, repeat)
+    results["http_view"], _ = time_stage(view, repeat)
+    return results
+
+
+def compare(current, baseline, threshold):
+    """Return stages whose median got slower than baseline by more than threshold"""
+    regressions = []
+    for stage, result in current["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or not previous.get("median_s"):
+            continue
+        ratio = result["median_s"] / previous["median_s"]
+        if ratio > 1 + threshold:
+            regressions.append({
+                "stage": stage,
+                "baseline_s": previous["median_s"],
+                "current_s": result["median_s"],
+                "ratio": round(ratio, 3),
+            })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the EBAS processing pipeline")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--bins", type=int, default=30)
+    parser.add_argument("--families", nargs="+", default=list(DEFAULT_FAMILIES), choices=list(FAMILIES))
+    parser.add_argument("--missing", type=float, default=0.05, help="fraction of missing values")
+    parser.add_argument("--header-lines", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-http", action="store_true", help="only time the pipeline functions")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown as a fraction of the baseline median (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="ebas-bench-") as workdir:
+        path = os.path.join(workdir, "synthetic.nas")
+        generate_ebas_file(path, args.rows, args.bins, args.families,
+                           args.missing, args.header_lines, args.seed)
+        file_bytes = os.path.getsize(path)
+
+        cold_start = measure_cold_start(args.repeat)
+        stages, rows, columns = run_pipeline_benchmarks(path, args.repeat)
+        stages["cold_start_create_app"] = {
+            "min_s": cold_start["seconds"],
+            "median_s": cold_start["seconds"],
+            "max_s": cold_start["seconds"],
+            "repeat": args.repeat,
+            "eager_modules": cold_start["loaded"],
+        }
+        if not args.skip_http:
+            stages.update(run_http_benchmarks(path, args.repeat))
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "rows": args.rows,
+            "bins": args.bins,
+            "families": args.families,
+            "missing": args.missing,
+            "header_lines": args.header_lines,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "file_bytes": file_bytes,
+        "parsed_rows": rows,
+        "parsed_columns": columns,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": stages,
+    }
+
+    for stage, result in stages.items():
+        rss = f"   peak RSS {result['peak_rss_mb']:8.1f} MB" if "peak_rss_mb" in result else ""
+        print(f"{stage:28s} median {result['median_s'] * 1000:10.2f} ms{rss}")
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != results["params"]:
+            print("Warning: baseline was recorded with different parameters")
+        regressions = compare(results, baseline, args.threshold)
+        results["baseline_commit"] = baseline.get("commit")
+        results["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['stage']}: {regression['baseline_s'] * 1000:.2f} ms -> "
+                  f"{regression['current_s'] * 1000:.2f} ms (x{regression['ratio']})")
+        if regressions:
+            exit_code = 1
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Synthetic NASA Ames / EBAS file generator for benchmarks
+"""
+import argparse
+import numpy as np
+
+# Column families matching the CHART_CONFIG patterns
+FAMILIES = {
+    "bins": lambda n: [f"bin_{i}" for i in range(n)],
+    "flag_bins": lambda n: [f"flag_bin_{i}" for i in range(n)],
+    "bnloer": lambda n: [f"bnloer{i}" for i in range(n)],
+    "flag_bnloer": lambda n: [f"flag_bnloer{i}" for i in range(n)],
+    "bnhier": lambda n: [f"bnhier{i}" for i in range(n)],
+    "flag_bnhier": lambda n: [f"flag_bnhier{i}" for i in range(n)],
+    "met": lambda n: ["RH", "P_sys", "T_sys"],
+    "flag_met": lambda n: ["flag_RH", "flag_P_sys", "flag_T_sys"],
+}
+DEFAULT_FAMILIES = tuple(FAMILIES)
+
+# Typical EBAS flag values: valid, valid with comment, invalid
+FLAG_CODES = np.array([0.0, 0.147, 0.456, 0.999])
+
+
+def family_columns(families, bins):
+    columns = []
+    for family in families:
+        if family not in FAMILIES:
+            raise ValueError(f"Unknown column family: {family}")
+        columns.extend(FAMILIES[family](bins))
+    return columns
+
+
+def _column_values(name, rows, rng):
+    if name.startswith("flag_"):
+        return rng.choice(FLAG_CODES, size=rows, p=[0.9, 0.05, 0.04, 0.01])
+    if name == "RH":
+        return rng.uniform(5, 60, rows)
+    if name == "P_sys":
+        return rng.normal(1013.0, 5.0, rows)
+    if name == "T_sys":
+        return rng.normal(293.0, 2.0, rows)
+    return rng.lognormal(0.5, 0.8, rows)
+
+
+def generate_ebas_file(path, rows=1000, bins=30, families=DEFAULT_FAMILIES,
+                       missing_fraction=0.0, header_lines=60, seed=0, missing_token="NaN"):
+    """Write a synthetic EBAS file and return the column names of its data block"""
+    rng = np.random.default_rng(seed)
+    columns = ["starttime", "endtime"] + family_columns(families, bins)
+
+    # Hourly samples, as fractional days since the start of the year
+    start = np.arange(rows) / 24.0
+    data = [np.char.mod("%.6f", start), np.char.mod("%.6f", start + 1 / 24.0)]
+    for name in columns[2:]:
+        fmt = "%.3f" if name.startswith("flag_") else "%.4f"
+        data.append(np.char.mod(fmt, _column_values(name, rows, rng)))
+
+    text = np.column_stack(data)
+    for j, name in enumerate(columns[2:], start=2):
+        if missing_fraction and not name.startswith("flag_"):
+            text[rng.random(rows) < missing_fraction, j] = missing_token
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{header_lines} 1001\n")
+        f.write("Synthetic, Benchmark\nNILU - Norwegian Institute for Air Research\n")
+        f.write("Station code:       NO0042G\nInstrument type:    dmps\n")
+        f.write("Component:          particle_number_size_distribution\n")
+        f.write("Matrix:             pm10\nStartdate:          20240101000000\n")
+        # Bin midpoint diameters, log-spaced like a DMPS, as EBAS variable descriptions
+        diameters = np.geomspace(10.0, 800.0, bins) if "bins" in families else []
+        for i, diameter in enumerate(diameters):
+            f.write(f"bin_{i}: particle_number_size_distribution, 1/cm3, D={diameter:.1f} nm\n")
+        for i in range(max(0, header_lines - 9 - len(diameters))):
+            f.write(f"Comment line {i}: synthetic header padding\n")
+        f.write(" ".join(columns) + "\n")
+        for row in text:
+            f.write(" ".join(row) + "\n")
+
+    return columns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic EBAS file")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--bins", type=int, default=30)
+    parser.add_argument("--families", nargs="+", default=list(DEFAULT_FAMILIES), choices=list(FAMILIES))
+    parser.add_argument("--missing", type=float, default=0.0, help="fraction of missing values")
+    parser.add_argument("--header-lines", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    columns = generate_ebas_file(args.path, args.rows, args.bins, args.families,
+                                 args.missing, args.header_lines, args.seed)
+    print(f"Wrote {args.rows} rows x {len(columns)} columns to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Gunicorn configuration for production serving
+
+Every setting can be overridden through the environment, e.g.
+    GUNICORN_WORKERS=4 GUNICORN_THREADS=8 gunicorn -c gunicorn.conf.py run:app
+"""
+import multiprocessing
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    return default if value is None else value.lower() in ('1', 'true', 'yes')
+
+
+cores = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+
+# Parsing and chart building are CPU-bound and hold the GIL, so processes scale
+# uploads; threads let each process serve analysis views while one upload runs.
+workers = _env_int('GUNICORN_WORKERS', cores + 1)
+# The app sizes its per-process upload pools from the worker count (see app/__init__.py)
+os.environ['GUNICORN_WORKERS'] = str(workers)
+worker_class = 'gthread'
+threads = _env_int('GUNICORN_THREADS', 4)
+
+# Import pandas/numpy once in the master and share the pages with forked workers
+preload_app = _env_bool('GUNICORN_PRELOAD', True)
+
+# Recycle workers to return memory fragmented by large DataFrames
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 500)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 50)
+
+# Uploads may legitimately take minutes; views should never hold a worker that long.
+# Gunicorn's timeout is per worker, so it is sized for uploads, and the per-route
+# limits are enforced by the proxy (see nginx.conf.template).
+upload_timeout = _env_int('GUNICORN_UPLOAD_TIMEOUT', 120)
+view_timeout = _env_int('GUNICORN_VIEW_TIMEOUT', 30)
+timeout = max(upload_timeout, view_timeout)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Heartbeat files on tmpfs avoid stalls when /tmp is a slow overlay (Docker)
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # The app imports pandas/numpy on first upload; with preload, warm them in the
+    # master so every forked worker shares the pages instead of importing its own copy
+    if server.cfg.preload_app:
+        import app.utils.chart_generator  # noqa: F401
+        import app.utils.ebas_parser  # noqa: F401
+
+
+def post_worker_init(worker):
+    # The drop-directory watcher must not wait for a first request to reach this worker
+    watcher = worker.wsgi.extensions.get('watcher') if hasattr(worker.wsgi, 'extensions') else None
+    if watcher is not None:
+        watcher.ensure_started()
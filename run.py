@@ -4,5 +4,7 @@ import os
 app = create_app()
 
 if __name__ == '__main__':
+    # Development server only; production runs gunicorn -c gunicorn.conf.py run:app
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    debug = os.environ.get('FLASK_ENV') != 'production'
+    app.run(host='0.0.0.0', port=port, debug=debug)
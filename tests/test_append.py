@@ -0,0 +1,143 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.models import AnalysisStorage
+from app.utils import append
+from app.utils.append import append_file, delta_path, load_analysis_data, load_state, load_updates
+from app.utils.column_store import DATETIME_COLUMN, load_columns, segment_path, segment_paths
+from app.utils.ebas_parser import parse_ebas_file
+from app.utils.pipeline import process_upload
+from benchmarks.synthetic import generate_ebas_file
+
+ANALYSIS_ID = '0a1b2c3d-0000-4000-8000-0000000000aa'
+ROWS = 300
+
+
+class GrowingFile:
+    """A synthetic EBAS file written out a number of data lines at a time"""
+
+    def __init__(self, folder):
+        source = os.path.join(folder, 'source.nas')
+        generate_ebas_file(source, rows=ROWS, bins=4, seed=1)
+        with open(source, 'rb') as f:
+            self.lines = f.read().splitlines(keepends=True)
+        self.header = len(self.lines) - ROWS
+        self.path = os.path.join(folder, 'growing.nas')
+        self.upload_folder = os.path.join(folder, 'uploads')
+        os.makedirs(self.upload_folder)
+        self.rows = 0
+
+    def write(self, rows):
+        self.rows = rows
+        with open(self.path, 'wb') as f:
+            f.write(b''.join(self.lines[:self.header + rows]))
+
+    def upload(self, rows):
+        # process_upload removes the file it is given, like the upload route's saved copy
+        self.write(rows)
+        copy = self.path + '.upload'
+        with open(self.path, 'rb') as src, open(copy, 'wb') as dst:
+            dst.write(src.read())
+        return process_upload(copy, ANALYSIS_ID, 'growing.nas', self.upload_folder)
+
+    def grow(self, rows):
+        self.write(self.rows + rows)
+        return append_file(self.path, ANALYSIS_ID, self.upload_folder)
+
+
+@pytest.fixture
+def growing(tmp_path):
+    return GrowingFile(str(tmp_path))
+
+
+def assert_columns_match_file(growing):
+    expected = parse_ebas_file(growing.path)
+    with load_columns(growing.upload_folder, ANALYSIS_ID) as table:
+        assert len(table) == growing.rows
+        np.testing.assert_array_equal(np.asarray(table.times()),
+                                      expected[DATETIME_COLUMN].to_numpy(dtype='datetime64[ns]').view(np.int64))
+        np.testing.assert_array_equal(np.asarray(table.column('bin_2')), expected['bin_2'].to_numpy(dtype=float))
+        # Chunked reads slice across the base and segment files
+        np.testing.assert_array_equal(table.column('bin_2')[95:130], expected['bin_2'].to_numpy(dtype=float)[95:130])
+    data = load_analysis_data(growing.upload_folder, ANALYSIS_ID)
+    assert len(data['time_labels']) == growing.rows
+    assert data['metadata']['rows'] == growing.rows
+
+
+def test_appended_rows_are_read_after_the_base(growing):
+    assert growing.upload(100)['outcome'] == 'completed'
+
+    for rows in (10, 10, 10):
+        result = growing.grow(rows)
+        assert result['outcome'] == 'completed' and result['appended_rows'] == rows
+        assert not result['compacted']
+        assert_columns_match_file(growing)
+
+    state = load_state(growing.upload_folder, ANALYSIS_ID)
+    assert (state['rows'], state['base_rows'], state['generation']) == (130, 100, 0)
+    # 10 + 10 merged into one segment, the third kept apart
+    assert state['segment_rows'] == [20, 10] and state['segments'] == 2
+    assert len(segment_paths(growing.upload_folder, ANALYSIS_ID, 0)) == 2
+    assert [part['rows'] for part in load_updates(growing.upload_folder, ANALYSIS_ID, 115)] == [5, 10]
+
+
+def test_compaction_folds_segments_into_the_next_generation(growing):
+    growing.upload(100)
+    growing.grow(30)
+    before = load_state(growing.upload_folder, ANALYSIS_ID)
+    assert (before['generation'], before['segments'], before['base_rows']) == (0, 1, 100)
+
+    # The segments now hold as many rows as the base
+    result = growing.grow(70)
+
+    assert result['outcome'] == 'completed' and result['compacted'] and result['rows'] == 200
+    after = load_state(growing.upload_folder, ANALYSIS_ID)
+    assert (after['generation'], after['segments'], after['segment_rows'], after['base_rows']) == (1, 0, [], 200)
+    assert segment_paths(growing.upload_folder, ANALYSIS_ID, 0) == []
+    assert not os.path.exists(delta_path(growing.upload_folder, ANALYSIS_ID, 0, 1))
+    with load_columns(growing.upload_folder, ANALYSIS_ID) as table:
+        assert table.generation == 1
+    assert_columns_match_file(growing)
+
+    growing.grow(5)
+    assert_columns_match_file(growing)
+    assert AnalysisStorage(growing.upload_folder).get_analysis(ANALYSIS_ID).data_points == 205
+
+
+def test_readers_skip_segments_left_over_from_a_merge(growing):
+    growing.upload(100)
+    growing.grow(10)
+    growing.grow(10)
+    folder = growing.upload_folder
+    # As if the merge stopped before deleting segment 2: its rows are also in segment 1
+    with open(segment_path(folder, ANALYSIS_ID, 0, 1), 'rb') as f:
+        merged = f.read()
+    with open(segment_path(folder, ANALYSIS_ID, 0, 2), 'wb') as f:
+        f.write(merged)
+    with open(delta_path(folder, ANALYSIS_ID, 0, 1), 'rb') as f:
+        merged = f.read()
+    with open(delta_path(folder, ANALYSIS_ID, 0, 2), 'wb') as f:
+        f.write(merged)
+
+    assert_columns_match_file(growing)
+    # The next append replaces the leftover
+    growing.grow(5)
+    assert_columns_match_file(growing)
+
+
+def test_upload_completes_when_its_append_state_cannot_be_saved(growing, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(append, 'init_state', fail)
+
+    result = growing.upload(100)
+
+    assert result['outcome'] == 'completed' and result['metadata']['data_points'] == 100
+    assert AnalysisStorage(growing.upload_folder).get_analysis(ANALYSIS_ID) is not None
+    assert load_state(growing.upload_folder, ANALYSIS_ID) is None
+    # Without a state the analysis cannot grow, but it is intact
+    assert growing.grow(10)['outcome'] == 'conflict'
+    with load_columns(growing.upload_folder, ANALYSIS_ID) as table:
+        assert len(table) == 100
@@ -0,0 +1,178 @@
+import csv
+import io
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from app import create_app
+from app.utils import export
+from app.utils.column_store import NAT, ColumnTable, load_columns
+from app.utils.pipeline import process_upload
+from app.utils.quality import ValidityMask
+from benchmarks.synthetic import generate_ebas_file
+
+HOUR = 3600 * 10 ** 9
+START = int(np.datetime64('2024-01-01T00:00', 'ns').astype(np.int64))
+ANALYSIS_ID = '0a1b2c3d-0000-4000-8000-0000000000ee'
+
+
+def make_table():
+    """Eight hourly rows, the fourth without a time; bin_1 is flagged invalid on rows 1 and 5"""
+    times = START + np.arange(8, dtype=np.int64) * HOUR
+    times[3] = NAT
+    arrays = {
+        'datetime': times,
+        'bin_1': np.arange(8, dtype=np.float64) + 0.5,
+        'N (cm-3)': np.array([1.0, np.nan, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]),
+    }
+    valid = np.ones((1, 8), dtype=bool)
+    valid[0, [1, 5]] = False
+    validity = ValidityMask(['bin_1'], np.packbits(valid, axis=1), 8)
+    return ColumnTable(list(arrays), arrays.__getitem__, validity=validity)
+
+
+def read_netcdf(data):
+    """Minimal classic-format reader: (record count, global attributes, {variable: attributes}, records)"""
+    position = 0
+
+    def take(fmt):
+        nonlocal position
+        values = struct.unpack_from(fmt, data, position)
+        position += struct.calcsize(fmt)
+        return values
+
+    def text():
+        nonlocal position
+        (length,) = take('>i')
+        value = data[position:position + length].decode('utf-8')
+        position += length + (-length % 4)
+        return value
+
+    def attributes():
+        nonlocal position
+        _, count = take('>ii')
+        values = {}
+        for _ in range(count):
+            name = text()
+            nc_type, length = take('>ii')
+            if nc_type == export.NC_CHAR:
+                values[name] = data[position:position + length].decode('utf-8')
+                position += length + (-length % 4)
+            else:
+                values[name] = take(f'>{length}d')[0]
+        return values
+
+    assert data[:4] == b'CDF\x02'
+    position = 4
+    (n_records,) = take('>i')
+    _, n_dimensions = take('>ii')
+    for _ in range(n_dimensions):
+        text()
+        take('>i')
+    global_attributes = attributes()
+    _, n_variables = take('>ii')
+    variables, offsets = {}, {}
+    for _ in range(n_variables):
+        name = text()
+        (n_dims,) = take('>i')
+        take(f'>{n_dims}i')
+        variables[name] = attributes()
+        _, _, offsets[name] = take('>iiq')
+    # Record variables are interleaved, 8 bytes each, in order of their offsets
+    order = sorted(variables, key=offsets.get)
+    assert offsets[order[0]] == position
+    matrix = np.frombuffer(data, dtype='>f8', offset=position).reshape(n_records, len(order))
+    records = {name: matrix[:, j] for j, name in enumerate(order)}
+    return n_records, global_attributes, variables, records
+
+
+def test_netcdf_round_trip():
+    table = make_table()
+    columns = ['bin_1', 'N (cm-3)']
+
+    data = b''.join(export.iter_netcdf(table, columns, global_attributes={'title': 'test'}, chunk_rows=3))
+
+    assert len(data) == export.netcdf_size(columns, 8, {'title': 'test'})
+    n_records, global_attributes, variables, records = read_netcdf(data)
+    assert n_records == 8 and global_attributes == {'title': 'test'}
+    assert list(variables) == ['time', 'bin_1', 'N__cm_3_']
+    # A renamed variable keeps its column name
+    assert variables['N__cm_3_']['long_name'] == 'N (cm-3)' and 'long_name' not in variables['bin_1']
+    assert variables['time']['units'] == 'seconds since 1970-01-01 00:00:00'
+    expected_time = table.times() / 1e9
+    expected_time[3] = np.nan
+    np.testing.assert_array_equal(records['time'], expected_time)
+    np.testing.assert_array_equal(records['bin_1'], table.column('bin_1'))
+    np.testing.assert_array_equal(records['N__cm_3_'], table.column('N (cm-3)'))
+
+
+def test_netcdf_window_and_valid_only():
+    table = make_table()
+    start, end = START + HOUR, START + 6 * HOUR
+    n_records = export.count_rows(table, start, end)
+
+    data = b''.join(export.iter_netcdf(table, ['bin_1'], start, end, valid_only=True, n_records=n_records))
+
+    # Rows 1, 2, 4 and 5: the row without a time is outside any window
+    assert n_records == 4 and len(data) == export.netcdf_size(['bin_1'], 4)
+    _, _, _, records = read_netcdf(data)
+    np.testing.assert_array_equal(records['time'], (START + np.array([1, 2, 4, 5]) * HOUR) / 1e9)
+    np.testing.assert_array_equal(records['bin_1'], [np.nan, 2.5, 4.5, np.nan])
+
+
+def test_csv_window_and_valid_only():
+    table = make_table()
+    start, end = START + HOUR, START + 6 * HOUR
+
+    text = ''.join(export.iter_csv(table, ['bin_1', 'N (cm-3)'], start, end, valid_only=True, chunk_rows=3))
+
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == ['datetime', 'bin_1', 'N (cm-3)']
+    assert rows[1:] == [
+        ['2024-01-01T01:00:00', '', ''],
+        ['2024-01-01T02:00:00', '2.5', '3.0'],
+        ['2024-01-01T04:00:00', '4.5', '5.0'],
+        ['2024-01-01T05:00:00', '', '6.0'],
+    ]
+    # Without a window the row lacking a time is kept, with an empty time field
+    text = ''.join(export.iter_csv(table, ['bin_1'], chunk_rows=3))
+    assert list(csv.reader(io.StringIO(text)))[4] == ['', '3.5']
+
+
+@pytest.fixture
+def client(tmp_path):
+    upload_folder = str(tmp_path / 'uploads')
+    os.makedirs(upload_folder)
+    source = str(tmp_path / 'source.nas')
+    generate_ebas_file(source, rows=500, bins=4, seed=2)
+    assert process_upload(source, ANALYSIS_ID, 'source.nas', upload_folder)['outcome'] == 'completed'
+    app = create_app({'TESTING': True, 'UPLOAD_FOLDER': upload_folder})
+    return app.test_client()
+
+
+def test_netcdf_content_length_is_the_streamed_size(client):
+    response = client.get(f'/api/analysis/{ANALYSIS_ID}/export?format=netcdf')
+
+    assert response.status_code == 200
+    body = response.get_data()
+    assert int(response.headers['Content-Length']) == len(body)
+    n_records, global_attributes, _, records = read_netcdf(body)
+    assert n_records == 500 and global_attributes['analysis_id'] == ANALYSIS_ID
+    with load_columns(client.application.config['UPLOAD_FOLDER'], ANALYSIS_ID) as table:
+        np.testing.assert_array_equal(records['bin_2'], table.column('bin_2'))
+
+
+def test_windowed_netcdf_content_length_is_the_streamed_size(client):
+    response = client.get(f'/api/analysis/{ANALYSIS_ID}/export?format=netcdf'
+                          '&start=2024-01-02&end=2024-01-05T06:00&valid=1&family=chart_bins')
+
+    assert response.status_code == 200
+    body = response.get_data()
+    assert int(response.headers['Content-Length']) == len(body)
+    n_records, _, variables, records = read_netcdf(body)
+    # Hourly rows from day 2 up to 06:00 on day 5
+    assert n_records == 3 * 24 + 6
+    assert list(variables) == ['time', 'bin_0', 'bin_1', 'bin_2', 'bin_3']
+    assert records['time'][0] == export.parse_time('2024-01-02') / 1e9
@@ -0,0 +1,9 @@
+from benchmarks.import_time import BUDGET_MS, LAZY_MODULES, measure_cold_start
+
+
+def test_create_app_cold_start_stays_within_budget():
+    # Fresh interpreters, best of three, as `python -m benchmarks.import_time` measures it
+    result = measure_cold_start(repeat=3)
+
+    assert result['loaded'] == [], f"create_app() imported {result['loaded']}; keep {LAZY_MODULES} lazy"
+    assert result['seconds'] * 1000 <= BUDGET_MS
@@ -0,0 +1,36 @@
+import pytest
+
+from app import create_app
+from app.utils.profiling import PROFILE_HEADER, make_profile_token
+
+SECRET = 'test-secret'
+
+
+@pytest.fixture
+def client(tmp_path):
+    profile_folder = tmp_path / 'profiles'
+    profile_folder.mkdir()
+    (profile_folder / '20240101T000000000000_upload_none.pstats').write_bytes(b'stats')
+    app = create_app({'TESTING': True, 'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+                      'PROFILING_ENABLED': True, 'PROFILING_SECRET': SECRET,
+                      'PROFILE_FOLDER': str(profile_folder)})
+    return app.test_client()
+
+
+@pytest.mark.parametrize('path', ['/admin/profiles', '/admin/profiles/20240101T000000000000_upload_none.pstats'])
+@pytest.mark.parametrize('token', [None, 'nonsense', make_profile_token('other-secret')])
+def test_admin_routes_need_a_signed_token_even_when_enabled(client, path, token):
+    headers = {PROFILE_HEADER: token} if token else {}
+
+    assert client.get(path, headers=headers).status_code == 404
+
+
+def test_listing_leaves_out_the_profile_folder(client):
+    response = client.get('/admin/profiles', headers={PROFILE_HEADER: make_profile_token(SECRET)})
+
+    assert response.status_code == 200
+    assert list(response.get_json()) == ['profiles']
+    assert response.get_json()['profiles'][0]['files'] == ['20240101T000000000000_upload_none.pstats']
+    download = client.get('/admin/profiles/20240101T000000000000_upload_none.pstats',
+                          headers={PROFILE_HEADER: make_profile_token(SECRET)})
+    assert download.status_code == 200 and download.data == b'stats'
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+from app.utils import resample
+from app.utils.column_store import ColumnTable
+from app.utils.resample import FREQ_UNITS, resample_table
+
+HOUR = FREQ_UNITS['h']
+
+
+def make_table(arrays):
+    return ColumnTable(list(arrays), arrays.__getitem__)
+
+
+def test_flag_fraction_counts_flagged_rows():
+    # Two hourly buckets of four rows; bin_1 is flagged on 1 and 3 of them
+    arrays = {
+        'datetime': np.arange(8, dtype=np.int64) * (HOUR // 4),
+        'bin_1': np.full(8, 120.0),
+        'flag_bin_1': np.array([0, 0.456, 0, 0, 0.147, 0.999, 0, 0.147456]),
+        'bin_2': np.full(8, 80.0),
+        'flag_bin_2': np.zeros(8),
+        'Dp_accumulation': np.full(8, 150.0),
+        'RH': np.full(8, 40.0),
+    }
+    columns = ['bin_1', 'bin_2', 'Dp_accumulation', 'RH']
+
+    _, rows, result = resample_table(make_table(arrays), HOUR, ['flag_fraction'], columns)
+
+    fraction = result['flag_fraction']
+    assert rows.tolist() == [4, 4]
+    np.testing.assert_allclose(fraction[:, 0], [0.25, 0.75])
+    np.testing.assert_allclose(fraction[:, 1], [0.0, 0.0])
+    # Integrated over every bin, so flagged wherever any bin is
+    np.testing.assert_allclose(fraction[:, 2], [0.25, 0.75])
+    # No flag column decides RH
+    assert np.isnan(fraction[:, 3]).all()
+
+
+def test_saving_a_result_prunes_older_versions_and_excess(tmp_path, monkeypatch):
+    analysis_id = '0a1b2c3d-0000-4000-8000-000000000001'
+    other_id = '0a1b2c3d-0000-4000-8000-000000000002'
+    version = ['1']
+    monkeypatch.setattr(resample, 'columns_version', lambda *args: version[0])
+    monkeypatch.setattr(resample, 'MAX_CACHED', 2)
+
+    def save(storage_path, analysis_id, freq):
+        path = resample.cache_path(storage_path, analysis_id, freq, ['mean'], ['bin_1'])
+        resample.save_result(path, np.zeros(1, dtype=np.int64), np.ones(1, dtype=np.int64),
+                             {'mean': np.zeros((1, 1))}, ['bin_1'])
+        return os.path.basename(path)
+
+    old = save(str(tmp_path), analysis_id, HOUR)
+    other = save(str(tmp_path), other_id, HOUR)
+    version[0] = '2'
+    kept = [save(str(tmp_path), analysis_id, freq * HOUR) for freq in (1, 2, 3)]
+
+    remaining = set(os.listdir(tmp_path))
+    assert old not in remaining
+    # Another analysis' results are left alone; this one keeps MAX_CACHED, including the newest
+    assert other in remaining and kept[2] in remaining
+    assert len(remaining) == 3
@@ -0,0 +1,107 @@
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from app import create_app
+from app.models import AnalysisMetadata, AnalysisStorage, MetadataUnreadable
+from app.utils.retention import RetentionPolicy, analysis_artifacts, enforce_retention
+
+STORED_ID = '0a1b2c3d-0000-4000-8000-000000000001'
+OTHER_ID = '0a1b2c3d-0000-4000-8000-000000000002'
+ORPHAN_ID = '0a1b2c3d-0000-4000-8000-000000000003'
+
+
+def touch(folder, name, age=0.0):
+    path = os.path.join(folder, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{}')
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return path
+
+
+def store(storage, analysis_id):
+    storage.save_analysis(AnalysisMetadata(analysis_id, f'{analysis_id}.nas', datetime.now().isoformat(),
+                                           10, 3, '10 time points'))
+
+
+@pytest.fixture
+def upload_folder(tmp_path):
+    folder = str(tmp_path / 'uploads')
+    storage = AnalysisStorage(folder)
+    for analysis_id in (STORED_ID, OTHER_ID):
+        store(storage, analysis_id)
+        touch(folder, f'data_{analysis_id}.json')
+        touch(folder, f'columns_{analysis_id}.npz')
+        touch(folder, f'thumb_{analysis_id}_chart_bins.png')
+    # An upload of another analysis whose own filename carries STORED_ID
+    touch(folder, f'{OTHER_ID}_copy_of_{STORED_ID}.nas')
+    return folder
+
+
+@pytest.fixture
+def client(upload_folder):
+    return create_app({'TESTING': True, 'UPLOAD_FOLDER': upload_folder}).test_client()
+
+
+@pytest.mark.parametrize('analysis_id', ['data', '-', 'json', STORED_ID[:8], STORED_ID + '0', ORPHAN_ID])
+def test_delete_ignores_anything_but_a_stored_id(client, upload_folder, analysis_id):
+    before = sorted(os.listdir(upload_folder))
+
+    client.post(f'/delete/{analysis_id}')
+
+    assert sorted(os.listdir(upload_folder)) == before
+    assert len(AnalysisStorage(upload_folder).get_all_analyses()) == 2
+
+
+def test_delete_removes_exactly_the_analysis_files(client, upload_folder):
+    client.post(f'/delete/{STORED_ID}')
+
+    remaining = set(os.listdir(upload_folder))
+    assert not {f'data_{STORED_ID}.json', f'columns_{STORED_ID}.npz', f'thumb_{STORED_ID}_chart_bins.png'} & remaining
+    assert {f'data_{OTHER_ID}.json', f'{OTHER_ID}_copy_of_{STORED_ID}.nas'} <= remaining
+    assert [a.analysis_id for a in AnalysisStorage(upload_folder).get_all_analyses()] == [OTHER_ID]
+
+
+def test_artifacts_match_the_id_token_not_a_substring(upload_folder):
+    names = {os.path.basename(path) for path in analysis_artifacts(upload_folder, STORED_ID)}
+
+    assert names == {f'data_{STORED_ID}.json', f'columns_{STORED_ID}.npz', f'thumb_{STORED_ID}_chart_bins.png'}
+    assert analysis_artifacts(upload_folder, 'data') == []
+    assert analysis_artifacts(upload_folder, '') == []
+
+
+def test_unreadable_metadata_stops_retention(upload_folder):
+    storage = AnalysisStorage(upload_folder)
+    with open(storage.metadata_file, 'w', encoding='utf-8') as f:
+        f.write('[{"analysis_id": "0a1b')
+    for name in os.listdir(upload_folder):
+        os.utime(os.path.join(upload_folder, name), (0, 0))
+    before = sorted(os.listdir(upload_folder))
+
+    with pytest.raises(MetadataUnreadable):
+        enforce_retention(storage, RetentionPolicy(max_age_days=0), orphan_grace=0)
+    # Writers refuse too, rather than replacing the entries they could not read
+    store(storage, ORPHAN_ID)
+
+    assert sorted(os.listdir(upload_folder)) == before
+    with open(storage.metadata_file, 'r', encoding='utf-8') as f:
+        assert f.read() == '[{"analysis_id": "0a1b'
+
+
+def test_orphans_are_kept_for_the_grace_period(upload_folder):
+    fresh = touch(upload_folder, f'data_{ORPHAN_ID}.json')
+    storage = AnalysisStorage(upload_folder)
+
+    report = enforce_retention(storage, RetentionPolicy(), orphan_grace=600)
+    assert report['removed_orphans'] == 0 and os.path.exists(fresh)
+
+    os.utime(fresh, (time.time() - 601, time.time() - 601))
+    report = enforce_retention(storage, RetentionPolicy(), orphan_grace=600)
+
+    assert report['removed_orphans'] == 1 and not os.path.exists(fresh)
+    assert report['removed_analyses'] == 0
+    assert os.path.exists(os.path.join(upload_folder, f'data_{STORED_ID}.json'))